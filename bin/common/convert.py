@@ -24,8 +24,11 @@ import signal
 import shutil
 from specific_import import import_file
 import subprocess
+import sqlite3
 import os
 import cchardet as chardet
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 pw_file = import_file('file.py')
 pw_metadata = import_file('metadata.py')
 
@@ -516,6 +519,88 @@ def file_convert(source_file_path, mime_type, function, target_dir, tmp_dir, nor
     return normalized
 
 
+def _file_convert_job(job):
+    # Converters use fixed tmp file names (e.g. 'x2x.docbuilder'), so each worker process gets its own tmp dir
+    tmp_dir = os.path.join(job['tmp_dir'], 'worker_' + str(os.getpid()))
+    pathlib.Path(tmp_dir).mkdir(parents=True, exist_ok=True)
+    return file_convert(**dict(job, tmp_dir=tmp_dir))
+
+
+def run_convert_jobs(jobs, workers=1):
+    """
+    Run file_convert for each (key, job) in jobs, where job is a dict of file_convert arguments or None.
+    Yields (key, normalized) in the same order as the input, with normalized None where job is None.
+    With workers > 1 the jobs run in a process pool, with a bounded number of jobs queued ahead.
+    """
+    if workers <= 1:
+        for key, job in jobs:
+            yield key, file_convert(**job) if job else None
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for key, job in jobs:
+            pending.append((key, executor.submit(_file_convert_job, job) if job else None))
+            while len(pending) > workers * 2:
+                key, future = pending.popleft()
+                yield key, future.result() if future else None
+
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result() if future else None
+
+
+class ConvertJournal:
+    """
+    SQLite journal of conversion results, keyed by source file path and a checksum of the source file.
+    Each result is committed as it completes, so an interrupted convert_folder run can resume where it stopped.
+    The checksum is based on file size and modification time, so a lookup never has to read the file itself.
+    """
+
+    finished_results = ('Converted successfully', 'Manually converted', 'Not a document')
+
+    def __init__(self, journal_path, base_target_dir):
+        self.base_target_dir = base_target_dir
+        self.conn = sqlite3.connect(journal_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS journal (source_file_path TEXT PRIMARY KEY, checksum TEXT, '
+                          'result TEXT, norm_file_path TEXT, original_file_copy TEXT)')
+        self.conn.commit()
+        self.entries = {r[0]: r[1:] for r in self.conn.execute('SELECT * FROM journal')}
+
+    @staticmethod
+    def checksum(file_path):
+        try:
+            stat = os.lstat(file_path)
+        except OSError:
+            return None
+        return str(stat.st_size) + '-' + str(stat.st_mtime_ns)
+
+    def get(self, source_file_path):
+        # Returns (result, norm_file_path, original_file_copy) if the file was converted earlier and is unchanged
+        entry = self.entries.get(source_file_path)
+        if entry is None:
+            return None
+
+        checksum, result, norm_file_path, original_file_copy = entry
+        if result not in self.finished_results or checksum != self.checksum(source_file_path):
+            return None
+        if norm_file_path and not os.path.isfile(os.path.join(self.base_target_dir, norm_file_path)):
+            return None
+
+        return result, norm_file_path, original_file_copy
+
+    def add(self, source_file_path, result, norm_file_path, original_file_copy):
+        entry = (self.checksum(source_file_path), result, norm_file_path, original_file_copy)
+        self.conn.execute('INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?)', (source_file_path,) + entry)
+        self.conn.commit()
+        self.entries[source_file_path] = entry
+
+    def close(self):
+        self.conn.close()
+
+
 def remove_fields(fields, table):
     for field in fields:
         if field in etl.fieldnames(table):
@@ -530,7 +615,7 @@ def add_fields(fields, table):
     return table
 
 
-def convert_folder(base_source_dir, base_target_dir, tmp_dir, tika=False, ocr=False, merge=False, tsv_source_path=None, tsv_target_path=None, make_unique=True, sample=False, zip=False, keep_file_name=False):
+def convert_folder(base_source_dir, base_target_dir, tmp_dir, tika=False, ocr=False, merge=False, tsv_source_path=None, tsv_target_path=None, make_unique=True, sample=False, zip=False, keep_file_name=False, workers=1):
     # WAIT: Legg inn i gui at kan velge om skal ocr-behandles
     txt_target_path = base_target_dir + '_result.txt'
     json_tmp_dir = base_target_dir + '_tmp'
@@ -628,38 +713,92 @@ def convert_folder(base_source_dir, base_target_dir, tmp_dir, tika=False, ocr=Fa
     if os.path.isfile(txt_target_path):
         os.remove(txt_target_path)
 
-    data = etl.dicts(table)
-    count = 0
-    for row in data:
-        count += 1
-        count_str = ('(' + str(count) + '/' + str(file_count) + '): ')
-        source_file_path = row['source_file_path']
-        if '/' not in source_file_path:
-            source_file_path = os.path.join(base_source_dir, source_file_path)
-
-        mime_type = row['mime_type']
-        # TODO: Virker ikke når Tika brukt -> finn hvorfor
-        if ';' in mime_type:
-            mime_type = mime_type.split(';')[0]
-
-        version = row['version']
-        result = None
-        old_result = row['result']
+    if sample:
+        table = etl.head(table, 10)
 
-        if not mime_type:
-            if os.path.islink(source_file_path):
-                mime_type = 'n/a'
+    data = etl.dicts(table)
 
-            # kind = filetype.guess(source_file_path)
-            extension = os.path.splitext(source_file_path)[1][1:].lower()
-            if extension == 'xml':
-                mime_type = 'application/xml'
+    # Results of earlier, possibly interrupted, runs (not used for nested conversion of zip files):
+    journal = None
+    if not zip:
+        journal = ConvertJournal(base_target_dir + '_journal.db', base_target_dir)
+
+    def convert_jobs():
+        nonlocal originals
+        count = 0
+        for row in data:
+            count += 1
+            count_str = ('(' + str(count) + '/' + str(file_count) + '): ')
+            source_file_path = row['source_file_path']
+            if '/' not in source_file_path:
+                source_file_path = os.path.join(base_source_dir, source_file_path)
+
+            mime_type = row['mime_type']
+            # TODO: Virker ikke når Tika brukt -> finn hvorfor
+            if ';' in mime_type:
+                mime_type = mime_type.split(';')[0]
+
+            version = row['version']
+
+            if not mime_type:
+                if os.path.islink(source_file_path):
+                    mime_type = 'n/a'
+
+                # kind = filetype.guess(source_file_path)
+                extension = os.path.splitext(source_file_path)[1][1:].lower()
+                if extension == 'xml':
+                    mime_type = 'application/xml'
+
+            if not zip:
+                print_path = os.path.relpath(source_file_path, Path(base_source_dir).parents[1])
+                print(count_str + '.../' + print_path + ' (' + mime_type + ')')
+
+            journaled = None
+            if journal:
+                journaled = journal.get(source_file_path)
+
+            # Also for files converted in an earlier run, so a resumed run reports the originals kept then:
+            if mime_type in mime_to_norm.keys() and mime_to_norm[mime_type][0]:
+                originals = True
 
-        if not zip:
-            print_path = os.path.relpath(source_file_path, Path(base_source_dir).parents[1])
-            print(count_str + '.../' + print_path + ' (' + mime_type + ')')
+            job = None
+            if mime_type in mime_to_norm.keys() and not journaled:
+                keep_original = mime_to_norm[mime_type][0]
+
+                if zip:
+                    keep_original = False
+
+                function = mime_to_norm[mime_type][1]
+
+                # Ensure unique file names in dir hierarchy:
+                norm_ext = mime_to_norm[mime_type][2]
+                if not norm_ext:
+                    norm_ext = 'none'
+
+                if make_unique:
+                    norm_ext = (base64.b32encode(bytes(str(count), encoding='ascii'))).decode('utf8').replace('=', '').lower() + '.' + norm_ext
+                target_dir = os.path.dirname(source_file_path.replace(base_source_dir, base_target_dir))
+                job = {'source_file_path': source_file_path,
+                       'mime_type': mime_type,
+                       'function': function,
+                       'target_dir': target_dir,
+                       'tmp_dir': tmp_dir,
+                       'norm_ext': norm_ext,
+                       'version': version,
+                       'ocr': ocr,
+                       'keep_original': keep_original,
+                       'zip': zip,
+                       }
+
+            yield (row, source_file_path, mime_type, journaled), job
+
+    for (row, source_file_path, mime_type, journaled), normalized in run_convert_jobs(convert_jobs(), workers):
+        result = None
+        old_result = row['result']
 
-        if mime_type not in mime_to_norm.keys():
+        if journaled:
+            result, row['norm_file_path'], row['original_file_copy'] = journaled
+        elif normalized is None:
             # print("|" + mime_type + "|")
 
             errors = True
@@ -669,26 +808,6 @@ def convert_folder(base_source_dir, base_target_dir, tmp_dir, tika=False, ocr=Fa
             row['norm_file_path'] = ''
             row['original_file_copy'] = ''
         else:
-            keep_original = mime_to_norm[mime_type][0]
-
-            if keep_original:
-                originals = True
-
-            if zip:
-                keep_original = False
-
-            function = mime_to_norm[mime_type][1]
-
-            # Ensure unique file names in dir hierarchy:
-            norm_ext = mime_to_norm[mime_type][2]
-            if not norm_ext:
-                norm_ext = 'none'
-
-            if make_unique:
-                norm_ext = (base64.b32encode(bytes(str(count), encoding='ascii'))).decode('utf8').replace('=', '').lower() + '.' + norm_ext
-            target_dir = os.path.dirname(source_file_path.replace(base_source_dir, base_target_dir))
-            normalized = file_convert(source_file_path, mime_type, function, target_dir, tmp_dir, None, norm_ext, version, ocr, keep_original, zip=zip)
-
             if normalized['result'] == 0:
                 errors = True
                 result = 'Conversion failed'
@@ -725,12 +844,15 @@ def convert_folder(base_source_dir, base_target_dir, tmp_dir, tika=False, ocr=Fa
         row['result'] = result
         row_values = list(row.values())
 
+        if journal and not journaled:
+            journal.add(source_file_path, result, row['norm_file_path'], row['original_file_copy'])
+
         # TODO: Fikset med å legge inn escapechar='\\' i append_tsv_row -> vil det skal problemer senere?
         # row_values = [r.replace('\n', ' ') for r in row_values if r is not None]
         pw_file.append_tsv_row(tsv_target_path, row_values)
 
-        if sample and count > 9:
-            break
+    if journal:
+        journal.close()
 
     if not sample:
         shutil.move(tsv_target_path, tsv_source_path)
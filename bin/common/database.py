@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from database.pool import close_unpooled
+
 
 def run_select(jdbc, sql):
     conn = jdbc.connection
@@ -20,5 +22,6 @@ def run_select(jdbc, sql):
     cursor.execute(sql)
     result = cursor.fetchall()
     cursor.close()
-    conn.close()
+    # A pooled connection is left open, so it can be reused for the next query (see database.pool)
+    close_unpooled(jdbc)
     return result
@@ -31,6 +31,7 @@ from petl.util.base import Table
 from petl.compat import text_type
 from functools import reduce
 from common.xml import merge_xml_element
+from common.schema_model import scan_table_summaries, iter_top_level, MetadataWriter
 
 csv.field_size_limit(sys.maxsize)
 
@@ -148,17 +149,14 @@ def indent(elem, level=0):
             elem.tail = i
 
 
-def get_empty_tables(table_defs, schema):
+def get_empty_tables(tables, schema):
     empty_tables = []
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        if table_schema.text.lower() != schema:
+    for table in tables:
+        if table.schema.lower() != schema:
             continue
 
-        table_name = table_def.find("table-name")
-        disposed = table_def.find("disposed")
-        if disposed.text == "true":
-            empty_tables.append(table_name.text.lower())
+        if table.disposed == "true":
+            empty_tables.append(table.name.lower())
 
     return empty_tables
 
@@ -179,21 +177,18 @@ def sort_dependent_tables_old(table_defs, base_path, empty_tables, illegal_table
     return deps_list
 
 
-def sort_dependent_tables(table_defs, base_path, illegal_tables, schema, empty_tables):
+def sort_dependent_tables(tables, base_path, illegal_tables, schema, empty_tables):
     deps_dict = {}
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        if table_schema.text.lower() != schema:
+    for table in tables:
+        if table.schema.lower() != schema:
             continue
 
-        table_name = table_def.find("table-name")
-        # print(table_name.text)
+        # print(table.name)
 
-        disposed = table_def.find("disposed")
-        if disposed.text != "true":
+        if table.disposed != "true":
             deps_dict.update({
-                table_name.text.lower():
-                get_table_deps(table_name, table_def, deps_dict, empty_tables, illegal_tables, schema)
+                table.name.lower():
+                get_table_deps(table, deps_dict, empty_tables, illegal_tables, schema)
             })
 
     deps_list = toposort_flatten(deps_dict)
@@ -242,34 +237,30 @@ def get_table_deps_old(table_name, table_def, deps_dict, empty_tables, illegal_t
     return table_deps
 
 
-def get_table_deps(table_name, table_def, deps_dict, empty_tables, illegal_tables, schema):
+def get_table_deps(table, deps_dict, empty_tables, illegal_tables, schema):
+    # Disabled constraints are marked on the foreign key summaries, and written to the table-def later
     table_deps = set()
-    foreign_keys = table_def.findall("foreign-keys/foreign-key")
-    for foreign_key in foreign_keys:
-        constraint_name = foreign_key.find("constraint-name")
-
+    for foreign_key in table.foreign_keys:
         # WAIT: Legg inn støtte senere for constraints på tvers av skjemaer?
-        table_schema = foreign_key.find("references/table-schema")
-        if table_schema.text.lower() != schema:
+        if str(foreign_key.table_schema).lower() != schema:
             continue
 
-        print(constraint_name.text)
-        ref_table = foreign_key.find("references/table-name")
-        # ref_table_value = ref_table.text.lower()
-        ref_table_value = normalize_name(ref_table.text, illegal_tables).lower()
+        print(foreign_key.constraint_name)
+        # ref_table_value = foreign_key.table_name.lower()
+        ref_table_value = normalize_name(foreign_key.table_name, illegal_tables).lower()
         if ref_table_value not in table_deps and ref_table_value not in empty_tables:
             if ref_table_value in deps_dict.keys():
-                if table_name.text.lower() in deps_dict[ref_table_value]:
-                    if not constraint_name.text.startswith('_disabled_'):
-                        constraint_name.text = "_disabled_" + constraint_name.text
+                if table.name.lower() in deps_dict[ref_table_value]:
+                    if not foreign_key.constraint_name.startswith('_disabled_'):
+                        foreign_key.constraint_name = "_disabled_" + foreign_key.constraint_name
                     continue
-            # ref_table_value = normalize_name(ref_table.text, illegal_tables).lower()
+            # ref_table_value = normalize_name(foreign_key.table_name, illegal_tables).lower()
             table_deps.add(ref_table_value)
 
     # TODO: Må ha sjekk på skjema for denne og?
     if len(table_deps) == 0:
-        table_deps.add(table_name.text.lower())
-    # print(table_name.text.lower() + ': ' + str(table_deps))
+        table_deps.add(table.name.lower())
+    # print(table.name.lower() + ': ' + str(table_deps))
     return table_deps
 
 
@@ -311,6 +302,288 @@ def tsv_fix(base_path, new_file_name, pk_list, illegal_columns, tsv_process, tmp
     # return row_count
 
 
+def normalize_table_def(table_def, base_path, illegal_tables, illegal_columns, tsv_process, tmp_dir, pk_dict,
+                        unique_dict, t_count, c_count):
+    """
+    Normalize the names of a table and its columns, and collect its primary key and unique constraints.
+    @return: int - the counter of shortened column names
+    """
+    table_schema = table_def.find('table-schema')
+    if table_schema.text is None:
+        table_schema.text = 'PUBLIC'
+
+    schema = table_schema.text.lower()
+    table_name = table_def.find("table-name")
+    old_table_name = ET.Element("original-table-name")
+    old_table_name.text = table_name.text
+
+    # Add tables names too long for oracle to 'illegal_tables'
+    # TODO: Bruk normalize funksjon heller her og inkorporer kode under i den heller
+    # if len(table_name.text) > 29:
+    #     t_count += 1
+    #     table_name.text = table_name.text[:26] + "_" + str(t_count) + "_"
+    #     illegal_tables[old_table_name.text] = table_name.text
+
+    table_name_norm = normalize_name(table_name.text, illegal_tables, t_count)
+    file_name = os.path.join(base_path, 'content', schema, 'data', table_name.text + '.txt')
+    new_file_name = os.path.join(base_path, 'content', schema, 'data', table_name_norm.lower() + '.tsv')
+
+    if os.path.isfile(file_name):
+        os.rename(file_name, new_file_name)
+
+    # if table_name.text in illegal_tables:
+    #     table_name.text = illegal_tables[table_name.text]
+
+    #     # TODO: Bare slette fil direkte her heller?
+    #     ill_new_file_name = os.path.splitext(file_name)[0] + '_.tsv'
+    #     if os.path.isfile(new_file_name):
+    #         os.rename(new_file_name, ill_new_file_name)
+    #     new_file_name = ill_new_file_name
+
+    # table_name.text = table_name_norm.lower()
+    # table_name.text = table_name.text.lower()
+
+    merge_xml_element(table_def, 'original-table-name', old_table_name.text, 3)
+
+    table_def.set('name', table_name_norm)
+
+    # unique_list = []
+    index_defs = table_def.findall("index-def")
+    for index_def in index_defs:
+        unique = index_def.find('unique')
+        primary_key = index_def.find('primary-key')
+        index_name = index_def.find('name')
+
+        unique_col_list = []
+        if unique.text == 'true' and primary_key.text == 'false':
+            index_column_names = index_def.findall("column-list/column")
+            for index_column_name in index_column_names:
+                unique_constraint_name = index_column_name.attrib['name'].lower()
+                unique_col_list.append(unique_constraint_name)
+            unique_dict[(table_name_norm, index_name.text.lower())] = sorted(unique_col_list)
+
+    pk_list = []
+    column_defs = table_def.findall("column-def")
+    for column_def in column_defs:
+        column_name = column_def.find('column-name')
+        primary_key = column_def.find('primary-key')
+        column_name.text = normalize_name(column_name.text, illegal_columns)
+        # column_name_short = None
+
+        if len(column_name.text) > 29:
+            c_count += 1
+            column_name.text = column_name.text[:26] + "_" + str(c_count)
+            # illegal_columns[column_name.text] = column_name_short
+            # column_name.text = column_name_short
+
+        # column_name_norm = normalize_name(column_name.text, illegal_columns)
+        if primary_key.text == 'true':
+            pk_list.append(column_name.text)
+
+            # if column_name.text in illegal_columns:
+            #     column_name.text = column_name.text.lower() + '_'
+
+            # # tab_constraint_name.text = tab_constraint_name.text + '_'
+            # if column_name_short:
+            #     column_name_norm = column_name_short
+            # else:
+            #     column_name_norm = normalize_name(column_name.text, illegal_columns)
+
+            # # TODO: Feil at ikke er navn med underscore sist når illegal name her?
+
+    pk_dict[table_name_norm] = ', '.join(sorted(pk_list))
+
+    if os.path.exists(new_file_name):
+        tsv_fix(base_path, new_file_name, pk_list, illegal_columns, tsv_process, tmp_dir)
+
+    return c_count
+
+
+def normalize_table_def_for_schema(table_def, base_path, schema, schema_info, illegal_tables, illegal_columns,
+                                   ref_column_sizes):
+    """
+    Normalize the constraints of a table in one of the schemas to process, write its Oracle SQL Loader control
+    file and collect its DDL
+    """
+    oracle_dir = os.path.join(base_path, 'documentation', 'oracle_import')
+    empty_tables = schema_info['empty_tables']
+    deps_list = schema_info['deps_list']
+    constraint_dict = schema_info['constraint_dict']
+    fk_columns_dict = schema_info['fk_columns_dict']
+    fk_ref_dict = schema_info['fk_ref_dict']
+    ddl_columns = schema_info['ddl_columns']
+
+    table_schema = table_def.find('table-schema')
+    table_name = table_def.find("table-name")
+    disposed = table_def.find("disposed")
+    self_dep_set = set()
+    index = 0
+
+    table_name_norm = normalize_name(table_name.text, illegal_tables)
+
+    if table_schema.text.lower() != schema:
+        return
+
+    ora_ctl_file = os.path.join(oracle_dir, schema, table_name_norm + '.ctl')
+    ora_ctl_list = []
+    if disposed.text == "true":
+        return
+
+    ora_ctl = [
+        'LOAD DATA', 'CHARACTERSET UTF8 LENGTH SEMANTICS CHAR',
+        'INFILE ' + table_name_norm + '.tsv',
+        'INSERT INTO TABLE ' + str(table_name_norm).upper(),
+        "FIELDS TERMINATED BY '\\t' TRAILING NULLCOLS", '(#'
+    ]
+    ora_ctl_list.append('\n'.join(ora_ctl))
+
+    if table_name_norm in deps_list:
+        index = int(deps_list.index(table_name_norm))
+
+    merge_xml_element(table_def, 'dep-position', str(index + 1), 6)
+
+    constraint_set = set()
+    foreign_keys = table_def.findall("foreign-keys/foreign-key")
+    for foreign_key in foreign_keys:
+        tab_constraint_name = foreign_key.find("constraint-name")
+        old_tab_constraint_name_text = tab_constraint_name.text
+
+        if str(tab_constraint_name.text).startswith('SYS_C'):
+            tab_constraint_name.text = tab_constraint_name.text + '_'
+
+        tab_constraint_name.text = tab_constraint_name.text.lower()
+        merge_xml_element(foreign_key, 'original-constraint-name', old_tab_constraint_name_text, 1)
+
+        fk_references = foreign_key.findall('references')
+        for fk_reference in fk_references:
+            tab_ref_table_name = fk_reference.find("table-name")
+            old_tab_ref_table_name = ET.Element("original-table-name")
+            old_tab_ref_table_name.text = tab_ref_table_name.text
+
+            if tab_ref_table_name.text.lower() in empty_tables:
+                if not tab_constraint_name.text.startswith('_disabled_'):
+                    tab_constraint_name.text = "_disabled_" + tab_constraint_name.text
+
+            tab_ref_table_name.text = normalize_name(tab_ref_table_name.text, illegal_tables).lower()
+            merge_xml_element(fk_reference, 'original-table-name', old_tab_ref_table_name.text, 3)
+
+            if not tab_constraint_name.text.startswith('_disabled_'):
+                constraint_set.add(tab_constraint_name.text + ':' + tab_ref_table_name.text)
+
+        # WAIT: Slå sammen de to under til en def
+
+        source_column_set = set()
+        source_columns = foreign_key.findall('source-columns')
+        for source_column in source_columns:
+            source_column_names = source_column.findall('column')
+
+            for source_column_name in source_column_names:
+                value = source_column_name.text
+                source_column_name.text = normalize_name(source_column_name.text, illegal_columns).lower()
+
+                merge_xml_element(source_column, 'original-column', value, 10)
+                source_column_set.add(source_column_name.text)
+
+        if not len(source_column_set) == 0:
+            fk_columns_dict.update({tab_constraint_name.text: source_column_set})  # TODO: Endre andre til å være på denne formen heller enn split på : mm?
+
+        referenced_columns = foreign_key.findall('referenced-columns')
+        for referenced_column in referenced_columns:
+            referenced_column_names = referenced_column.findall('column')
+
+            for referenced_column_name in referenced_column_names:
+                old_referenced_column_name_text = referenced_column_name.text
+                referenced_column_name.text = normalize_name(referenced_column_name.text, illegal_columns).lower()
+                merge_xml_element(referenced_column, 'original-column', old_referenced_column_name_text, 10)
+
+    constraint_dict[table_name_norm] = ','.join(constraint_set).lower()
+
+    column_defs = table_def.findall("column-def")
+    column_defs[:] = sorted(column_defs, key=lambda elem: int(elem.findtext('dbms-position')))
+    # WAIT: Sortering virker men blir ikke lagret til xml-fil. Fiks senere når lage siard/datapackage-versjoner
+
+    ddl_columns_list = []
+    for column_def in column_defs:
+        column_name = column_def.find('column-name')
+        java_sql_type = column_def.find('java-sql-type')
+        dbms_data_size = column_def.find('dbms-data-size')
+        value = column_name.text
+        column_name.text = normalize_name(column_name.text, illegal_columns).lower()
+        merge_xml_element(column_def, 'original-column-name', value, 2)
+        column_def.set('name', column_name.text)
+
+        col_references = column_def.findall('references')
+        ref_col_ok = False
+        for col_reference in col_references:
+            ref_col_ok = True
+            ref_column_name = col_reference.find('column-name')
+            col_ref_table_name = col_reference.find('table-name')
+            col_constraint_name = col_reference.find('constraint-name')
+            old_col_constraint_name_text = col_constraint_name.text
+            old_ref_column_name_text = ref_column_name.text
+            old_ref_table_name_text = col_ref_table_name.text
+
+            ref_column_name.text = normalize_name(ref_column_name.text, illegal_columns)
+            merge_xml_element(column_def, 'original-column-name', old_ref_column_name_text, 3)
+
+            col_ref_table_name.text = normalize_name(col_ref_table_name.text, illegal_tables)
+            merge_xml_element(col_reference, 'original-table-name', old_ref_table_name_text, 3)
+
+            old_col_constraint_fix = False
+            if str(col_constraint_name.text).startswith('SYS_C'):
+                col_constraint_name.text = col_constraint_name.text + '_'
+                old_col_constraint_fix = True
+
+            if col_ref_table_name.text.lower() in empty_tables:
+                if not col_constraint_name.text.startswith('_disabled_'):
+                    col_constraint_name.text = "_disabled_" + col_constraint_name.text
+                old_col_constraint_fix = True
+
+            if old_col_constraint_fix:
+                merge_xml_element(col_reference, 'original-constraint-name', old_col_constraint_name_text, 2)
+
+            if col_ref_table_name.text.lower(
+            ) == table_name.text and col_ref_table_name.text.lower(
+            ) not in empty_tables:
+                self_dep_set.add(ref_column_name.text.lower() + ':' + column_name.text.lower())
+
+            ref_column_data_size = ref_column_sizes.get((col_ref_table_name.text, old_ref_column_name_text))
+            if ref_column_data_size is not None:
+                if ref_column_data_size != dbms_data_size.text:
+                    dbms_data_size.text = ref_column_data_size
+
+        if ref_col_ok:
+            fk_ref_dict[table_name_norm + ':' + column_name.text] = ref_column_name.text
+
+        if disposed.text != "true":
+            ora_ctl_type = jdbc_to_ora_ctl_data_type[java_sql_type.text]
+            if '()' in ora_ctl_type:
+                ora_ctl_type = ora_ctl_type.replace('()', '(' + dbms_data_size.text + ')')
+
+            ora_ctl_list.append(
+                column_name.text + ' ' + ora_ctl_type)
+
+            iso_data_type = jdbc_to_iso_data_type[java_sql_type.text]
+            if '()' in iso_data_type:
+                if int(dbms_data_size.text) < 4001:
+                    iso_data_type = iso_data_type.replace('()', '(' + dbms_data_size.text + ')')
+                else:
+                    iso_data_type = 'text'
+
+            ddl_columns_list.append(column_name.text + ' ' + iso_data_type + ',')
+
+    # Write Oracle SQL Loader control file:
+    if disposed.text != "true":
+        with open(ora_ctl_file, "w") as file:
+            file.write((',\n'.join(ora_ctl_list)).replace(
+                '#,', '') + ' TERMINATED BY WHITESPACE \n)')
+
+    if len(self_dep_set) != 0:
+        order_by_constraint(base_path, table_name.text, table_schema.text, self_dep_set)
+
+    ddl_columns[table_name_norm] = '\n'.join(ddl_columns_list)
+
+
 def normalize_metadata(base_path, illegal_terms_file, schemas, tmp_dir):
     illegal_terms_set = set(map(str.strip, open(illegal_terms_file)))
     d = {s: s + '_' for s in illegal_terms_set if s}
@@ -321,124 +594,31 @@ def normalize_metadata(base_path, illegal_terms_file, schemas, tmp_dir):
     header_xml_file = os.path.join(base_path, 'header', 'metadata.xml')
 
     if os.path.isfile(header_xml_file):
-        tree = ET.parse(header_xml_file)
-        tree_lookup = ET.parse(header_xml_file)
-
-        t_count = 0
-        c_count = 0
-        pk_dict = {}
-        constraint_dict = {}
-        fk_columns_dict = {}
-        fk_ref_dict = {}
-        unique_dict = {}
-        table_defs = tree.findall("table-def")
-        for table_def in table_defs:
-            table_schema = table_def.find('table-schema')
-            if table_schema.text is None:
-                table_schema.text = 'PUBLIC'
-
-            schema = table_schema.text.lower()
-            table_name = table_def.find("table-name")
-            old_table_name = ET.Element("original-table-name")
-            old_table_name.text = table_name.text
-
-            # Add tables names too long for oracle to 'illegal_tables'
-            # TODO: Bruk normalize funksjon heller her og inkorporer kode under i den heller
-            # if len(table_name.text) > 29:
-            #     t_count += 1
-            #     table_name.text = table_name.text[:26] + "_" + str(t_count) + "_"
-            #     illegal_tables[old_table_name.text] = table_name.text
-
-            table_name_norm = normalize_name(table_name.text, illegal_tables, t_count)
-            file_name = os.path.join(base_path, 'content', schema, 'data', table_name.text + '.txt')
-            new_file_name = os.path.join(base_path, 'content', schema, 'data', table_name_norm.lower() + '.tsv')
-
-            tsv_process = False
-            if not os.path.isfile(tsv_done_file):
-                tsv_process = True
-
-            if os.path.isfile(file_name):
-                os.rename(file_name, new_file_name)
-
-            # if table_name.text in illegal_tables:
-            #     table_name.text = illegal_tables[table_name.text]
-
-            #     # TODO: Bare slette fil direkte her heller?
-            #     ill_new_file_name = os.path.splitext(file_name)[0] + '_.tsv'
-            #     if os.path.isfile(new_file_name):
-            #         os.rename(new_file_name, ill_new_file_name)
-            #     new_file_name = ill_new_file_name
-
-            # table_name.text = table_name_norm.lower()
-            # table_name.text = table_name.text.lower()
-
-            merge_xml_element(table_def, 'original-table-name', old_table_name.text, 3)
-
-            table_def.set('name', table_name_norm)
-
-            # unique_list = []
-            index_defs = table_def.findall("index-def")
-            for index_def in index_defs:
-                unique = index_def.find('unique')
-                primary_key = index_def.find('primary-key')
-                index_name = index_def.find('name')
-
-                unique_col_list = []
-                if unique.text == 'true' and primary_key.text == 'false':
-                    index_column_names = index_def.findall("column-list/column")
-                    for index_column_name in index_column_names:
-                        unique_constraint_name = index_column_name.attrib['name'].lower()
-                        unique_col_list.append(unique_constraint_name)
-                    unique_dict[(table_name_norm, index_name.text.lower())] = sorted(unique_col_list)
-
-            pk_list = []
-            column_defs = table_def.findall("column-def")
-            for column_def in column_defs:
-                column_name = column_def.find('column-name')
-                primary_key = column_def.find('primary-key')
-                column_name.text = normalize_name(column_name.text, illegal_columns)
-                # column_name_short = None
-
-                if len(column_name.text) > 29:
-                    c_count += 1
-                    column_name.text = column_name.text[:26] + "_" + str(c_count)
-                    # illegal_columns[column_name.text] = column_name_short
-                    # column_name.text = column_name_short
-
-                # column_name_norm = normalize_name(column_name.text, illegal_columns)
-                if primary_key.text == 'true':
-                    pk_list.append(column_name.text)
-
-                    # if column_name.text in illegal_columns:
-                    #     column_name.text = column_name.text.lower() + '_'
-
-                    # # tab_constraint_name.text = tab_constraint_name.text + '_'
-                    # if column_name_short:
-                    #     column_name_norm = column_name_short
-                    # else:
-                    #     column_name_norm = normalize_name(column_name.text, illegal_columns)
-
-                    # # TODO: Feil at ikke er navn med underscore sist når illegal name her?
-
-            pk_dict[table_name_norm] = ', '.join(sorted(pk_list))
-
-            if os.path.exists(new_file_name):
-                tsv_fix(base_path, new_file_name, pk_list, illegal_columns, tsv_process, tmp_dir)
+        # metadata.xml is streamed twice, so that only one table-def is in memory at a time:
+        # first for what is needed across tables, then to normalize and write each table-def
+        tables = scan_table_summaries(header_xml_file)
+        ref_column_sizes = {}
+        for table in tables:
+            if not table.schema:
+                table.schema = 'PUBLIC'
+            for column_name, data_size in table.column_sizes.items():
+                if data_size is not None:
+                    ref_column_sizes.setdefault((table.name, column_name), data_size)
+            table.column_sizes = None
 
         # Sort tables in dependent order:
+        schema_infos = {}
         for schema in schemas:
-            ddl_file = os.path.join(base_path, 'documentation', schema + '_ddl.sql')
-
             oracle_dir = os.path.join(base_path, 'documentation', 'oracle_import')
             pathlib.Path(os.path.join(oracle_dir, schema)).mkdir(parents=True, exist_ok=True)
 
-            empty_tables = get_empty_tables(table_defs, schema)
+            empty_tables = get_empty_tables(tables, schema)
 
             # for tabl in illegal_tables:
             #     print(tabl)
             # return
 
-            deps_list = sort_dependent_tables(table_defs, base_path, illegal_tables, schema, empty_tables)
+            deps_list = sort_dependent_tables(tables, base_path, illegal_tables, schema, empty_tables)
 
             import_order_file = os.path.join(base_path, 'documentation', schema + '_tables.txt')
             with open(import_order_file, 'w') as file:
@@ -446,185 +626,54 @@ def normalize_metadata(base_path, illegal_terms_file, schemas, tmp_dir):
                     val = normalize_name(val, illegal_tables)
                     file.write('%s\n' % val)
 
-            ddl_columns = {}
-            for table_def in table_defs:
-                table_schema = table_def.find('table-schema')
-                table_name = table_def.find("table-name")
-                disposed = table_def.find("disposed")
-                self_dep_set = set()
-                index = 0
+            schema_infos[schema] = {
+                'empty_tables': empty_tables,
+                'deps_list': deps_list,
+                'constraint_dict': {},
+                'fk_columns_dict': {},
+                'fk_ref_dict': {},
+                'ddl_columns': {},
+            }
 
-                table_name_norm = normalize_name(table_name.text, illegal_tables)
+        tsv_process = False
+        if not os.path.isfile(tsv_done_file):
+            tsv_process = True
 
-                if table_schema.text.lower() != schema:
-                    continue
+        t_count = 0
+        c_count = 0
+        pk_dict = {}
+        unique_dict = {}
+        table_index = 0
+        with MetadataWriter(header_xml_file) as writer:
+            for root, table_def in iter_top_level(header_xml_file):
+                if writer.root_tag is None:
+                    writer.start(root)
 
-                ora_ctl_file = os.path.join(oracle_dir, schema, table_name_norm + '.ctl')
-                ora_ctl_list = []
-                if disposed.text == "true":
-                    continue
+                if table_def.tag == 'table-def':
+                    table = tables[table_index]
+                    table_index += 1
 
-                ora_ctl = [
-                    'LOAD DATA', 'CHARACTERSET UTF8 LENGTH SEMANTICS CHAR',
-                    'INFILE ' + table_name_norm + '.tsv',
-                    'INSERT INTO TABLE ' + str(table_name_norm).upper(),
-                    "FIELDS TERMINATED BY '\\t' TRAILING NULLCOLS", '(#'
-                ]
-                ora_ctl_list.append('\n'.join(ora_ctl))
-
-                if table_name_norm in deps_list:
-                    index = int(deps_list.index(table_name_norm))
-
-                merge_xml_element(table_def, 'dep-position', str(index + 1), 6)
-
-                constraint_set = set()
-                foreign_keys = table_def.findall("foreign-keys/foreign-key")
-                for foreign_key in foreign_keys:
-                    tab_constraint_name = foreign_key.find("constraint-name")
-                    old_tab_constraint_name_text = tab_constraint_name.text
-
-                    if str(tab_constraint_name.text).startswith('SYS_C'):
-                        tab_constraint_name.text = tab_constraint_name.text + '_'
-
-                    tab_constraint_name.text = tab_constraint_name.text.lower()
-                    merge_xml_element(foreign_key, 'original-constraint-name', old_tab_constraint_name_text, 1)
-
-                    fk_references = foreign_key.findall('references')
-                    for fk_reference in fk_references:
-                        tab_ref_table_name = fk_reference.find("table-name")
-                        old_tab_ref_table_name = ET.Element("original-table-name")
-                        old_tab_ref_table_name.text = tab_ref_table_name.text
-
-                        if tab_ref_table_name.text.lower() in empty_tables:
-                            if not tab_constraint_name.text.startswith('_disabled_'):
-                                tab_constraint_name.text = "_disabled_" + tab_constraint_name.text
-
-                        tab_ref_table_name.text = normalize_name(tab_ref_table_name.text, illegal_tables).lower()
-                        merge_xml_element(fk_reference, 'original-table-name', old_tab_ref_table_name.text, 3)
-
-                        if not tab_constraint_name.text.startswith('_disabled_'):
-                            constraint_set.add(tab_constraint_name.text + ':' + tab_ref_table_name.text)
-
-                    # WAIT: Slå sammen de to under til en def
-
-                    source_column_set = set()
-                    source_columns = foreign_key.findall('source-columns')
-                    for source_column in source_columns:
-                        source_column_names = source_column.findall('column')
-
-                        for source_column_name in source_column_names:
-                            value = source_column_name.text
-                            source_column_name.text = normalize_name(source_column_name.text, illegal_columns).lower()
-
-                            merge_xml_element(source_column, 'original-column', value, 10)
-                            source_column_set.add(source_column_name.text)
-
-                    if not len(source_column_set) == 0:
-                        fk_columns_dict.update({tab_constraint_name.text: source_column_set})  # TODO: Endre andre til å være på denne formen heller enn split på : mm?
-
-                    referenced_columns = foreign_key.findall('referenced-columns')
-                    for referenced_column in referenced_columns:
-                        referenced_column_names = referenced_column.findall('column')
-
-                        for referenced_column_name in referenced_column_names:
-                            old_referenced_column_name_text = referenced_column_name.text
-                            referenced_column_name.text = normalize_name(referenced_column_name.text, illegal_columns).lower()
-                            merge_xml_element(referenced_column, 'original-column', old_referenced_column_name_text, 10)
-
-                constraint_dict[table_name_norm] = ','.join(constraint_set).lower()
-
-                column_defs = table_def.findall("column-def")
-                column_defs[:] = sorted(column_defs, key=lambda elem: int(elem.findtext('dbms-position')))
-                # WAIT: Sortering virker men blir ikke lagret til xml-fil. Fiks senere når lage siard/datapackage-versjoner
-
-                ddl_columns_list = []
-                for column_def in column_defs:
-                    column_name = column_def.find('column-name')
-                    java_sql_type = column_def.find('java-sql-type')
-                    dbms_data_size = column_def.find('dbms-data-size')
-                    value = column_name.text
-                    column_name.text = normalize_name(column_name.text, illegal_columns).lower()
-                    merge_xml_element(column_def, 'original-column-name', value, 2)
-                    column_def.set('name', column_name.text)
-
-                    col_references = column_def.findall('references')
-                    ref_col_ok = False
-                    for col_reference in col_references:
-                        ref_col_ok = True
-                        ref_column_name = col_reference.find('column-name')
-                        col_ref_table_name = col_reference.find('table-name')
-                        col_constraint_name = col_reference.find('constraint-name')
-                        old_col_constraint_name_text = col_constraint_name.text
-                        old_ref_column_name_text = ref_column_name.text
-                        old_ref_table_name_text = col_ref_table_name.text
-
-                        ref_column_name.text = normalize_name(ref_column_name.text, illegal_columns)
-                        merge_xml_element(column_def, 'original-column-name', old_ref_column_name_text, 3)
-
-                        col_ref_table_name.text = normalize_name(col_ref_table_name.text, illegal_tables)
-                        merge_xml_element(col_reference, 'original-table-name', old_ref_table_name_text, 3)
-
-                        old_col_constraint_fix = False
-                        if str(col_constraint_name.text).startswith('SYS_C'):
-                            col_constraint_name.text = col_constraint_name.text + '_'
-                            old_col_constraint_fix = True
-
-                        if col_ref_table_name.text.lower() in empty_tables:
-                            if not col_constraint_name.text.startswith('_disabled_'):
-                                col_constraint_name.text = "_disabled_" + col_constraint_name.text
-                            old_col_constraint_fix = True
-
-                        if old_col_constraint_fix:
-                            merge_xml_element(col_reference, 'original-constraint-name', old_col_constraint_name_text, 2)
-
-                        if col_ref_table_name.text.lower(
-                        ) == table_name.text and col_ref_table_name.text.lower(
-                        ) not in empty_tables:
-                            self_dep_set.add(ref_column_name.text.lower() + ':' + column_name.text.lower())
-
-                        xpath_str = "table-def[table-name='" + col_ref_table_name.text + "']/column-def[column-name='" + old_ref_column_name_text + "']"
-                        ref_column = tree_lookup.find(xpath_str)
-
-                        if ref_column:
-                            ref_column_data_size = ref_column.find(
-                                'dbms-data-size')
-                            if ref_column_data_size.text != dbms_data_size.text:
-                                dbms_data_size.text = ref_column_data_size.text
-
-                    if ref_col_ok:
-                        fk_ref_dict[table_name_norm + ':' + column_name.text] = ref_column_name.text
-
-                    if disposed.text != "true":
-                        ora_ctl_type = jdbc_to_ora_ctl_data_type[java_sql_type.text]
-                        if '()' in ora_ctl_type:
-                            ora_ctl_type = ora_ctl_type.replace('()', '(' + dbms_data_size.text + ')')
-
-                        ora_ctl_list.append(
-                            column_name.text + ' ' + ora_ctl_type)
-
-                        iso_data_type = jdbc_to_iso_data_type[java_sql_type.text]
-                        if '()' in iso_data_type:
-                            if int(dbms_data_size.text) < 4001:
-                                iso_data_type = iso_data_type.replace('()', '(' + dbms_data_size.text + ')')
-                            else:
-                                iso_data_type = 'text'
-
-                        ddl_columns_list.append(column_name.text + ' ' + iso_data_type + ',')
-
-                # Write Oracle SQL Loader control file:
-                if disposed.text != "true":
-                    with open(ora_ctl_file, "w") as file:
-                        file.write((',\n'.join(ora_ctl_list)).replace(
-                            '#,', '') + ' TERMINATED BY WHITESPACE \n)')
-
-                if len(self_dep_set) != 0:
-                    order_by_constraint(base_path, table_name.text, table_schema.text, self_dep_set)
-
-                ddl_columns[table_name_norm] = '\n'.join(ddl_columns_list)
-
-            root = tree.getroot()
-            indent(root)
-            tree.write(header_xml_file, encoding='utf-8')
+                    # Constraints disabled while sorting the tables:
+                    for foreign_key, fk_summary in zip(table_def.findall("foreign-keys/foreign-key"), table.foreign_keys):
+                        foreign_key.find("constraint-name").text = fk_summary.constraint_name
+
+                    c_count = normalize_table_def(table_def, base_path, illegal_tables, illegal_columns, tsv_process,
+                                                  tmp_dir, pk_dict, unique_dict, t_count, c_count)
+
+                    schema = table.schema.lower()
+                    if schema in schema_infos:
+                        normalize_table_def_for_schema(table_def, base_path, schema, schema_infos[schema],
+                                                       illegal_tables, illegal_columns, ref_column_sizes)
+
+                writer.write(table_def)
+
+        for schema, schema_info in schema_infos.items():
+            ddl_file = os.path.join(base_path, 'documentation', schema + '_ddl.sql')
+            deps_list = schema_info['deps_list']
+            constraint_dict = schema_info['constraint_dict']
+            fk_columns_dict = schema_info['fk_columns_dict']
+            fk_ref_dict = schema_info['fk_ref_dict']
+            ddl_columns = schema_info['ddl_columns']
 
             ddl = []
 
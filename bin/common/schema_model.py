@@ -0,0 +1,357 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Indexed in-memory model of a metadata.xml file.
+
+    The file is parsed once per process. A pickled copy of the parsed tree is kept in a cache directory
+    outside the project (CACHE_DIR, named by a hash of the path of metadata.xml) for the next process, and
+    used as long as the modification time and size of metadata.xml are unchanged. Pickled files next to
+    metadata.xml, which may have come with a package, are never loaded. Changes are made on the tree and
+    written back with one save().
+
+    For files too large to hold as a tree, iter_top_level() and MetadataWriter stream the file one
+    table-def at a time, and scan_table_summaries() keeps only what is needed across tables.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+
+from collections import OrderedDict
+from xml.sax.saxutils import quoteattr
+
+SIDECAR_SUFFIX = '.pickle'
+if 'pwcode_config_dir' in os.environ:
+    CACHE_DIR = os.path.join(os.environ['pwcode_config_dir'], 'tmp', 'schema_model')
+else:
+    CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pwcode_schema_model')
+
+MODELS = dict()
+MODELS_LOCK = threading.Lock()
+
+
+def indent(elem, level=0):
+    i = "\n" + level * "  "
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = i + "  "
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+        for elem in elem:
+            indent(elem, level + 1)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+    else:
+        if level and (not elem.tail or not elem.tail.strip()):
+            elem.tail = i
+
+
+def file_stamp(path) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def xstr(text) -> str:
+    return '' if text is None else text
+
+
+class SchemaModel:
+    """
+    metadata.xml with dictionaries indexed by schema, table, column, primary key, foreign key and index.
+    Table keys are tuples (schema, table name), with '' for tables without schema
+    """
+
+    def __init__(self, path, root):
+        self.path = str(path)
+        self.tree = ET.ElementTree(root)
+        self.stamp = None
+        self.reindex()
+
+    def reindex(self):
+        """
+        Rebuild the indexes. Needed after table-def, column-def, foreign-key or index-def elements were added or removed
+        """
+        self.table_defs = self.tree.getroot().findall('table-def')
+        self.schemas = []
+        self.tables = OrderedDict()
+        self.tables_by_name = dict()
+        self.columns = dict()
+        self.primary_keys = dict()
+        self.foreign_keys = dict()
+        self.indexes = dict()
+
+        for table_def in self.table_defs:
+            schema = xstr(table_def.findtext('table-schema'))
+            table = table_def.findtext('table-name')
+            key = (schema, table)
+            if schema not in self.schemas:
+                self.schemas.append(schema)
+            self.tables[key] = table_def
+            self.tables_by_name.setdefault(table, []).append(table_def)
+
+            columns = OrderedDict()
+            for column_def in table_def.findall('column-def'):
+                columns[column_def.findtext('column-name')] = column_def
+            self.columns[key] = columns
+            self.primary_keys[key] = [name for name, column_def in columns.items()
+                                      if column_def.findtext('primary-key') == 'true']
+            self.foreign_keys[key] = table_def.findall('foreign-keys/foreign-key')
+            self.indexes[key] = table_def.findall('index-def')
+
+    def table_defs_of(self, schema: str = None) -> list:
+        """
+        @param schema: str - schema. All tables if None
+        @return: list of table-def elements in document order
+        """
+        if schema is None:
+            return self.table_defs
+        return [table_def for key, table_def in self.tables.items() if key[0] == xstr(schema)]
+
+    def table_def(self, table: str, schema: str = None):
+        """
+        @param table: str - table name
+        @param schema: str - schema. Any schema if None
+        @return: the table-def element, or None if not found
+        """
+        if schema is not None:
+            return self.tables.get((xstr(schema), table))
+        table_defs = self.tables_by_name.get(table, [])
+        return table_defs[0] if table_defs else None
+
+    def table_key(self, table_def) -> tuple:
+        return xstr(table_def.findtext('table-schema')), table_def.findtext('table-name')
+
+    def column_defs(self, table: str, schema: str = None) -> OrderedDict:
+        """
+        @return: OrderedDict column name -> column-def element, empty if the table is not found
+        """
+        table_def = self.table_def(table, schema)
+        if table_def is None:
+            return OrderedDict()
+        return self.columns[self.table_key(table_def)]
+
+    def primary_key(self, table: str, schema: str = None) -> list:
+        """
+        @return: list of primary key column names
+        """
+        table_def = self.table_def(table, schema)
+        if table_def is None:
+            return []
+        return self.primary_keys[self.table_key(table_def)]
+
+    def index_defs(self, table: str, schema: str = None) -> list:
+        table_def = self.table_def(table, schema)
+        if table_def is None:
+            return []
+        return self.indexes[self.table_key(table_def)]
+
+    def foreign_key_defs(self, table: str, schema: str = None) -> list:
+        table_def = self.table_def(table, schema)
+        if table_def is None:
+            return []
+        return self.foreign_keys[self.table_key(table_def)]
+
+    def save(self):
+        """
+        Write all changes back to metadata.xml in one pass, and refresh the pickled copy
+        """
+        indent(self.tree.getroot())
+        self.tree.write(self.path, encoding='utf-8')
+        self.stamp = file_stamp(self.path)
+        write_sidecar(self)
+
+
+def sidecar_path(path) -> str:
+    """
+    @return: str - the pickled copy of metadata.xml in the cache directory
+    """
+    name = hashlib.sha1(os.path.abspath(str(path)).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, name + SIDECAR_SUFFIX)
+
+
+def remove_package_sidecar(path):
+    """
+    Remove a pickled copy next to metadata.xml, as written by earlier versions. It would be part of the package
+    """
+    sidecar = str(path) + SIDECAR_SUFFIX
+    if os.path.isfile(sidecar):
+        try:
+            os.remove(sidecar)
+        except OSError:
+            pass
+
+
+def write_sidecar(model: SchemaModel):
+    sidecar = sidecar_path(model.path)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(sidecar + '.tmp', 'wb') as f:
+            pickle.dump((model.path, model.stamp, model.tree.getroot()), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(sidecar + '.tmp', sidecar)
+    except OSError as e:
+        print('WARNING: could not write ' + sidecar + ': ' + str(e))
+
+
+def read_sidecar(path, stamp):
+    sidecar = sidecar_path(path)
+    if not os.path.isfile(sidecar):
+        return None
+    try:
+        with open(sidecar, 'rb') as f:
+            cached_path, sidecar_stamp, root = pickle.load(f)
+    except Exception:
+        return None
+    if (cached_path != os.path.abspath(str(path))) or (sidecar_stamp != stamp):
+        return None
+    return root
+
+
+def load_schema_model(path) -> SchemaModel:
+    """
+    Get the model of a metadata.xml file. The same model is returned within a process until the file
+    is changed by another process
+    @param path: str - path of metadata.xml
+    @return: SchemaModel
+    """
+    path = os.path.abspath(str(path))
+    stamp = file_stamp(path)
+    with MODELS_LOCK:
+        model = MODELS.get(path)
+        if (model is not None) and (model.stamp == stamp):
+            return model
+
+        remove_package_sidecar(path)
+        root = read_sidecar(path, stamp)
+        from_sidecar = root is not None
+        if not from_sidecar:
+            root = ET.parse(path).getroot()
+
+        model = SchemaModel(path, root)
+        model.stamp = stamp
+        if not from_sidecar:
+            write_sidecar(model)
+        MODELS[path] = model
+    return model
+
+
+class ForeignKeySummary:
+    __slots__ = ('constraint_name', 'table_schema', 'table_name')
+
+    def __init__(self, constraint_name, table_schema, table_name):
+        self.constraint_name = constraint_name
+        self.table_schema = table_schema
+        self.table_name = table_name
+
+
+class TableSummary:
+    """
+    The parts of a table-def, which are needed while other table-defs are processed
+    """
+    __slots__ = ('schema', 'name', 'disposed', 'foreign_keys', 'column_sizes')
+
+    def __init__(self, schema, name, disposed, foreign_keys, column_sizes):
+        self.schema = schema
+        self.name = name
+        self.disposed = disposed
+        self.foreign_keys = foreign_keys
+        self.column_sizes = column_sizes
+
+
+def iter_top_level(path):
+    """
+    Stream the children of the root element with iterparse. Each child is complete when yielded, and
+    removed from the tree afterwards, so only one child is in memory at a time
+    @param path: str - path of the xml file
+    @return: generator of tuples (root element without children, child element)
+    """
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(str(path), events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield root, elem
+            root.remove(elem)
+
+
+def scan_table_summaries(path) -> list:
+    """
+    Read a TableSummary of each table-def in metadata.xml, streaming
+    @return: list of TableSummary in document order
+    """
+    summaries = []
+    for root, elem in iter_top_level(path):
+        if elem.tag != 'table-def':
+            continue
+
+        foreign_keys = [ForeignKeySummary(fk.findtext('constraint-name'), fk.findtext('references/table-schema'),
+                                          fk.findtext('references/table-name'))
+                        for fk in elem.findall('foreign-keys/foreign-key')]
+        column_sizes = dict([(column_def.findtext('column-name'), column_def.findtext('dbms-data-size'))
+                             for column_def in elem.findall('column-def')])
+        summaries.append(TableSummary(elem.findtext('table-schema'), elem.findtext('table-name'),
+                                      elem.findtext('disposed'), foreign_keys, column_sizes))
+    return summaries
+
+
+class MetadataWriter:
+    """
+    Write metadata.xml one top level element at a time, in the same layout as indent() and
+    ElementTree.write(). The file is replaced when the writer is closed without errors
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.tmp_path = self.path + '.tmp'
+        self.file = None
+        self.root_tag = None
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+        return self
+
+    def start(self, root):
+        """
+        Write the start tag of the root element
+        """
+        self.root_tag = root.tag
+        attributes = ''.join([' ' + k + '=' + quoteattr(v) for k, v in root.attrib.items()])
+        self.file.write('<' + root.tag + attributes + '>')
+
+    def write(self, elem):
+        """
+        Write a complete child element of the root
+        """
+        indent(elem, 1)
+        elem.tail = None
+        self.file.write('\n  ' + ET.tostring(elem, encoding='unicode'))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.root_tag is not None:
+            self.file.write('\n</' + self.root_tag + '>\n')
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
@@ -4,39 +4,104 @@ import sys
 import csv
 import sqlite3
 import os
+import time
+from argparse import ArgumentParser
+from itertools import islice
 csv.field_size_limit(sys.maxsize)
 
 
-def chunks(data, rows=10000):
-    for i in range(0, len(data), rows):
-        yield data[i:i+rows]
+def next_chunk_size(size, rows, seconds, commit_time, max_rows):
+    # Grow or shrink towards commit_time seconds per transaction, by at most a factor of 2
+    if commit_time <= 0 or rows == 0:
+        return size
+    step = min(max(rows * commit_time / seconds / size, 0.5), 2.0) if seconds > 0 else 2.0
+    if step > 1.0 and rows < size:
+        return size
+    return int(max(min(size * step, max_rows), min(100, max_rows)))
 
 
-def main():
-    tsv_file = sys.argv[2]  # data file as secong argument
+def get_parser():
+    parser = ArgumentParser(description='Import a tsv file into a table in a SQLite database.')
+    parser.add_argument('table', help='name of the table to import into')
+    parser.add_argument('tsv_file', help='tsv file with column names in the first line')
+    parser.add_argument('db_file', help='path of the SQLite database file')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='rows per transaction, or the first one with --commit-time. Defaults to 10000')
+    parser.add_argument('--commit-time', type=float, default=0.0,
+                        help='target seconds per transaction, e.g. 2. Defaults to 0: a fixed --chunk-size')
+    parser.add_argument('--max-chunk-memory', type=int, default=64,
+                        help='memory ceiling in MB for the rows of one transaction. Defaults to 64')
+    parser.add_argument('--journal-mode', default='MEMORY',
+                        help='PRAGMA journal_mode during import. Defaults to MEMORY (OFF breaks ROLLBACK)')
+    parser.add_argument('--synchronous', default='OFF', help='PRAGMA synchronous during import. Defaults to OFF')
+    parser.add_argument('--cache-size', type=int, default=-200000,
+                        help='PRAGMA cache_size during import (negative is KiB). Defaults to -200000')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    tsv_file = args.tsv_file
     if os.stat(tsv_file).st_size == 0:
         return 'Empty file. Nothing to import.\n'
 
-    table = sys.argv[1]  # table name s first argument
-    con = sqlite3.connect(sys.argv[3])  # database file path as third argument
+    table = args.table
+    con = sqlite3.connect(args.db_file, isolation_level=None)
     cur = con.cursor()
+    cur.execute('PRAGMA journal_mode = ' + args.journal_mode)
+    cur.execute('PRAGMA synchronous = ' + args.synchronous)
+    cur.execute('PRAGMA cache_size = ' + str(args.cache_size))
 
-    with open(tsv_file, 'r') as f:
-        reader = csv.reader(f, delimiter='\t', skipinitialspace=True, quoting=csv.QUOTE_NONE, quotechar='', escapechar='')
-        header = next(reader)
-        columns = ','.join(header)  # Skip header, get column names
-        values = ','.join(['?' for x in header])  # Dummy values
-
-        lines = [row for row in reader]
-        data = chunks(lines)  # divide into 10000 rows each
+    # Drop indexes during import and recreate them afterwards. Unique indexes are kept, to reject duplicates:
+    unique_indexes = set([row[1] for row in cur.execute('PRAGMA index_list("' + table + '")').fetchall() if row[2]])
+    indexes = [(name, index_sql) for name, index_sql in cur.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)).fetchall() if name not in unique_indexes]
+    for name, index_sql in indexes:
+        cur.execute('DROP INDEX "' + name + '"')
 
-        for chunk in data:
-            cur.execute('BEGIN TRANSACTION')
+    try:
+        with open(tsv_file, 'r') as f:
+            reader = csv.reader(f, delimiter='\t', skipinitialspace=True, quoting=csv.QUOTE_NONE, quotechar='', escapechar='')
+            header = next(reader)
+            columns = ','.join(header)  # Skip header, get column names
+            values = ','.join(['?' for x in header])  # Dummy values
+            sql = 'INSERT INTO ' + table + ' (' + columns + ') VALUES(' + values + ');'
 
-            for line in chunk:
-                cur.execute('INSERT INTO ' + table + ' (' + columns + ') VALUES(' + values + ');', line)
+            row_count = 0
+            t0 = time.time()
+            size = args.chunk_size
+            max_rows = size
+            sizes = [size]
+            while True:
+                chunk = list(islice(reader, size))
+                if not chunk:
+                    break
+                if row_count == 0:
+                    row_bytes = sum([len(v) for v in chunk[0]]) + 8 * len(header)
+                    max_rows = max(args.max_chunk_memory * 1024 * 1024 // row_bytes, 1)
+                t1 = time.time()
+                cur.execute('BEGIN TRANSACTION')
+                cur.executemany(sql, chunk)
+                cur.execute('COMMIT')
 
-            cur.execute('COMMIT')
+                row_count += len(chunk)
+                dt = time.time() - t0
+                print('%s: %d rows (%d rows/sec)' % (table, row_count, row_count / dt if dt > 0 else 0))
+                size = next_chunk_size(size, len(chunk), time.time() - t1, args.commit_time, max_rows)
+                sizes.append(size)
+            if args.commit_time > 0:
+                print('%s: chunk size %d (%d-%d)' % (table, size, min(sizes), max(sizes)))
+    finally:
+        # A failed chunk leaves its transaction open: roll it back, so the indexes are not recreated in it
+        if con.in_transaction:
+            cur.execute('ROLLBACK')
+        cur.execute('BEGIN TRANSACTION')
+        for name, index_sql in indexes:
+            cur.execute(index_sql)
+        cur.execute('COMMIT')
+        con.close()
 
     return 'Table imported successfully.\n'
 
@@ -0,0 +1,162 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Adaptive batch and commit sizes. The size of each table grows or shrinks with the measured time per batch,
+    towards a target time per commit, and is capped by a memory ceiling for the rows of one batch
+"""
+import threading
+
+from collections import OrderedDict
+from time import time
+
+COMMIT_TARGET_SECONDS = 2.0
+BATCH_MAX_BYTES = 64 * 1024 * 1024
+BATCH_MIN_SIZE = 10
+BATCH_MAX_SIZE = 100000
+# maximum factor by which the size changes after one batch
+BATCH_MAX_STEP = 2.0
+
+# all sizers of this process by name, for the report
+BATCH_SIZERS = OrderedDict()
+BATCH_SIZERS_LOCK = threading.Lock()
+
+
+def estimate_row_bytes(row) -> int:
+    """
+    Rough size of a row (dict, list or tuple) in bytes: the length of strings and binaries, 8 for other values
+    """
+    values = row.values() if isinstance(row, dict) else row
+    return sum([len(v) if isinstance(v, (str, bytes, bytearray)) else 8 for v in values]) or 1
+
+
+class BatchSizer:
+    """
+    Batch size of one table. Feed it the rows and seconds of each batch with update(), or time batches
+    on the query time of a connection with start() and stop()
+    """
+
+    def __init__(self, name: str, initial: int = 1000, target_seconds: float = COMMIT_TARGET_SECONDS,
+                 max_bytes: int = BATCH_MAX_BYTES, minimum: int = BATCH_MIN_SIZE, maximum: int = BATCH_MAX_SIZE,
+                 row_bytes: int = None):
+        """
+        @param name: str - name in the report, usually the table
+        @param initial: int - size of the first batch
+        @param target_seconds: float - time per batch to aim for. The size stays fixed if <= 0
+        @param max_bytes: int - memory ceiling for the rows of one batch
+        @param row_bytes: int - estimated bytes per row, if known
+        """
+        self.name = name
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.minimum = minimum
+        self.maximum = maximum
+        self.row_bytes = row_bytes
+        self.size = self.clamp(initial)
+        self.batches = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.smallest = self.size
+        self.largest = self.size
+        self.t0 = None
+        with BATCH_SIZERS_LOCK:
+            BATCH_SIZERS[name] = self
+
+    def clamp(self, size: float) -> int:
+        maximum = self.maximum
+        if self.row_bytes:
+            maximum = min(maximum, max(self.max_bytes // self.row_bytes, 1))
+        return int(max(min(size, maximum), min(self.minimum, maximum)))
+
+    def set_row_bytes(self, row_bytes: int):
+        self.row_bytes = row_bytes
+        self.size = self.clamp(self.size)
+        self.smallest = min(self.smallest, self.size)
+
+    def update(self, rows: int, seconds: float) -> int:
+        """
+        Record a batch, and adjust the size
+        @param rows: int - rows in the batch
+        @param seconds: float - time spent on the batch
+        @return: int - the size of the next batch
+        """
+        self.batches += 1
+        self.rows += rows
+        self.seconds += seconds
+        if (self.target_seconds > 0) and (rows > 0):
+            if seconds > 0:
+                ideal = rows * self.target_seconds / seconds
+                step = min(max(ideal / self.size, 1.0 / BATCH_MAX_STEP), BATCH_MAX_STEP)
+            else:
+                step = BATCH_MAX_STEP
+            # only grow after full batches: a short last batch says nothing about larger ones
+            if (step < 1.0) or (rows >= self.size):
+                self.size = self.clamp(self.size * step)
+        self.smallest = min(self.smallest, self.size)
+        self.largest = max(self.largest, self.size)
+        return self.size
+
+    def start(self, statistics=None):
+        """
+        Start timing a batch
+        @param statistics: RuntimeStatistics of the connection. The batch is timed on its query time if given,
+            on the wall clock otherwise
+        """
+        self.t0 = statistics.query_time if statistics is not None else time()
+
+    def stop(self, rows: int, statistics=None) -> int:
+        """
+        Stop timing a batch of rows, and adjust the size
+        @return: int - the size of the next batch
+        """
+        if self.t0 is None:
+            return self.size
+        seconds = (statistics.query_time if statistics is not None else time()) - self.t0
+        self.t0 = None
+        return self.update(rows, seconds)
+
+    def update_run(self, rows: int, seconds: float, size: int) -> int:
+        """
+        Record a run, which committed rows in batches of size, e.g. of an external tool
+        @param rows: int - rows in the run
+        @param seconds: float - time spent on the run
+        @param size: int - batch size of the run
+        @return: int - the size of the next batch
+        """
+        if (rows < size) or (size < 1):
+            # a single short batch says nothing about the batch size
+            return self.size
+        batches = rows / size
+        self.batches += int(batches) - 1
+        self.rows += rows - size
+        self.seconds += seconds - seconds / batches
+        return self.update(size, seconds / batches)
+
+    def get_statistics(self) -> str:
+        rate = int(self.rows / self.seconds) if self.seconds > 0 else 0
+        return '+ %-20s size = %6d (%d-%d), batches = %6d, %8d rows/s' % (
+            self.name + ':', self.size, self.smallest, self.largest, self.batches, rate)
+
+
+def get_batch_size_statistics() -> str:
+    """
+    @return: str - the chosen batch sizes of all tables, or an empty string if none were used
+    """
+    with BATCH_SIZERS_LOCK:
+        sizers = [s for s in BATCH_SIZERS.values() if s.batches > 0]
+    if len(sizers) == 0:
+        return ''
+    return '\n'.join(['Batch sizes:'] + [s.get_statistics() for s in sizers])
@@ -22,6 +22,7 @@
 
 import sys
 import os
+import threading
 from pathlib import Path
 from collections import OrderedDict
 from decimal import Decimal
@@ -34,6 +35,8 @@ from jaydebeapi import Cursor, Error, DatabaseError, connect
 
 #from .config_parser import JDBC_DRIVERS, JAR_FILES, parse_login, parse_dummy_login
 # from .exceptions import DriverNotFoundException, SQLExcecuteException, CommitException
+from .prefetch import prefetched
+from .profiles import get_profile
 from .runtime_statistics import RuntimeStatistics
 from .utils import *
 
@@ -132,6 +135,148 @@ def get_columns_of_cursor(cursor: Cursor) -> OrderedDict:
     return columns
 
 
+# java.sql.Types codes, mapped on the column types like get_columns_of_cursor() does
+JDBC_TYPES_NUMBER = {-7, 16, -6, 5, 4, -5, 3, 2}
+JDBC_TYPES_FLOAT = {6, 7, 8}
+JDBC_TYPES_DATE = {93}
+
+# statements, which may change the columns of a table
+DDL_KEYWORDS = ('CREATE', 'ALTER', 'DROP', 'RENAME')
+
+# prepared statements kept per connection. Zero disables the cache
+STATEMENT_CACHE_SIZE = 32
+# only DML is executed on cached statements: executing a shared statement again closes the result set of a query
+CACHED_STATEMENT_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'MERGE')
+
+
+def column_type_of_jdbc_type(data_type: int) -> str:
+    if data_type in JDBC_TYPES_NUMBER:
+        return COLUMN_TYPE_NUMBER
+    elif data_type in JDBC_TYPES_FLOAT:
+        return COLUMN_TYPE_FLOAT
+    elif data_type in JDBC_TYPES_DATE:
+        return COLUMN_TYPE_DATE
+    return COLUMN_TYPE_STRING
+
+
+def read_metadata_columns(connection, catalog: str = None, schema: str = None) -> dict:
+    """
+    Read the columns of all tables in a schema with one DatabaseMetaData.getColumns() call.
+    No query is executed on the tables themselves
+    @param connection: jaydebeapi connection
+    @param catalog: str - catalog (database name) or None for all
+    @param schema: str - schema or None for all
+    @return: dict - for each table name an OrderedDict of columns - key: name of the column, value: type of the column
+    """
+    tables = dict()
+    result_set = connection.jconn.getMetaData().getColumns(catalog or None, schema or None, '%', '%')
+    try:
+        while result_set.next():
+            table = str(result_set.getString('TABLE_NAME'))
+            columns = tables.setdefault(table, [])
+            columns.append((int(result_set.getInt('ORDINAL_POSITION')), str(result_set.getString('COLUMN_NAME')),
+                            column_type_of_jdbc_type(int(result_set.getInt('DATA_TYPE')))))
+    finally:
+        result_set.close()
+    return dict([(t, OrderedDict([(name, ctype) for _, name, ctype in sorted(c)])) for t, c in tables.items()])
+
+
+def split_table_name(table: str, default_schema: str = None) -> tuple:
+    """
+    Split a table reference as used in SQL, e.g. "SCHEMA"."TABLE", into schema and table name
+    @return: tuple(str, str) - schema (default_schema if not specified) and table name, without quotes
+    """
+    parts = [p.strip().strip('"[]`') for p in table.strip().split('.')]
+    if len(parts) > 1:
+        return parts[-2], parts[-1]
+    return default_schema, parts[0]
+
+
+def find_table_columns(tables: dict, table: str):
+    """
+    @return: OrderedDict - columns of the table in the output of read_metadata_columns(), or None if not found.
+        The table name is matched case insensitive if there is no exact match
+    """
+    if table in tables:
+        return tables[table]
+    matches = [t for t in tables.keys() if t.upper() == table.upper()]
+    if len(matches) == 1:
+        return tables[matches[0]]
+    return None
+
+
+def string2java_string(sql_or_list):
+    """
+    Bugfix: 4-byte UTF-8 is not parsed correctly into jpype. Convert strings into java.lang.String
+    @param sql_or_list: str, list of parameters, or a list of lists of parameters (batch for executemany)
+    @return: the input with all strings converted
+    """
+    global JAVA_STRING
+    if JAVA_STRING is None:
+        # JVM must have started for this
+        JAVA_STRING = JPackage('java').lang.String
+
+    if sql_or_list is None:
+        return None
+    elif isinstance(sql_or_list, str):
+        return JAVA_STRING(sql_or_list.encode(), 'UTF8')
+    elif isinstance(sql_or_list, (list, tuple)):
+        java_string = JAVA_STRING
+        if (len(sql_or_list) > 0) and isinstance(sql_or_list[0], (list, tuple)):
+            # batch: convert all rows in one pass
+            return [[java_string(p.encode(), 'UTF8') if isinstance(p, str) else p for p in row]
+                    for row in sql_or_list]
+        return [java_string(p.encode(), 'UTF8') if isinstance(p, str) else p for p in sql_or_list]
+
+
+def close_statement(statement):
+    if statement is None:
+        return
+    try:
+        statement.close()
+    except Exception:
+        pass
+
+
+class StatementCache:
+    """
+    LRU cache of the prepared statements of one connection, keyed by the SQL text
+    """
+
+    def __init__(self, size: int = STATEMENT_CACHE_SIZE):
+        self.size = size
+        self.statements = OrderedDict()
+
+    def prepare(self, connection, sql: str, statistics):
+        """
+        Get the prepared statement of an sql, and prepare it on a cache miss
+        @param connection: jaydebeapi connection
+        @param sql: str - the sql with ? for parameters
+        @param statistics: RuntimeStatistics - counts the hits and misses
+        @return: java.sql.PreparedStatement
+        """
+        statement = self.statements.get(sql)
+        if statement is not None:
+            self.statements.move_to_end(sql)
+            statistics.add_prepare_hit()
+            return statement
+
+        statistics.add_prepare_miss()
+        statement = connection.jconn.prepareStatement(sql)
+        self.statements[sql] = statement
+        while len(self.statements) > self.size:
+            close_statement(self.statements.popitem(last=False)[1])
+        return statement
+
+    def discard(self, sql: str):
+        close_statement(self.statements.pop(sql, None))
+
+    def clear(self):
+        for statement in self.statements.values():
+            close_statement(statement)
+        self.statements = OrderedDict()
+
+
 class DataTransformer:
     """
         Row types returned by jaydebeapi are not always of a python compatible type.
@@ -197,7 +342,11 @@ class DataTransformer:
 
     @staticmethod
     def byte_array_to_bytes(array):
-        return bytes([(lambda i: (256 + i) if i < 0 else i)(b) for b in array])
+        try:
+            # jpype primitive arrays support the buffer protocol: copy the memory in one go
+            return bytes(memoryview(array))
+        except TypeError:
+            return bytes([b & 0xff for b in array])
 
     @staticmethod
     def default_transformer(v):
@@ -212,7 +361,10 @@ class DataTransformer:
 
     def oracle_lob_to_bytes(self, lob):
         # print(type(lob).__name__)
-        return self.byte_array_to_bytes(lob.getBytes(1, lob.length()))
+        length = lob.length()
+        if length == 0:
+            return b''
+        return self.byte_array_to_bytes(lob.getBytes(1, length))
 
     def oracle_clob(self, clob):
         return clob.stringValue()
@@ -228,6 +380,87 @@ class DataTransformer:
             else:
                 return dval
 
+    def resolve_transformer(self, x: int, value):
+        """
+        Select the transformation function of a column from the type of its first non-null value
+        @param x: int - index of the column
+        @param value: first non-null value found in the column
+        @return: the transformation function, which is also stored for further use
+        """
+        func = self.transformer[x]
+        vtype = type(value).__name__
+        if vtype == 'oracle.sql.BLOB':
+            self.transformer[x] = self.oracle_lob_to_bytes
+        elif vtype == 'oracle.sql.CLOB':
+            self.transformer[x] = self.oracle_clob
+        elif vtype.startswith('java') or vtype.startswith('oracle'):
+            self.transformer[x] = (lambda v: v.toString())
+        elif vtype == 'byte[]':
+            self.transformer[x] = self.byte_array_to_bytes
+        elif func == COLUMN_TYPE_FLOAT:
+            self.transformer[x] = (lambda v: v if isinstance(v, float) else float(v))
+        elif func == COLUMN_TYPE_NUMBER:
+            self.transformer[x] = self.parse_number
+        else:
+            self.transformer[x] = self.default_transformer
+            #(lambda v: v)
+        return self.transformer[x]
+
+    def transform_column(self, x: int, values) -> list:
+        """
+        Transform all values of a single column
+        @param x: int - index of the column
+        @param values: sequence of the raw values of the column
+        @return: list of transformed values
+        """
+        func = self.transformer[x]
+        if isinstance(func, str):
+            first = next((v for v in values if v is not None), None)
+            if first is None:
+                return list(values)
+            func = self.resolve_transformer(x, first)
+
+        try:
+            return [None if v is None else func(v) for v in values]
+        except Exception:
+            # repeat value by value to report the value, which cannot be parsed
+            for value in values:
+                if value is not None:
+                    try:
+                        func(value)
+                    except Exception as e:
+                        print('ERROR - cannot parse {}: {}'.format(value, str(e)))
+                        raise
+            raise
+
+    def transform_batch(self, rows: list, columnar: bool = False) -> list:
+        """
+        Transform a batch of rows (e.g., the result of fetchmany) column by column
+        @param rows: list of rows (lists or tuples)
+        @param columnar: bool - return a list of columns instead of a list of rows. Defaults to False
+        @return: list of rows in the return type specified when the class was instantiated, or a list of
+            columns (lists of values, in the order of self.columns) if columnar=True
+        """
+        if len(rows) == 0:
+            return [[] for x in range(self.nr_of_columns)] if columnar else []
+        row_length = len(rows[0])
+        if row_length != self.nr_of_columns:
+            raise ValueError('Invalid row. Expected %d elements but found %d.' % (self.nr_of_columns, row_length))
+
+        columns = [self.transform_column(x, values) for x, values in enumerate(zip(*rows))]
+        if columnar:
+            return columns
+
+        if self.return_type == tuple:
+            return list(zip(*columns))
+        elif self.return_type == list:
+            return [list(r) for r in zip(*columns)]
+        elif self.include_none:
+            return [self.return_type(zip(self.columns, r)) for r in zip(*columns)]
+        else:
+            return [self.return_type((k, v) for k, v in zip(self.columns, r) if v is not None)
+                    for r in zip(*columns)]
+
     def __call__(self, row):
         """
         Transform a row of data
@@ -256,23 +489,7 @@ class DataTransformer:
             func = self.transformer[x]
             if isinstance(func, str):
                 # first time use
-                vtype = type(value).__name__
-                if vtype == 'oracle.sql.BLOB':
-                    self.transformer[x] = self.oracle_lob_to_bytes
-                elif vtype == 'oracle.sql.CLOB':
-                    self.transformer[x] = self.oracle_clob
-                elif vtype.startswith('java') or vtype.startswith('oracle'):
-                    self.transformer[x] = (lambda v: v.toString())
-                elif vtype == 'byte[]':
-                    self.transformer[x] = self.byte_array_to_bytes
-                elif func == COLUMN_TYPE_FLOAT:
-                    self.transformer[x] = (lambda v: v if isinstance(v, float) else float(v))
-                elif func == COLUMN_TYPE_NUMBER:
-                    self.transformer[x] = self.parse_number
-                else:
-                    self.transformer[x] = self.default_transformer
-                    #(lambda v: v)
-                func = self.transformer[x]
+                func = self.resolve_transformer(x, value)
 
             parse_exception = None
             try:
@@ -327,6 +544,10 @@ class Jdbc:
 
     """
 
+    # table columns from the database metadata, shared by all connections to the same database and schema
+    column_cache = dict()
+    column_cache_lock = threading.Lock()
+
     def __init__(self, url, usr, pwd, db_name, db_schema, driver_jar, driver_class, auto_commit=False, upper_case=False):
         """
         Init the jdbc connection.
@@ -345,6 +566,8 @@ class Jdbc:
         self.connection = None
         self.driver_jar = driver_jar
         self.driver_class = driver_class
+        # performance settings of the driver
+        self.profile = get_profile(driver_class)
 
         connection_error = None
         try:
@@ -356,8 +579,17 @@ class Jdbc:
             # test = JDBC_DRIVERS[self.type]['class']
             # print(test)
 
-            self.connection = connect(self.driver_class, self.url, [self.usr, self.pwd], self.driver_jar,)
+            if len(self.profile.properties) > 0:
+                driver_args = dict(self.profile.properties)
+                driver_args.update({'user': self.usr, 'password': self.pwd})
+            else:
+                driver_args = [self.usr, self.pwd]
+            # self.url is kept as given: it is the key of the connection in pools and caches
+            self.connection = connect(self.driver_class, self.profile.apply_url(self.url), driver_args,
+                                      self.driver_jar,)
             self.connection.jconn.setAutoCommit(auto_commit)
+            if self.profile.read_only:
+                self.connection.jconn.setReadOnly(True)
         except Exception as error:
             error_msg = str(error)
             print(error_msg)
@@ -377,6 +609,10 @@ class Jdbc:
 
         # for statistics
         self.statistics = RuntimeStatistics()
+        self.statistics.profile = self.profile.name
+
+        # prepared statements of repeated DML
+        self.statements = StatementCache()
 
         # cursor handling
         self.counter = 0
@@ -390,6 +626,7 @@ class Jdbc:
                     cursor.close()
                 except Exception:
                     pass
+            self.statements.clear()
             try:
                 self.connection.close()
             except Exception:
@@ -434,27 +671,6 @@ class Jdbc:
         @raise SQLExecutionError on an execution exception
         """
 
-        def string2java_string(sql_or_list):
-            # Bugfix: 4-byte UTF-8 is not parsed correctly into jpype
-
-            global JAVA_STRING
-            if JAVA_STRING is None:
-                # JVM must have started for this
-                JAVA_STRING = JPackage('java').lang.String
-
-            if sql_or_list is None:
-                return None
-            elif isinstance(sql_or_list, str):
-                return JAVA_STRING(sql_or_list.encode(), 'UTF8')
-            elif isinstance(sql_or_list, (list, tuple)):
-                parms = []
-                for p in sql_or_list:
-                    if isinstance(p, str):
-                        parms.append(JAVA_STRING(p.encode(), 'UTF8'))
-                    else:
-                        parms.append(p)
-                return parms
-
         if is_empty(sql):
             raise ValueError('Query string (sql) may not be empty.')
         elif not isinstance(sql, str):
@@ -470,20 +686,36 @@ class Jdbc:
 
         while sql.strip().endswith(';'):
             sql = sql.strip()[:-1]
+        keyword = sql.lstrip()[:6].upper()
+        if keyword.startswith(DDL_KEYWORDS):
+            self.clear_column_cache()
+            # cached statements may refer to altered or dropped tables
+            self.statements.clear()
+        use_cache = (parameters is not None) and (self.statements.size > 0) and \
+            keyword.startswith(CACHED_STATEMENT_KEYWORDS)
         error_message = None
         with self.statistics as stt:
             try:
                 if isinstance(parameters, (list, tuple)) and (len(parameters) > 0) and (
                         isinstance(parameters[0], (list, tuple, dict))):
                     stt.add_exec_count(len(parameters))
-                    cursor.executemany(sql, [string2java_string(p) for p in parameters])
+                    if use_cache:
+                        self.execute_prepared(cursor, sql, string2java_string(parameters), True)
+                    else:
+                        cursor.executemany(sql, string2java_string(parameters))
                 else:
                     stt.add_exec_count()
-                    if parameters is None:
+                    if use_cache:
+                        self.execute_prepared(cursor, sql, string2java_string(parameters))
+                    elif self.profile.fetch_size > 0:
+                        self.execute_with_fetch_size(cursor, string2java_string(sql), string2java_string(parameters))
+                    elif parameters is None:
                         cursor.execute(string2java_string(sql), None)
                     else:
                         cursor.execute(sql, string2java_string(parameters))
             except Exception as execute_exception:
+                if use_cache:
+                    self.statements.discard(sql)
                 self.close(cursor)
                 error_message = str(execute_exception)
                 for prefix in ['java.sql.']:
@@ -500,6 +732,44 @@ class Jdbc:
             setattr(cursor, PARENT_CONNECTION, self)
         return cursor
 
+    def execute_prepared(self, cursor: Cursor, sql: str, parameters: list, many: bool = False):
+        """
+        Execute DML on the cached prepared statement of the sql. The parameters are bound as in
+        jaydebeapi, and the update count is set on the cursor. The statement stays open for the next call
+        @param cursor: Cursor - cursor to report the row count on
+        @param sql: str - insert, update, delete or merge statement
+        @param parameters: list of parameters, or list of lists of parameters if many is True
+        @param many: bool - execute as a batch
+        """
+        # the cursor must not close the cached statement
+        cursor._close_last()
+        statement = self.statements.prepare(self.connection, sql, self.statistics)
+        if many:
+            for row in parameters:
+                cursor._set_stmt_parms(statement, row)
+                statement.addBatch()
+            cursor.rowcount = sum(statement.executeBatch())
+        else:
+            cursor._set_stmt_parms(statement, parameters)
+            cursor.rowcount = statement.executeUpdate()
+        statement.clearParameters()
+
+    def execute_with_fetch_size(self, cursor: Cursor, sql, parameters: list = None):
+        """
+        Execute as jaydebeapi does, with the fetch size of the driver profile set on the statement.
+        The statement is owned by the cursor
+        """
+        cursor._close_last()
+        cursor._prep = self.connection.jconn.prepareStatement(sql)
+        cursor._prep.setFetchSize(self.profile.fetch_size)
+        cursor._set_stmt_parms(cursor._prep, parameters or ())
+        if cursor._prep.execute():
+            cursor._rs = cursor._prep.getResultSet()
+            cursor._meta = cursor._rs.getMetaData()
+            cursor.rowcount = -1
+        else:
+            cursor.rowcount = cursor._prep.getUpdateCount()
+
     @default_cursor(None)
     def get_cursor(self, cursor=None):
         """
@@ -521,18 +791,66 @@ class Jdbc:
         """
         return get_columns_of_cursor(cursor)
 
+    def column_cache_key(self, schema: str = None) -> tuple:
+        if schema is None:
+            schema = self.db_schema
+        return self.url, self.usr, self.db_name or None, schema or None
+
+    def get_schema_columns(self, schema: str = None) -> dict:
+        """
+        Get the columns of all tables in a schema from the database metadata. The result is cached, and
+        only read again after DDL has been executed on this database
+        @param schema: str - schema. Defaults to the schema of the connection
+        @return: dict - for each table name an OrderedDict of columns (see read_metadata_columns)
+        """
+        key = self.column_cache_key(schema)
+        with Jdbc.column_cache_lock:
+            tables = Jdbc.column_cache.get(key)
+        if tables is None:
+            tables = read_metadata_columns(self.connection, key[2], key[3])
+            with Jdbc.column_cache_lock:
+                Jdbc.column_cache[key] = tables
+        return tables
+
+    def get_table_columns(self, table: str, upper_case: bool = None) -> OrderedDict:
+        """
+        Get the columns of a table from the (cached) database metadata, without a query on the table
+        @param table: str - table name, optionally with schema and quotes as used in SQL
+        @param upper_case: bool - column names in upper case. Defaults to self.upper_case
+        @return: OrderedDict of the columns as in get_columns(), or None if the table is not found
+        """
+        schema, table_name = split_table_name(table, self.db_schema)
+        columns = find_table_columns(self.get_schema_columns(schema), table_name)
+        if columns is None:
+            return None
+        if upper_case is None:
+            upper_case = self.upper_case
+        if upper_case:
+            return OrderedDict([(name.upper(), ctype) for name, ctype in columns.items()])
+        return OrderedDict(columns)
+
+    def clear_column_cache(self):
+        """
+        Forget the cached table columns of this database, e.g. after tables were created or altered
+        """
+        with Jdbc.column_cache_lock:
+            for key in [k for k in Jdbc.column_cache.keys() if k[:2] == (self.url, self.usr)]:
+                del Jdbc.column_cache[key]
+
     @default_cursor(None)
-    def get_data(self, cursor: Cursor = None, return_type=tuple,
-                 include_none=False, max_rows: int = 0, array_size: int = 1000):
+    def get_batches(self, cursor: Cursor = None, return_type=tuple,
+                    include_none=False, max_rows: int = 0, array_size: int = 1000, columnar: bool = False):
         """
-        An iterator using fetchmany to keep the memory usage reasonalble
+        An iterator over the fetchmany batches of a cursor. Each batch is transformed as a whole
+        (see DataTransformer.transform_batch)
         @param cursor: Cursor to query, use current if not specified
         @param return_type: return type of rows. May be list, tuple (default), dict, or OrderedDict
         @param include_none: bool return None values in dictionaries, if True. Defaults to False
         @param max_rows: int maximum number of rows to return before closing the cursor. Negative or zero implies
             all rows
         @param array_size: int - the buffer size
-        @return: iterator
+        @param columnar: bool - yield batches as lists of columns instead of lists of rows. Defaults to False
+        @return: iterator of lists of rows (or of columns)
         """
         if (not isinstance(array_size, int)) or array_size < 1:
             array_size = 1
@@ -561,12 +879,34 @@ class Jdbc:
             if len(results) == 0:
                 self.close(cursor)
                 break
-            for result in results:
-                row_count += 1
-                yield transformer(result)
-                if (max_rows > 0) and (row_count >= max_rows):
-                    self.close(cursor)
-                    break
+
+            if (max_rows > 0) and (row_count + len(results) >= max_rows):
+                yield transformer.transform_batch(results[:max_rows - row_count], columnar)
+                self.close(cursor)
+                break
+            row_count += len(results)
+            yield transformer.transform_batch(results, columnar)
+
+    @default_cursor(None)
+    def get_data(self, cursor: Cursor = None, return_type=tuple,
+                 include_none=False, max_rows: int = 0, array_size: int = 1000, prefetch: int = 0):
+        """
+        An iterator using fetchmany to keep the memory usage reasonalble
+        @param cursor: Cursor to query, use current if not specified
+        @param return_type: return type of rows. May be list, tuple (default), dict, or OrderedDict
+        @param include_none: bool return None values in dictionaries, if True. Defaults to False
+        @param max_rows: int maximum number of rows to return before closing the cursor. Negative or zero implies
+            all rows
+        @param array_size: int - the buffer size
+        @param prefetch: int - number of batches fetched ahead in a worker thread, while the caller processes
+            the current batch. Zero (default) fetches in the calling thread. Do not use the cursor elsewhere
+            until the iterator is exhausted or closed
+        @return: iterator
+        """
+        batches = self.get_batches(cursor, return_type=return_type, include_none=include_none,
+                                   max_rows=max_rows, array_size=array_size)
+        for batch in prefetched(batches, prefetch):
+            yield from batch
 
     @default_cursor([])
     def commit(self, cursor=None):
@@ -0,0 +1,147 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Export LOB columns to files, streaming the data from the JDBC driver in chunks
+"""
+import csv
+import hashlib
+import os
+
+from jpype import JArray, JByte, JChar, JPackage
+
+from .jdbc import Jdbc
+
+# java.sql.Types handled as binary. Other LOB types are read as character streams (written as UTF-8)
+BINARY_SQL_TYPES = (-4, -3, -2, 2004)
+
+LOB_CHUNK_SIZE = 1024 * 1024
+
+
+def lob_file_name(table: str, column: str, row_nr: int) -> str:
+    """
+    File name of an exported LOB value. Matches the '<table>_<column>_' || ROWNUM() references
+    written in the text export of the table
+    """
+    return table.lower() + '_' + column.lower() + '_' + str(row_nr) + '.data'
+
+
+def export_lobs(jdbc: Jdbc, table: str, lob_columns: list, target_dir: str, schema: str = None,
+                manifest_path: str = None, hash_name: str = 'md5', chunk_size: int = LOB_CHUNK_SIZE) -> dict:
+    """
+    Export all LOB columns of a table to files in a single scan of the table.
+    Values are streamed in chunks from the driver (getBinaryStream/getCharacterStream) straight to disk,
+    and checksummed while they are written. Null and empty values produce no file.
+
+    @param jdbc: Jdbc - source connection
+    @param table: str - name of the table
+    @param lob_columns: list of the LOB column names
+    @param target_dir: str - directory of the exported files
+    @param schema: str - schema of the table (optional)
+    @param manifest_path: str - tsv file with file name, column, row number, size and checksum of each exported file
+        (optional)
+    @param hash_name: str - hashlib algorithm for the checksums. Defaults to md5
+    @param chunk_size: int - size of the read buffer (bytes or characters)
+    @return: dict - number of exported files per column
+    """
+    java_string = JPackage('java').lang.String
+    character = JPackage('java').lang.Character
+    byte_buffer = JArray(JByte)(chunk_size)
+    char_buffer = JArray(JChar)(chunk_size)
+
+    table_ref = '"' + table + '"'
+    if schema:
+        table_ref = '"' + schema + '".' + table_ref
+    sql = 'SELECT ' + ','.join(['"' + c + '"' for c in lob_columns]) + ' FROM ' + table_ref
+
+    file_count = dict([(c, 0) for c in lob_columns])
+    manifest = None
+    writer = None
+    if manifest_path:
+        manifest = open(manifest_path, 'w')
+        writer = csv.writer(manifest, delimiter='\t', lineterminator='\n')
+        writer.writerow(['file_name', 'column_name', 'row_nr', 'file_size', hash_name])
+
+    statement = jdbc.connection.jconn.createStatement()
+    try:
+        with jdbc.statistics as stt:
+            stt.add_exec_count()
+            result_set = statement.executeQuery(sql)
+        meta = result_set.getMetaData()
+        is_binary = [meta.getColumnType(x + 1) in BINARY_SQL_TYPES for x in range(len(lob_columns))]
+
+        row_nr = 0
+        while result_set.next():
+            row_nr += 1
+            for x, column in enumerate(lob_columns):
+                if is_binary[x]:
+                    stream = result_set.getBinaryStream(x + 1)
+                    buffer = byte_buffer
+                else:
+                    stream = result_set.getCharacterStream(x + 1)
+                    buffer = char_buffer
+                if stream is None:
+                    continue
+
+                file_name = lob_file_name(table, column, row_nr)
+                file_path = os.path.join(target_dir, file_name)
+                checksum = hashlib.new(hash_name)
+                file_size = 0
+                f = None
+                # number of chars carried over to the start of the buffer for the next chunk
+                offset = 0
+                try:
+                    while True:
+                        n = stream.read(buffer, offset, chunk_size - offset)
+                        if n < 0:
+                            if offset == 0:
+                                break
+                            # unpaired high surrogate at the end: written as '?', like a Java encoder does
+                            n = 0
+                        n += offset
+                        offset = 0
+                        if is_binary[x]:
+                            data = bytes(memoryview(buffer)[:n])
+                        else:
+                            if (n > 0) and (chunk_size > 1) and character.isHighSurrogate(buffer[n - 1]):
+                                # surrogate pair split between two chunks: the high surrogate goes with the next one
+                                n -= 1
+                                offset = 1
+                            data = str(java_string(buffer, 0, n)).encode('utf-8', 'replace')
+                            if offset > 0:
+                                buffer[0] = buffer[n]
+                        if f is None:
+                            f = open(file_path, 'wb')
+                        f.write(data)
+                        checksum.update(data)
+                        file_size += len(data)
+                finally:
+                    stream.close()
+                    if f is not None:
+                        f.close()
+
+                if file_size > 0:
+                    file_count[column] += 1
+                    if writer is not None:
+                        writer.writerow([file_name, column, row_nr, file_size, checksum.hexdigest()])
+        result_set.close()
+        jdbc.statistics.add_row_count(row_nr)
+    finally:
+        statement.close()
+        if manifest is not None:
+            manifest.close()
+
+    return file_count
@@ -0,0 +1,148 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Integer primary keys for parallel uploads. Keys are reserved in blocks: one database round trip per block,
+    not per row. Threads of one process share the blocks under a lock. Processes reserve their blocks under
+    a lock file in a common directory, which also holds the highest reserved key.
+
+    Unused keys of a block are skipped, like the cache of a database sequence.
+"""
+import hashlib
+import os
+import threading
+
+PK_BLOCK_SIZE = 1000
+
+if os.name == 'nt':
+    import msvcrt
+
+    def lock_file(f):
+        f.seek(0)
+        # LK_LOCK retries for 10 seconds before raising OSError
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass
+
+    def unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def connection_key(jdbc) -> str:
+    """
+    @return: str - the database and schema of a Jdbc or DummyJdbc instance
+    """
+    login = getattr(jdbc, 'login', None)
+    if login is not None:
+        return login
+    return '%s@%s/%s' % (jdbc.usr, jdbc.url, jdbc.db_schema)
+
+
+class PkBlock:
+    """
+    Reserved keys first..last
+    """
+
+    def __init__(self, first: int, last: int):
+        self.next = first
+        self.last = last
+
+    def remaining(self) -> int:
+        return self.last - self.next + 1
+
+
+class PkAllocator:
+    def __init__(self, block_size: int = PK_BLOCK_SIZE, lock_dir: str = None):
+        """
+        @param block_size: int - number of keys reserved per database round trip
+        @param lock_dir: str - directory of the lock files, shared by all processes uploading to the same
+            tables. Keys are only unique within this process if None
+        """
+        self.block_size = block_size
+        self.lock_dir = lock_dir
+        self.blocks = dict()
+        self.lock = threading.Lock()
+
+    def lock_path(self, key: tuple) -> str:
+        name = hashlib.sha1('|'.join(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.lock_dir, 'pk_' + name + '.lock')
+
+    def reserve(self, jdbc, key: tuple, size: int, previous: PkBlock = None) -> PkBlock:
+        """
+        Reserve a block of size keys above the maximum in the database, the previous block of this process,
+        and the highest key reserved by other processes. Keys of the previous block may not be committed yet,
+        so the maximum in the database alone does not cover them. Called with self.lock held
+        """
+        table_name, column_name = key[1:]
+        maximum = jdbc.get_int('SELECT MAX(%s) FROM %s' % (column_name, table_name))
+        if previous is not None:
+            maximum = max(maximum, previous.last)
+        if self.lock_dir is None:
+            return PkBlock(maximum + 1, maximum + size)
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(self.lock_path(key), 'a+') as f:
+            lock_file(f)
+            try:
+                f.seek(0)
+                text = f.read().strip()
+                if text:
+                    maximum = max(maximum, int(text))
+                f.seek(0)
+                f.truncate()
+                f.write(str(maximum + size))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                unlock_file(f)
+        return PkBlock(maximum + 1, maximum + size)
+
+    def next_value(self, jdbc, table_name: str, column_name: str, increment: int = 1) -> int:
+        """
+        @param increment: int - number of consecutive keys to take. 0 returns the last key taken, or the
+            maximum in the database, without taking one
+        @return: int - the last of the keys taken
+        """
+        key = (connection_key(jdbc), table_name, column_name)
+        with self.lock:
+            block = self.blocks.get(key)
+            if increment < 1:
+                if block is not None:
+                    return block.next - 1
+                return jdbc.get_int('SELECT MAX(%s) FROM %s' % (column_name, table_name))
+            if (block is None) or (block.remaining() < increment):
+                block = self.blocks[key] = self.reserve(jdbc, key, max(self.block_size, increment), block)
+            block.next += increment
+            return block.next - 1
+
+    def clear(self):
+        """
+        Forget the reserved blocks, e.g. after the tables have been emptied
+        """
+        with self.lock:
+            self.blocks = dict()
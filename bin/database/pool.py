@@ -0,0 +1,182 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Pool of reusable Jdbc connections, keyed by (url, user, driver class)
+"""
+import atexit
+import threading
+
+from contextlib import contextmanager
+
+from .jdbc import Jdbc
+
+# seconds to wait for a reply from the database in the health check of an idle connection
+VALIDATION_TIMEOUT = 5
+
+
+class JdbcPool:
+    """
+    Bounded pool of Jdbc connections.
+
+    Connections are checked out for one job (a table, a query) and returned afterwards. Idle connections
+    are health checked before they are handed out again, and replaced if they are no longer valid.
+    """
+
+    def __init__(self, max_size: int = 8, max_idle: int = 4):
+        """
+        @param max_size: int - maximum number of open connections per key. Checkout blocks while the limit is reached
+        @param max_idle: int - maximum number of idle connections kept per key
+        """
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.idle = dict()
+        self.in_use = dict()
+        self.condition = threading.Condition()
+
+    @staticmethod
+    def key(url, usr, driver_class) -> tuple:
+        return url, usr, driver_class
+
+    @staticmethod
+    def is_valid(jdbc: Jdbc) -> bool:
+        if (jdbc is None) or (jdbc.connection is None):
+            return False
+        try:
+            jconn = jdbc.connection.jconn
+            return (not jconn.isClosed()) and jconn.isValid(VALIDATION_TIMEOUT)
+        except Exception:
+            return False
+
+    @staticmethod
+    def discard(jdbc: Jdbc):
+        try:
+            jdbc.connection.close()
+        except Exception:
+            pass
+        jdbc.connection = None
+
+    def checkout(self, url, usr, pwd, db_name, db_schema, driver_jar, driver_class, auto_commit=False,
+                 upper_case=False) -> Jdbc:
+        """
+        Get a connection from the pool, or open a new one. Same arguments as Jdbc()
+        @return: Jdbc - the connection. Return it with checkin() when done
+        @raises ConnectionError if a new connection could not be established
+        """
+        key = self.key(url, usr, driver_class)
+        jdbc = None
+        with self.condition:
+            while True:
+                idle = self.idle.setdefault(key, [])
+                while (jdbc is None) and (len(idle) > 0):
+                    jdbc = idle.pop()
+                    if not self.is_valid(jdbc):
+                        self.discard(jdbc)
+                        jdbc = None
+                if (jdbc is not None) or (self.in_use.get(key, 0) < self.max_size):
+                    break
+                self.condition.wait()
+            self.in_use[key] = self.in_use.get(key, 0) + 1
+
+        if jdbc is None:
+            try:
+                jdbc = Jdbc(url, usr, pwd, db_name, db_schema, driver_jar, driver_class, auto_commit, upper_case)
+            except Exception:
+                jdbc = None
+            if (jdbc is None) or (jdbc.connection is None):
+                self.release(key)
+                raise ConnectionError('Failed to connect to: ' + url)
+            jdbc.pooled = True
+        else:
+            # the connection may have been used for another schema, or with other settings
+            jdbc.db_name = db_name
+            jdbc.db_schema = db_schema
+            jdbc.upper_case = upper_case
+            if jdbc.auto_commit != auto_commit:
+                jdbc.connection.jconn.setAutoCommit(auto_commit)
+                jdbc.auto_commit = auto_commit
+        return jdbc
+
+    def checkin(self, jdbc: Jdbc):
+        """
+        Return a connection to the pool. Open cursors are closed and uncommitted changes are rolled back
+        @param jdbc: Jdbc - connection obtained with checkout()
+        """
+        if jdbc is None:
+            return
+        key = self.key(jdbc.url, jdbc.usr, jdbc.driver_class)
+        keep = self.is_valid(jdbc)
+        if keep:
+            for cursor in jdbc.cursors:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            jdbc.cursors = []
+            jdbc.current = None
+            try:
+                if not jdbc.auto_commit:
+                    jdbc.connection.rollback()
+            except Exception:
+                keep = False
+
+        with self.condition:
+            idle = self.idle.setdefault(key, [])
+            if keep and (len(idle) < self.max_idle):
+                idle.append(jdbc)
+            else:
+                self.discard(jdbc)
+        self.release(key)
+
+    def release(self, key):
+        with self.condition:
+            self.in_use[key] = max(self.in_use.get(key, 0) - 1, 0)
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, url, usr, pwd, db_name, db_schema, driver_jar, driver_class, auto_commit=False,
+                   upper_case=False):
+        """
+        Context manager for checkout() and checkin()
+        """
+        jdbc = self.checkout(url, usr, pwd, db_name, db_schema, driver_jar, driver_class, auto_commit, upper_case)
+        try:
+            yield jdbc
+        finally:
+            self.checkin(jdbc)
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.condition:
+            for idle in self.idle.values():
+                for jdbc in idle:
+                    self.discard(jdbc)
+            self.idle = dict()
+
+
+def close_unpooled(jdbc: Jdbc):
+    """
+    Close a connection, which was not checked out from a pool. Pooled connections are left open for checkin()
+    """
+    if not getattr(jdbc, 'pooled', False):
+        jdbc.connection.close()
+
+
+JDBC_POOL = JdbcPool()
+# idle connections are closed before the JVM is shut down
+atexit.register(JDBC_POOL.close)
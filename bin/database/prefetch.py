@@ -0,0 +1,121 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Read ahead of a consumer: a worker thread fetches the next batches of a result set, while the
+    caller processes the current one
+"""
+import queue
+import threading
+
+# number of batches fetched ahead. 2: double buffering
+PREFETCH_DEPTH = 2
+PREFETCH_CHUNK_SIZE = 1000
+
+# seconds between checks, whether the consumer has stopped
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class PrefetchError:
+    """
+    Wraps an exception of the worker, to be raised again in the consumer
+    """
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetched(iterable, depth: int = PREFETCH_DEPTH):
+    """
+    Iterate over iterable in a worker thread, at most depth items ahead of the caller.
+    Exceptions of the worker are raised in the caller. If the caller stops early (break, close()),
+    the worker stops after the item it is fetching, and the source iterator is closed.
+
+    @param iterable: iterable - e.g. the batches of Jdbc.get_batches(). The worker is the only thread using it
+    @param depth: int - maximum number of items in the queue. Iterated without thread if < 1
+    @return: generator of the items of iterable
+    """
+    if depth < 1:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def work():
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put(item):
+                    break
+            else:
+                put(_DONE)
+        except BaseException as error:
+            put(PrefetchError(error))
+        finally:
+            if stopped.is_set() and hasattr(source, 'close'):
+                source.close()
+
+    worker = threading.Thread(target=work, name='prefetch', daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            if isinstance(item, PrefetchError):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        worker.join()
+
+
+def chunked(rows, chunk_size: int = PREFETCH_CHUNK_SIZE):
+    """
+    @return: generator of lists of at most chunk_size rows
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def prefetch_rows(rows, depth: int = PREFETCH_DEPTH, chunk_size: int = PREFETCH_CHUNK_SIZE):
+    """
+    Prefetch a row iterator (e.g. get_data() of any Jdbc class) in chunks of rows
+    @return: generator of the rows. The rows themselves if depth < 1
+    """
+    if depth < 1:
+        yield from rows
+        return
+    for chunk in prefetched(chunked(rows, chunk_size), depth):
+        yield from chunk
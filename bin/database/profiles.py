@@ -0,0 +1,144 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Performance settings per jdbc driver: fetch size, url and connection properties.
+
+    The profiles are applied by Jdbc. They may be overridden per project in pwcode.xml:
+
+    <options>
+      <driver_profiles>
+        <oracle>
+          <fetch_size>5000</fetch_size>
+          <properties>defaultRowPrefetch=5000</properties>
+        </oracle>
+      </driver_profiles>
+    </options>
+
+    Properties are given as key=value pairs, separated by ';'
+"""
+import copy
+import os
+import xml.etree.ElementTree as ET
+
+from collections import OrderedDict
+
+
+class DriverProfile:
+    def __init__(self, name: str, fetch_size: int = 0, url_properties: OrderedDict = None,
+                 url_separator: str = ';', properties: OrderedDict = None, read_only: bool = False):
+        """
+        @param name: str - name of the profile, also used as tag in pwcode.xml
+        @param fetch_size: int - rows per round trip (Statement.setFetchSize). Driver default if 0
+        @param url_properties: OrderedDict - properties added to the url, if not already present
+        @param url_separator: str - ';' for url;key=value, '&' for url?key=value&key=value
+        @param properties: OrderedDict - connection properties, next to user and password
+        @param read_only: bool - open the connection read only
+        """
+        self.name = name
+        self.fetch_size = fetch_size
+        self.url_properties = OrderedDict(url_properties or [])
+        self.url_separator = url_separator
+        self.properties = OrderedDict(properties or [])
+        self.read_only = read_only
+
+    def apply_url(self, url: str) -> str:
+        """
+        @return: str - the url with the url properties, which are not set yet
+        """
+        for key, value in self.url_properties.items():
+            if key.upper() + '=' in url.upper():
+                continue
+            if self.url_separator == ';':
+                url = url.rstrip(';') + ';' + key + '=' + value
+            else:
+                url = url + ('&' if '?' in url else '?') + key + '=' + value
+        return url
+
+
+DEFAULT_PROFILE = DriverProfile('default')
+
+# profiles by driver class
+DRIVER_PROFILES = {
+    'org.h2.Driver': DriverProfile(
+        'h2', fetch_size=1000, url_properties=OrderedDict([('LAZY_QUERY_EXECUTION', '1')])),
+    'org.hsqldb.jdbc.JDBCDriver': DriverProfile(
+        'hsqldb', fetch_size=1000, url_properties=OrderedDict([('AUTOCOMMIT', 'FALSE')])),
+    # driver default buffering (adaptive) with the fetch size. selectMethod=cursor forces a server side cursor
+    # for every statement: set it in pwcode.xml if needed
+    'com.microsoft.sqlserver.jdbc.SQLServerDriver': DriverProfile('sqlserver', fetch_size=10000),
+    'com.mysql.cj.jdbc.Driver': DriverProfile(
+        'mysql', fetch_size=10000, url_separator='&',
+        url_properties=OrderedDict([('useCursorFetch', 'true'), ('defaultFetchSize', '10000'),
+                                    ('rewriteBatchedStatements', 'true')])),
+    'org.postgresql.Driver': DriverProfile(
+        'postgresql', fetch_size=10000, url_separator='&',
+        url_properties=OrderedDict([('defaultRowFetchSize', '10000'), ('reWriteBatchedInserts', 'true')])),
+    # oracle allocates the fetch buffer for the maximum column sizes: keep it moderate
+    'oracle.jdbc.OracleDriver': DriverProfile(
+        'oracle', fetch_size=1000, properties=OrderedDict([('defaultRowPrefetch', '1000')])),
+    'org.sqlite.JDBC': DriverProfile('sqlite'),
+}
+
+
+def get_profile(driver_class: str) -> DriverProfile:
+    """
+    @param driver_class: str - jdbc driver class
+    @return: DriverProfile - the profile of the driver, or the default profile
+    """
+    return DRIVER_PROFILES.get(driver_class, DEFAULT_PROFILE)
+
+
+def parse_properties(text: str) -> OrderedDict:
+    properties = OrderedDict()
+    for item in [i.strip() for i in text.split(';') if '=' in i]:
+        key, value = item.split('=', 1)
+        properties[key.strip()] = value.strip()
+    return properties
+
+
+def override_profile(profile: DriverProfile, settings) -> DriverProfile:
+    """
+    @param settings: Element - profile element from pwcode.xml
+    @return: DriverProfile - a copy of the profile with the settings of the element
+    """
+    profile = copy.deepcopy(profile)
+    fetch_size = settings.findtext('fetch_size')
+    if fetch_size:
+        profile.fetch_size = int(fetch_size)
+    url_properties = settings.findtext('url_properties')
+    if url_properties:
+        profile.url_properties.update(parse_properties(url_properties))
+    properties = settings.findtext('properties')
+    if properties:
+        profile.properties.update(parse_properties(properties))
+    read_only = settings.findtext('read_only')
+    if read_only:
+        profile.read_only = read_only.strip().lower() in ['true', 'yes', '1']
+    return profile
+
+
+def load_profile_overrides(config_path: str):
+    """
+    Apply the driver profiles in options/driver_profiles of a pwcode.xml to this process
+    """
+    if not os.path.isfile(config_path):
+        return
+    root = ET.parse(config_path).getroot()
+    for settings in root.findall('options/driver_profiles/*'):
+        for driver_class, profile in DRIVER_PROFILES.items():
+            if profile.name == settings.tag:
+                DRIVER_PROFILES[driver_class] = override_profile(profile, settings)
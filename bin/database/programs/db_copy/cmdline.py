@@ -21,18 +21,20 @@
 
 
 import argparse
-import lwetl
 
 from collections import OrderedDict
 
+from ...uploader import NativeUploader, ParameterUploader, MultiParameterUploader
+
 DRIVER_NATIVE = 'native'
 DRIVER_SINGLE = 'single'
 DRIVER_MULTI = 'multi'
 
 UPLOADERS = OrderedDict()
-UPLOADERS[DRIVER_NATIVE] = lwetl.NativeUploader
-UPLOADERS[DRIVER_SINGLE] = lwetl.ParameterUploader
-UPLOADERS[DRIVER_MULTI] = lwetl.MultiParameterUploader
+# the uploaders of this package: they roll back and discard a failed batch, and share the PK counters
+UPLOADERS[DRIVER_NATIVE] = NativeUploader
+UPLOADERS[DRIVER_SINGLE] = ParameterUploader
+UPLOADERS[DRIVER_MULTI] = MultiParameterUploader
 
 COPY_EMPTY = 'empty'
 COPY_NEW = 'new'
@@ -87,6 +89,13 @@ Useful for copying live databases where reference tables are updated during the
 A negative number implies no fail limit. Defaults to 0 (no failure allowed).
 For ignoring commit errors, also add the --ignore flag. This may result in undesired behaviour.''')
 
+parser.add_argument(
+    '-j', '--jobs', action='store', type=int,
+    dest='jobs',
+    default=1,
+    help='''Number of tables copied concurrently, each over its own source and target connection.
+A table is started as soon as all tables it references are copied. Defaults to 1.''')
+
 parser.add_argument(
     '-l', '--list', action='store_true',
     help='Only list the commit tables and exit.')
@@ -96,7 +105,21 @@ parser.add_argument(
     dest='commit_nr',
     default=2000,
     help='''commit uploads every nr rows. Defaults to 2000.
-set to 1 if there are self refering FK (very slow)''')
+set to 1 if there are self refering FK (very slow)
+With --commit_time the number is adapted per table, starting from this value''')
+
+parser.add_argument(
+    '--commit_time', action='store', type=float,
+    dest='commit_time',
+    default=0.0,
+    help='''Target time per commit in seconds, e.g. 2. The commit size of each table then starts at --commit,
+and grows or shrinks towards it. Defaults to 0: fixed commit size. Not used with --commit 1''')
+
+parser.add_argument(
+    '--batch_memory', action='store', type=int,
+    dest='batch_memory',
+    default=64,
+    help='Memory ceiling in MB for the rows of one commit. Defaults to 64')
 
 parser.add_argument(
     '-r', '--rows', action='store', type=int,
@@ -104,6 +127,13 @@ parser.add_argument(
     default=0,
     help='Limit the maximum number of rows to copy or update per table. Use <= 0 for all (default).')
 
+parser.add_argument(
+    '--prefetch', action='store', type=int,
+    dest='prefetch',
+    default=0,
+    help='''Number of row batches read ahead from the source in a background thread,
+while the current batch is uploaded, e.g. 2. Defaults to 0: no read ahead.''')
+
 parser.add_argument(
     '-s', '--statistics', action='store_true',
     help='Print some timing statisics on exit.')
@@ -118,12 +148,14 @@ parser.add_argument(
 parser.add_argument(
     '--driver', action='store', type=str,
     dest='driver',
-    default='single',
+    default='multi',
     choices=list(UPLOADERS.keys()),
     help='''Specify the upload mode:
 - native: use native SQL (does not permit transfer of binary data)
-- single: parse single parameterized sqls to the target server (DEFAULT).
-- multi:  parse an sql with multiple parameter rows in a single commit (not compatible with update mode 'update' and 'sync').''')
+- single: parse single parameterized sqls to the target server.
+- multi:  parse an sql with multiple parameter rows (batches of --commit rows) in a single commit (DEFAULT).
+          A failed batch is rolled back and counts as one fail.
+          Not compatible with update mode 'update' and 'sync': single is used instead.''')
 
 parser.add_argument(
     '--ignore', action='store_true',
@@ -27,13 +27,26 @@ import lwetl
 import os
 import sys
 
+import heapq
+import itertools
+import threading
+
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
+from decimal import Decimal
+from functools import partial
 
 from .cmdline import \
     DRIVER_SINGLE, DRIVER_MULTI, UPLOADERS, \
     COPY_EMPTY, COPY_AND_UPDATE, COPY_AND_SYNC, parser
 
+from .planner import copy_order, print_broken_cycles, table_dependencies
+from ...batch_size import BatchSizer, estimate_row_bytes, get_batch_size_statistics
+from ...exceptions import SQLExcecuteException, CommitException
+from ...uploader import UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK
+from ...prefetch import prefetch_rows
+from ...row_count import RowCounter
 from lwetl.version import __version__
 from lwetl.queries import content_queries
 from lwetl.runtime_statistics import timedelta_to_string, tag_connection, get_execution_statistics
@@ -48,30 +61,7 @@ COMMON, EMPTY, IGNORED, MISSING, NO_SOURCE = 'common', 'empty', 'ignored', 'miss
 CNT_COPIED_TABLES = 'copied tables'
 CNT_FAIL = 'fails'
 
-
-def referring_tables(table_list: list, table_dict: dict, excluded=None):
-    """
-    Scan for tables, which are both in the input list and referenced by
-    other tables in the table_list (FK reference)
-    Exclude tables in the exluded list
-
-    @param table_list: list of tables to scan
-    @param table_dict: dict with FK reference info of all tables
-    @param excluded: list of excluded tables
-    @return: list of tables, which are referenced
-    """
-    if excluded is None:
-        excluded = []
-    assert isinstance(table_list, list)
-    assert isinstance(excluded, list)
-    assert isinstance(table_dict, dict)
-
-    fk_tables = []
-    for table in table_list:
-        for column_info in table_dict[table].values():
-            if (column_info[0] not in fk_tables) and (table != column_info[0]) and (column_info[0] not in excluded):
-                fk_tables.append(column_info[0])
-    return sorted(fk_tables)
+COUNTER_LOCK = threading.Lock()
 
 
 def print_list(label, table_list, tc=None):
@@ -113,6 +103,9 @@ def estimate_remaining(t0, rc, n):
 def clean_exit(jdbc_connections, args, exit_code):
     if args.statistics:
         print(get_execution_statistics())
+        batch_sizes = get_batch_size_statistics()
+        if batch_sizes:
+            print(batch_sizes)
     jdbc_connections[SRC].close()
     jdbc_connections[TRG].close()
     sys.exit(exit_code)
@@ -122,6 +115,355 @@ class TooMayErrorsException(Exception):
     pass
 
 
+# errors of the uploaders (this package), and of the lwetl connections they execute on
+UPLOAD_ERRORS = (SQLExcecuteException, lwetl.SQLExcecuteException)
+
+
+def stream_keys(login, sql, fetch_size=10000):
+    """
+    Stream the first column of a query on a dedicated connection. On the connection of the uploader,
+    the commits and other statements would close or block the open result set (e.g. PostgreSQL, MySQL)
+    @param login: str - login of the target database
+    """
+    jdbc = lwetl.Jdbc(login)
+    try:
+        cursor = jdbc.connection.cursor()
+        try:
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[0]
+        finally:
+            cursor.close()
+    finally:
+        jdbc.close()
+
+
+def sorted_merge(source_rows, target_keys, pk, descending=False):
+    """
+    Merge-join of source rows and target keys, both sorted on the primary key. Uses constant memory.
+    @param source_rows: iterable of dict - source records
+    @param target_keys: iterable - primary keys of the target table
+    @param pk: str - name of the primary key in the source records
+    @param descending: bool - both inputs are sorted in descending order
+    @return: generator of tuples (record, key, exists in target). The record is None for keys,
+        which only exist in the target
+    """
+    if descending:
+        def before(a, b):
+            return a > b
+    else:
+        def before(a, b):
+            return a < b
+
+    target = iter(target_keys)
+    t_key = next(target, None)
+    for d in source_rows:
+        key = d[pk]
+        while (t_key is not None) and before(t_key, key):
+            yield None, t_key, True
+            t_key = next(target, None)
+        if (t_key is not None) and (t_key == key):
+            yield d, key, True
+            t_key = next(target, None)
+        else:
+            yield d, key, False
+    while t_key is not None:
+        yield None, t_key, True
+        t_key = next(target, None)
+
+
+def set_merge(source_rows, target_keys, pk):
+    """
+    Like sorted_merge, for keys which may not sort the same in the source and target database (e.g. strings).
+    Holds the target keys in memory.
+    """
+    existing_records = set(target_keys)
+    for d in source_rows:
+        key = d[pk]
+        if key in existing_records:
+            existing_records.remove(key)
+            yield d, key, True
+        else:
+            yield d, key, False
+    for key in sorted(existing_records):
+        yield None, key, True
+
+
+def merge_records(source_rows, target_keys, pk, descending=False):
+    """
+    Classify source records against the target keys. Numeric keys are merged as sorted streams
+    """
+    target_keys = iter(target_keys)
+    first = next(target_keys, None)
+    if first is None:
+        return ((d, d[pk], False) for d in source_rows)
+    target_keys = itertools.chain([first], target_keys)
+    if isinstance(first, (int, float, Decimal)) and not isinstance(first, bool):
+        return sorted_merge(source_rows, target_keys, pk, descending)
+    return set_merge(source_rows, target_keys, pk)
+
+
+def delete_batch(trg, t, pk_trg, delete_list, counters, args):
+    par_list = ['?'] * len(delete_list)
+    sql = 'DELETE FROM {0} WHERE {1} IN ({2})'.format(t, pk_trg, ','.join(par_list))
+    try:
+        trg.execute(sql, delete_list, cursor=None)
+    except lwetl.SQLExcecuteException as delete_exception:
+        n_fail = add_fails(counters, len(delete_list))
+        print(delete_exception)
+        print('Delete error (%d) in table %s on rows %s' %
+              (n_fail, t, ', '.join([str(pk) for pk in delete_list])))
+        if (args.max_fail >= 0) and (n_fail > args.max_fail):
+            print('Too many errors: terminating.')
+            raise TooMayErrorsException(
+                'Insert, Update, and Delete failed %d times' % n_fail)
+
+
+def add_fails(counters, n=1) -> int:
+    """
+    Thread-safe increment of the fail counter
+    @return: int - the new number of fails
+    """
+    with COUNTER_LOCK:
+        counters[CNT_FAIL] += n
+        return counters[CNT_FAIL]
+
+
+def commit_batch(uploader, counters, args, row_count):
+    """
+    Commit the rows buffered in the uploader. With the multi driver, the rows are sent to the
+    target as one batch here, so insert errors surface on commit and count as one fail per batch.
+    The uploader rolls back and discards a failed batch.
+    """
+    try:
+        uploader.commit()
+    except UPLOAD_ERRORS as batch_exception:
+        n_fail = add_fails(counters)
+        print('Batch insert error (%d) before row %d: %s' % (n_fail, row_count, str(batch_exception)))
+        if (args.max_fail >= 0) and (n_fail > args.max_fail):
+            print('Too many errors: terminating.')
+            raise TooMayErrorsException('Batch insert failed %d times' % n_fail)
+
+
+def copy_table(t, src, trg, args, table_count, pk_info, commit_mode, counters, n_tables) -> bool:
+    """
+    Copy a single table from the source to the target connection
+    @param t: str - name of the table
+    @param src: Jdbc - source connection
+    @param trg: Jdbc - target connection
+    @param n_tables: int - total number of tables to copy (for the printout)
+    @return: bool - True if the copy process must be terminated
+    """
+    with COUNTER_LOCK:
+        counters[CNT_COPIED_TABLES] += 1
+        nr = counters[CNT_COPIED_TABLES]
+    n, n2 = table_count[t]
+    print("CC %3d. of %d: copy %-30s n = %6d values (PK = %s) ......." % (
+        nr, n_tables, t, n, pk_info[SRC][t]))
+
+    too_many_errors = False
+    is_update = args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC]
+
+    # target primary key
+    pk_trg = pk_info[TRG][t]
+    if args.reverse_insert or args.update_fast:
+        pk_order = 'DESC'
+    else:
+        pk_order = 'ASC'
+    existing_records = []
+    if (n2 > 0) and (args.mode != COPY_EMPTY):
+        print('Merging with %d existing records' % n2)
+        existing_records = stream_keys(args.login_target, "SELECT {0} FROM {1} ORDER BY {0} {2}".format(pk_trg, t, pk_order))
+
+    try:
+        cursor = src.execute('SELECT * FROM {} ORDER BY {} {}'.format(
+            t, pk_info[SRC][t], pk_order),cursor=None)
+    except lwetl.SQLExcecuteException as exec_error:
+        print('ERROR: table %s skipped on SQL retrieve error: ' + str(exec_error))
+        return True
+
+    row_count = 0
+    skp_count = 0
+    upd_count = 0
+    new_count = 0
+    del_count = 0
+    delete_list = []
+    t0_table = datetime.now()
+    # a commit size of 1 is needed for self referring foreign keys: keep it fixed
+    sizer = BatchSizer(t, initial=args.commit_nr, target_seconds=args.commit_time if args.commit_nr > 1 else 0,
+                       max_bytes=args.batch_memory * 1024 * 1024)
+    # batches are timed on the query time (execute and commit) of the target connection, so that fetching
+    # and merging the source rows do not count. On the wall clock, if the connection has no statistics
+    statistics = getattr(trg, 'statistics', None)
+    if not hasattr(statistics, 'query_time'):
+        statistics = None
+    try:
+        with UPLOADERS[args.driver](trg, t.lower(), commit_mode=commit_mode) as uploader:
+            sizer.start(statistics)
+            source_rows = prefetch_rows(src.get_data(cursor=cursor, return_type=dict, include_none=is_update),
+                                        args.prefetch)
+            for d, pk, record_exists in merge_records(source_rows, existing_records, pk_trg, pk_order == 'DESC'):
+                if d is None:
+                    # only in the target
+                    if args.mode == COPY_AND_SYNC:
+                        delete_list.append(pk)
+                        if len(delete_list) >= 500:
+                            delete_batch(trg, t, pk_trg, delete_list, counters, args)
+                            del_count += len(delete_list)
+                            delete_list = []
+                    continue
+                row_count += 1
+                if sizer.row_bytes is None:
+                    sizer.set_row_bytes(estimate_row_bytes(d))
+
+                if record_exists and (not is_update):
+                    skp_count += 1
+                    if args.update_fast:
+                        print('Huristic fast update of %s. Skipping at rowcount %d' % (t, row_count))
+                        break
+                else:
+                    try:
+                        if record_exists:
+                            del d[pk_trg]
+                            uploader.update(d, {pk_trg: pk})
+                            upd_count += 1
+                        else:
+                            if is_update:
+                                none_keys = [c for c, v in d.items() if v is None]
+                                for k in none_keys:
+                                    del d[k]
+                            uploader.insert(d)
+                            new_count += 1
+                    except UPLOAD_ERRORS as insert_exception:
+                        n_fail = add_fails(counters)
+                        print('Insert error (%d) on row %d: %s' % (
+                            n_fail, row_count, str(insert_exception)))
+                        if (args.max_fail >= 0) and (n_fail > args.max_fail):
+                            print('Too many errors: terminating.')
+                            too_many_errors = True
+                    if too_many_errors:
+                        raise TooMayErrorsException('Insert or Update failed %d times' % counters[CNT_FAIL])
+
+                has_commit = False
+                if uploader.row_count >= sizer.size:
+                    batch_rows = uploader.row_count
+                    commit_batch(uploader, counters, args, row_count)
+                    sizer.stop(batch_rows, statistics)
+                    sizer.start(statistics)
+                    has_commit = True
+                if has_commit or ((row_count % args.commit_nr) == 0):
+                    print(
+                        '%8d. %5.1f %% of %d records, new: %8d, upd: %8d, ign: %8d. %s. Est. remaining time: %s' %
+                        (row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
+                         estimate_remaining(t0_table, row_count, n)))
+                if (args.max_rows > 0) and ((new_count + upd_count) > args.max_rows):
+                    print('Terminating after %d uploads on user request.' % row_count)
+                    break
+            source_rows.close()
+            if len(delete_list) > 0:
+                delete_batch(trg, t, pk_trg, delete_list, counters, args)
+                del_count += len(delete_list)
+            if del_count > 0:
+                print('Sync: removed %d obsolete records in %s (target)' % (del_count, t))
+            if uploader.row_count > 0:
+                commit_batch(uploader, counters, args, row_count)
+                print(
+                    '%8d. %5.1f %% of %d records, new: %8d, upd: %8d, ign: %8d. %s. finished' %
+                    (row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t))
+            else:
+                print('Update of %s finished, No further commits. rc = %d' % (t,row_count))
+
+            if (new_count + upd_count) > 0:
+                dt = datetime.now() - t0_table
+                dt_sec = dt.total_seconds()
+                if dt_sec > 0:
+                    rec_per_sec = int(round(1.0 * n / dt_sec))
+                else:
+                    rec_per_sec = 0
+                print(
+                    '%8d. %5.1f %% of %d records, new: %8d, upd: %8d, ign: %8d. %s. Used time: %s (%d rec/s)' %
+                    (row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
+                     timedelta_to_string(dt), rec_per_sec))
+
+        if (args.mode == COPY_AND_SYNC) and (del_count > 0):
+            if commit_mode == UPLOAD_MODE_COMMIT:
+                trg.commit()
+            else:
+                trg.rollback()
+
+    except (lwetl.CommitException, CommitException) as ce:
+        n_fail = add_fails(counters)
+        if not (args.ignore_commit_errors and (args.max_fail > 0) and (n_fail <= args.max_fail)):
+            print('Upload encountered a commit exception row {}. Further processing ignored: {}'.format(row_count, str(ce)),
+                  file=sys.stderr)
+            too_many_errors = True
+    except TooMayErrorsException as tee:
+        print('Upload encountered on row {}. Further processing ignored: {}'.format(row_count,str(tee)),
+              file=sys.stderr)
+        too_many_errors = True
+    finally:
+        if hasattr(existing_records, 'close'):
+            existing_records.close()
+    return too_many_errors
+
+
+def copy_tables(copy_list: list, dependencies: dict, connection_pairs: list, copy_function, table_count: dict) -> bool:
+    """
+    Copy tables concurrently, one table at a time for each connection pair. A table is started as soon as
+    all tables it depends on are copied. Ready tables are started in the order of the copy list.
+
+    @param copy_list: list - tables to copy in a dependency-safe order
+    @param dependencies: dict - for each table, the set of tables in the copy list, which must be copied first
+    @param connection_pairs: list of (source, target) Jdbc connections
+    @param copy_function: function(table, source, target), which returns True if the process must be terminated
+    @param table_count: dict of row counts (source, target) for each table
+    @return: bool - True if the copy process was terminated
+    """
+    position = dict([(t, x) for x, t in enumerate(copy_list)])
+    waiting = dict([(t, set(dependencies.get(t, []))) for t in copy_list])
+    dependents = dict([(t, []) for t in copy_list])
+    for t, deps in waiting.items():
+        for d in deps:
+            dependents[d].append(t)
+    ready = [(position[t], t) for t in copy_list if len(waiting[t]) == 0]
+    heapq.heapify(ready)
+
+    free_pairs = list(connection_pairs)
+    running = dict()
+    n_done, n_total = 0, sum([table_count[t][0] for t in copy_list])
+    t_done = 0
+    t0 = datetime.now()
+    terminated = False
+    with ThreadPoolExecutor(max_workers=len(connection_pairs)) as executor:
+        while True:
+            while (not terminated) and (len(ready) > 0) and (len(free_pairs) > 0):
+                x, t = heapq.heappop(ready)
+                pair = free_pairs.pop()
+                running[executor.submit(copy_function, t, pair[0], pair[1])] = t, pair
+            if len(running) == 0:
+                break
+            finished, not_finished = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for future in finished:
+                t, pair = running.pop(future)
+                free_pairs.append(pair)
+                if future.result():
+                    terminated = True
+                    continue
+                for d in dependents[t]:
+                    waiting[d].discard(t)
+                    if len(waiting[d]) == 0:
+                        heapq.heappush(ready, (position[d], d))
+                t_done += 1
+                n_done += table_count[t][0]
+                print('Finished %s: %d of %d tables, %d of %d records. Est. remaining time: %s' % (
+                    t, t_done, len(copy_list), n_done, n_total, estimate_remaining(t0, n_done, n_total)))
+    return terminated
+
+
 def main():
     if (len(sys.argv) > 1) and (sys.argv[1].lower() == '--version'):
         print('%s, version: %s' % (os.path.basename(sys.argv[0]), __version__))
@@ -202,11 +544,18 @@ def main():
     for t in [COMMON, EMPTY, IGNORED, MISSING, NO_SOURCE]:
         table_admin[t] = []
 
+    # Empty tables are detected exactly. Other row counts are catalog estimates where available
+    common_tables = sorted([k for k in table_info[SRC].keys() if k in table_info[TRG]])
+    row_counts = dict()
+    for key, login in [(SRC, args.login_source), (TRG, args.login_target)]:
+        counter = RowCounter(jdbc[key], connect=partial(lwetl.Jdbc, login), db_type=jdbc[key].type,
+                             schema=jdbc[key].schema, table_ref=str)
+        row_counts[key] = counter.counts(common_tables)
+
     table_count = dict()
-    for t in sorted([k for k in table_info[SRC].keys() if k in table_info[TRG]]):
-        sql = 'SELECT COUNT(*) FROM ' + t
-        n1 = jdbc[SRC].get_int(sql)
-        n2 = jdbc[TRG].get_int(sql)
+    for t in common_tables:
+        n1 = row_counts[SRC][t]
+        n2 = row_counts[TRG][t]
         table_count[t] = n1, n2
         if (t not in excluded_tables) and \
                 ((len(included_tables) == 0) or (t in included_tables)):
@@ -230,19 +579,9 @@ def main():
     nosource_tables = sorted([k for k in table_info[TRG].keys() if k not in table_info[SRC]])
     print_list('Missing source:', nosource_tables)
 
-    common_tables = table_admin[COMMON]
-    if len(common_tables) < 2:
-        copy_list = common_tables
-    else:
-        # re-order the list of tables, to avoid FK violations
-        copy_list = []
-        while len(copy_list) < len(common_tables):
-            not_added = [t for t in common_tables if t not in copy_list]
-            refered_tables = referring_tables(not_added, table_info[TRG], copy_list)
-            while len(refered_tables) > 0:
-                not_added = [t for t in refered_tables]
-                refered_tables = referring_tables(not_added, table_info[TRG], copy_list)
-            copy_list += not_added
+    # re-order the list of tables, to avoid FK violations
+    copy_list, broken_cycles = copy_order(table_admin[COMMON], table_info[TRG])
+    print_broken_cycles(broken_cycles)
 
     if n_excluded > 0:
         print_list('Skipped tables', copy_list[:n_excluded], table_count)
@@ -256,170 +595,47 @@ def main():
         print('No tables to copy found: exiting.')
         clean_exit(jdbc, args, 0)
 
-    commit_mode = lwetl.UPLOAD_MODE_ROLLBACK
+    commit_mode = UPLOAD_MODE_ROLLBACK
     if args.activate:
         print('Activating upload.')
-        commit_mode = lwetl.UPLOAD_MODE_COMMIT
+        commit_mode = UPLOAD_MODE_COMMIT
 
     if (args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC]) and (args.driver == DRIVER_MULTI):
         print('WARNING: multi mode not supported for updates. Switching to single.')
-        args.mode = DRIVER_SINGLE
+        args.driver = DRIVER_SINGLE
 
     counters = {
         CNT_COPIED_TABLES: 0,
         CNT_FAIL: 0
     }
 
-    too_many_errors = False
-    is_update = args.mode in [COPY_AND_UPDATE, COPY_AND_SYNC]
-    for t in copy_list:
-        counters[CNT_COPIED_TABLES] += 1
-        n, n2 = table_count[t]
-        print("CC %3d. of %d: copy %-30s n = %6d values (PK = %s) ......." % (
-            counters[CNT_COPIED_TABLES], len(copy_list), t, n, pk_info[SRC][t]))
-
-        existing_records = []
-        # target primary key
-        pk_trg = pk_info[TRG][t]
-        if (n2 > 0) and (args.mode != COPY_EMPTY):
-            for r in jdbc[TRG].query("SELECT {0} FROM {1} ORDER BY {0}".format(pk_trg, t)):
-                existing_records.append(r[0])
-            print('Found %d existing records from %s to %s' % (
-                len(existing_records), min(existing_records), max(existing_records)))
-        existing_records = set(existing_records)
-
-        try:
-            if args.reverse_insert or args.update_fast:
-                pk_order = 'DESC'
-            else:
-                pk_order = 'ASC'
-            cursor = jdbc[SRC].execute('SELECT * FROM {} ORDER BY {} {}'.format(
-                t, pk_info[SRC][t], pk_order),cursor=None)
-        except lwetl.SQLExcecuteException as exec_error:
-            print('ERROR: table %s skipped on SQL retrieve error: ' + str(exec_error))
-            too_many_errors = True
-            cursor = None
-        if too_many_errors:
-            break
+    # tables in the copy list, which must be copied before each table
+    position = dict([(t, x) for x, t in enumerate(copy_list)])
+    dependencies = table_dependencies(copy_list, table_info[TRG])
+    for t, deps in dependencies.items():
+        dependencies[t] = set([fk for fk in deps if position[fk] < position[t]])
 
-        row_count = 0
-        skp_count = 0
-        upd_count = 0
-        new_count = 0
-        found_records = []
-        t0_table = datetime.now()
+    connection_pairs = [(jdbc[SRC], jdbc[TRG])]
+    for x in range(1, max(args.jobs, 1)):
         try:
-            with UPLOADERS[args.driver](jdbc[TRG], t.lower(), commit_mode=commit_mode) as uploader:
-                for d in jdbc[SRC].get_data(cursor=cursor, return_type=dict, include_none=is_update):
-                    row_count += 1
-
-                    pk = d[pk_trg]
-                    if args.mode == COPY_AND_SYNC:
-                        found_records.append(pk)
-                    record_exists = (pk in existing_records)
-                    if record_exists and (not is_update):
-                        skp_count += 1
-                        if args.update_fast:
-                            print('Huristic fast update of %s. Skipping at rowcount %d' % (t, row_count))
-                            break
-                    else:
-                        try:
-                            if record_exists:
-                                del d[pk_trg]
-                                uploader.update(d, {pk_trg: pk})
-                                upd_count += 1
-                            else:
-                                if is_update:
-                                    none_keys = [c for c, v in d.items() if v is None]
-                                    for k in none_keys:
-                                        del d[k]
-                                uploader.insert(d)
-                                new_count += 1
-                        except lwetl.SQLExcecuteException as insert_exception:
-                            counters[CNT_FAIL] += 1
-                            print('Insert error (%d) on row %d: %s' % (
-                                counters[CNT_FAIL], row_count, str(insert_exception)))
-                            if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
-                                print('Too many errors: terminating.')
-                                too_many_errors = True
-                        if too_many_errors:
-                            raise TooMayErrorsException('Insert or Update failed %d times' % counters[CNT_FAIL])
-
-                    has_commit = False
-                    if uploader.row_count >= args.commit_nr:
-                        uploader.commit()
-                        has_commit = True
-                    if has_commit or ((row_count % args.commit_nr) == 0):
-                        print(
-                            '%8d. %5.1f %% of %d records, new: %8d, upd: %8d, ign: %8d. %s. Est. remaining time: %s' %
-                            (row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
-                             estimate_remaining(t0_table, row_count, n)))
-                    if (args.max_rows > 0) and ((new_count + upd_count) > args.max_rows):
-                        print('Terminating after %d uploads on user request.' % row_count)
-                        break
-                if uploader.row_count > 0:
-                    uploader.commit()
-                    print(
-                        '%8d. %5.1f %% of %d records, new: %8d, upd: %8d, ign: %8d. %s. finished' %
-                        (row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t))
-                else:
-                    print('Update of %s finished, No further commits. rc = %d' % (t,row_count))
-
-                if (new_count + upd_count) > 0:
-                    dt = datetime.now() - t0_table
-                    dt_sec = dt.total_seconds()
-                    if dt_sec > 0:
-                        rec_per_sec = int(round(1.0 * n / dt_sec))
-                    else:
-                        rec_per_sec = 0
-                    print(
-                        '%8d. %5.1f %% of %d records, new: %8d, upd: %8d, ign: %8d. %s. Used time: %s (%d rec/s)' %
-                        (row_count, (100.0 * row_count / n), n, new_count, upd_count, skp_count, t,
-                         timedelta_to_string(dt), rec_per_sec))
-
-            if args.mode == COPY_AND_SYNC:
-                to_delete = list(existing_records - set(found_records))
-                if len(to_delete) > 0:
-                    print('Sync: removing %d obsolete records in %s (target)' % (len(to_delete), t))
-                    while len(to_delete) > 0:
-                        if len(to_delete) > 500:
-                            delete_list = to_delete[0:500]
-                            to_delete = to_delete[500:]
-                        else:
-                            delete_list = [pk for pk in to_delete]
-                            to_delete = []
-                        par_list = ['?'] * len(delete_list)
-                        sql = 'DELETE FROM {0} WHERE {1} IN ({2})'.format(t, pk_trg, ','.join(par_list))
-                        try:
-                            jdbc[TRG].execute(sql, delete_list, cursor=None)
-                        except lwetl.SQLExcecuteException as delete_exception:
-                            counters[CNT_FAIL] += len(delete_list)
-                            print(delete_exception)
-                            print('Delete error (%d) in table %s on rows %s' %
-                                  (counters[CNT_FAIL], t, ', '.join([str(pk) for pk in delete_list])))
-                            if (args.max_fail >= 0) and (counters[CNT_FAIL] > args.max_fail):
-                                print('Too many errors: terminating.')
-                                too_many_errors = True
-                            if too_many_errors:
-                                raise TooMayErrorsException(
-                                    'Insert, Update, and Delete failed %d times' % counters[CNT_FAIL])
-                    if commit_mode == lwetl.UPLOAD_MODE_COMMIT:
-                        jdbc[TRG].commit()
-                    else:
-                        jdbc[TRG].rollback()
-
-        except lwetl.CommitException as ce:
-            counters[CNT_FAIL] += 1
-            if not (args.ignore_commit_errors and (args.max_fail > 0) and (counters[CNT_FAIL] <= args.max_fail)):
-                print('Upload encountered a commit exception row {}. Further processing ignored: {}'.format(row_count, str(ce)),
-                      file=sys.stderr)
-                too_many_errors = True
-        except TooMayErrorsException as tee:
-            print('Upload encountered on row {}. Further processing ignored: {}'.format(row_count,str(tee)),
-                  file=sys.stderr)
-            too_many_errors = True
-        if too_many_errors:
+            src, trg = lwetl.Jdbc(args.login_source), lwetl.Jdbc(args.login_target)
+        except (lwetl.ServiceNotFoundException, lwetl.DriverNotFoundException, ConnectionError) as login_error:
+            print('WARNING: cannot open more than %d connection pairs: %s' % (len(connection_pairs), str(login_error)))
             break
+        tag_connection(SRC, src)
+        tag_connection(TRG, trg)
+        connection_pairs.append((src, trg))
+    if len(connection_pairs) > 1:
+        print('Copying with %d concurrent connection pairs.' % len(connection_pairs))
+
+    copy_function = partial(copy_table, args=args, table_count=table_count, pk_info=pk_info,
+                            commit_mode=commit_mode, counters=counters, n_tables=len(copy_list))
+    try:
+        too_many_errors = copy_tables(copy_list, dependencies, connection_pairs, copy_function, table_count)
+    finally:
+        for src, trg in connection_pairs[1:]:
+            src.close()
+            trg.close()
 
     if counters[CNT_FAIL] > 0:
         print('WARNING: not all data has been transfered. Errors = %d' % counters[CNT_FAIL])
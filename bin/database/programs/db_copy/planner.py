@@ -0,0 +1,97 @@
+# GPL3 License
+
+# Copyright 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Order tables for copying, so that referenced tables are copied before the tables that refer to them
+"""
+
+from toposort import toposort, CircularDependencyError
+
+
+def table_dependencies(table_list: list, table_dict: dict) -> dict:
+    """
+    FK references between the tables in the list. Self references are left out
+
+    @param table_list: list of tables
+    @param table_dict: dict with FK reference info of all tables: {table: {column: (fk_table, constraint)}}
+    @return: dict - for each table, the set of tables in the list it refers to
+    """
+    tables = set(table_list)
+    deps = dict()
+    for table in table_list:
+        deps[table] = set([column_info[0] for column_info in table_dict.get(table, dict()).values()
+                           if (column_info[0] in tables) and (column_info[0] != table)])
+    return deps
+
+
+def find_cycle(deps: dict) -> list:
+    """
+    Follow references from the first (sorted) table until a table is revisited.
+    Each table in deps must have at least one reference to another table in deps
+
+    @param deps: dict - unresolved references as in the CircularDependencyError of toposort
+    @return: list of tables in the cycle. Each table refers to the next one; the last refers to the first
+    """
+    path = []
+    visited = dict()
+    table = sorted(deps.keys())[0]
+    while table not in visited:
+        visited[table] = len(path)
+        path.append(table)
+        table = sorted(deps[table])[0]
+    return path[visited[table]:]
+
+
+def copy_order(table_list: list, table_dict: dict) -> (list, list):
+    """
+    Topological sort of the tables on their FK references (linear in tables and references).
+    FK cycles are broken by ignoring one reference per cycle.
+
+    @param table_list: list of tables to copy
+    @param table_dict: dict with FK reference info of all tables
+    @return: tuple of
+        - list of tables in copy order. Tables on the same level are sorted by name
+        - list of broken cycles: (table, ignored referenced table, list of tables in the cycle)
+    """
+    deps = table_dependencies(table_list, table_dict)
+    ordered = []
+    broken = []
+    while len(deps) > 0:
+        try:
+            for level in toposort(deps):
+                ordered.extend(sorted(level))
+            deps = dict()
+        except CircularDependencyError as cde:
+            # toposort has yielded the tables outside of (and not depending on) cycles.
+            # Continue with the remaining tables after dropping one reference of a cycle
+            deps = dict([(t, set(d)) for t, d in cde.data.items()])
+            cycle = find_cycle(deps)
+            table, referenced = cycle[-1], cycle[0]
+            deps[table].discard(referenced)
+            broken.append((table, referenced, cycle))
+    return ordered, broken
+
+
+def print_broken_cycles(broken: list):
+    """
+    Explain the FK cycles, which were broken to find a copy order
+    @param broken: list of broken cycles as returned by copy_order
+    """
+    for table, referenced, cycle in broken:
+        print('WARNING: FK cycle %s. Reference %s -> %s ignored: %s may be copied before %s.' % (
+            ' -> '.join(cycle + [cycle[0]]), table, referenced, table, referenced))
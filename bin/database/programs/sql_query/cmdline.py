@@ -116,6 +116,14 @@ parser.add_argument(
     help='quiet: suppress header info in output'
 )
 
+parser.add_argument(
+    '--prefetch', action='store', type=int,
+    dest='prefetch',
+    default=0,
+    help='Number of row batches read ahead in a background thread, while the current batch is written, e.g. 2. '
+         'Defaults to 0: no read ahead.'
+)
+
 parser.add_argument(
     '-s', '--separator', action='store',
     default=";",
@@ -31,6 +31,7 @@ from lwetl.queries import content_queries
 from lwetl.utils import is_empty
 from lwetl.config_parser import JDBC_DRIVERS
 from .cmdline import FORMATTERS, parser
+from ...prefetch import prefetch_rows
 
 
 def show_version():
@@ -183,12 +184,15 @@ def parse_output(cursors: list, args):
         rc = 0
         rc_max = args.max_rows
         f.header()
+        rows = prefetch_rows(jdbc.get_data(cursor), args.prefetch)
         try:
-            for row in jdbc.get_data(cursor):
+            for row in rows:
                 f.write(row)
                 rc += 1
                 if (rc_max > 0) and (rc >= rc_max):
                     print('Output trucated on user request.', file=sys.stdout)
+                    # stop the read ahead before the cursor is closed
+                    rows.close()
                     jdbc.close(cursor)
                     break
             f.footer()
@@ -30,9 +30,66 @@ import lwetl
 import os
 import sys
 
+from collections import OrderedDict
 from lwetl.version import __version__
 
-def count(login, table, filename, max_rows):
+from .sketches import ColumnSummary
+from ...jdbc import read_metadata_columns, split_table_name, find_table_columns
+
+def cell_value(value):
+    if (value is None) or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def count_single_pass(jdbc, table, columns, xls, max_rows, counters):
+    """
+    Summarize all columns in one scan of the table. Distinct counts are HyperLogLog estimates,
+    and the non distinct values are the heavy hitters of a Misra-Gries summary (counts are lower bounds)
+    """
+    column_names = list(columns.keys())
+    summaries = [ColumnSummary(counters) for c in column_names]
+
+    cur = jdbc.execute('SELECT * FROM %s' % table)
+    n = 0
+    for row in jdbc.get_data(cur):
+        n += 1
+        for x, value in enumerate(row):
+            summaries[x].add(value)
+        if n % 100000 == 0:
+            print('Scanned: %d rows' % n)
+
+    sheet1 = xls.sheet
+    sheet1.append(['COLUMN NAME', 'DISTINCT (ESTIMATE)', 'TOTAL', 'TOTAL NON DISTINCT (LOWER BOUND)'])
+    for column_name, summary in zip(column_names, summaries):
+        top = [(value, cnt) for value, cnt in summary.heavy_hitters.top() if cnt > 1]
+        tds = sum([cnt for value, cnt in top])
+        if len(top) > 0:
+            xls.next_sheet(None, column_name)
+            xls.sheet.append([column_name, 'N'])
+            for value, cnt in (top[:max_rows] if max_rows > 0 else top):
+                xls.sheet.append([cell_value(value), cnt])
+        dst = summary.distinct.estimate()
+        sheet1.append([column_name, dst, summary.total, tds])
+        print('Parsed: %-30s d ~ %6d, t = %6d, s > %6d' % (column_name, dst, summary.total, tds))
+
+
+def metadata_columns(jdbc, table):
+    """
+    Columns of the table from the database metadata, without a query on the table
+    @return: OrderedDict column name -> column type, or None if not found
+    """
+    schema, table_name = split_table_name(table, jdbc.schema)
+    try:
+        columns = find_table_columns(read_metadata_columns(jdbc.connection, None, schema), table_name)
+    except Exception:
+        return None
+    if (columns is not None) and getattr(jdbc, 'upper_case', True):
+        columns = OrderedDict([(name.upper(), ctype) for name, ctype in columns.items()])
+    return columns
+
+
+def count(login, table, filename, max_rows, single_pass=False, counters=1000):
     error = None
     try:
         jdbc = lwetl.Jdbc(login)
@@ -43,10 +100,12 @@ def count(login, table, filename, max_rows):
     if error is not None:
         return
 
-    cur = None
+    # the columns come from the metadata, but the formatter opens on a cursor: an empty one is enough
+    columns = metadata_columns(jdbc, table)
     try:
         cur = jdbc.execute("SELECT * FROM %s WHERE 0=1" % table)
-        columns = jdbc.get_columns()
+        if columns is None:
+            columns = jdbc.get_columns()
     except Exception:
         columns = None
         jdbc.close()
@@ -59,6 +118,12 @@ def count(login, table, filename, max_rows):
                'COUNT(*) DESC,{0} '
     sql_count = 'SELECT COUNT(*) AS N FROM {1} WHERE {0} IS NOT NULL'
 
+    if single_pass:
+        with lwetl.XlsxFormatter(cursor=cur, filename_or_stream=filename) as xls:
+            count_single_pass(jdbc, table, columns, xls, max_rows, counters)
+        print('Done.')
+        return 0
+
     with lwetl.XlsxFormatter(cursor=cur, filename_or_stream=filename) as xls:
         sheet1 = xls.sheet
         sheet1.append(['COLUMN NAME', 'DISTINCT', 'TOTAL', 'TOTAL NON DISTINCT'])
@@ -103,6 +168,16 @@ def main():
         default=50,
         help='Limit the maximum number of rows in the output table. Use <= 0 for all. Defaults to 50.')
 
+    parser.add_argument(
+        '-s', '--single_pass', action='store_true',
+        help='''Scan the table once and estimate the counters (HyperLogLog distinct counts, Misra-Gries
+heavy hitters) instead of running exact aggregate queries for each column.''')
+
+    parser.add_argument(
+        '-k', '--counters', action='store', type=int,
+        default=1000,
+        help='Number of heavy hitter counters per column in single pass mode. Defaults to 1000.')
+
     parser.add_argument('--version', action='store_true')
 
     if (len(sys.argv) > 1) and (sys.argv[1].lower() == '--version'):
@@ -127,7 +202,7 @@ def main():
         args.filename = args.table.lower() + '.xlsx'
         print('INFO - output file: ' + args.filename)
 
-    count(args.login, args.table, args.filename, args.max_rows)
+    count(args.login, args.table, args.filename, args.max_rows, args.single_pass, args.counters)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,105 @@
+# GPL3 License
+
+# Copyright 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Streaming summaries of column values for a single pass over a table
+"""
+
+import math
+
+from hashlib import blake2b
+
+
+class HyperLogLog:
+    """
+    Estimate of the number of distinct values (HyperLogLog with 2^p registers).
+    The standard error is about 1.04/sqrt(2^p), i.e. 0.8 % for the default p = 14
+    """
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self.alpha = 0.7213 / (1.0 + 1.079 / self.m)
+
+    def add(self, value):
+        x = int.from_bytes(blake2b(repr(value).encode(), digest_size=8).digest(), 'big')
+        index = x >> (64 - self.p)
+        w = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - w.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> int:
+        e = self.alpha * self.m * self.m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(0)
+        if (e <= 2.5 * self.m) and (zeros > 0):
+            # small range correction (linear counting)
+            e = self.m * math.log(self.m / zeros)
+        return int(round(e))
+
+
+class MisraGries:
+    """
+    Heavy hitters (Misra-Gries summary with k - 1 counters).
+    Every value occurring more than n/k times is kept. Counts are lower bounds, at most n/k too low
+    """
+
+    def __init__(self, k: int = 1000):
+        self.k = max(k, 2)
+        self.counters = dict()
+
+    def add(self, value):
+        if value in self.counters:
+            self.counters[value] += 1
+        elif len(self.counters) < self.k - 1:
+            self.counters[value] = 1
+        else:
+            for key in list(self.counters.keys()):
+                if self.counters[key] == 1:
+                    del self.counters[key]
+                else:
+                    self.counters[key] -= 1
+
+    def top(self, n: int = 0) -> list:
+        """
+        @param n: int - maximum number of values to return. Zero or negative implies all
+        @return: list of (value, count) sorted by descending count
+        """
+        items = sorted(self.counters.items(), key=lambda kv: kv[1], reverse=True)
+        if n > 0:
+            items = items[:n]
+        return items
+
+
+class ColumnSummary:
+    """
+    Non-null count, distinct estimate, and heavy hitters of a column
+    """
+
+    def __init__(self, k: int = 1000):
+        self.total = 0
+        self.distinct = HyperLogLog()
+        self.heavy_hitters = MisraGries(k)
+
+    def add(self, value):
+        if value is None:
+            return
+        self.total += 1
+        self.distinct.add(value)
+        self.heavy_hitters.add(value)
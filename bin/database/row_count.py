@@ -0,0 +1,212 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Row counts of tables: catalog estimates where the database keeps them, and exact counts
+    (in parallel) only where a decision depends on them
+"""
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# table name and estimated number of rows from the catalog statistics
+ROW_ESTIMATE_QUERIES = {
+    'oracle': "SELECT TABLE_NAME, NUM_ROWS FROM ALL_TABLES WHERE OWNER = '@SCHEMA@'",
+    'sqlserver': '''
+SELECT t.name, SUM(p.rows)
+FROM sys.tables t INNER JOIN sys.partitions p ON p.object_id = t.object_id AND p.index_id IN (0, 1)
+GROUP BY t.name''',
+    'mysql': "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.tables WHERE table_schema = '@SCHEMA@'",
+    'postgresql': '''
+SELECT c.relname, c.reltuples
+FROM pg_class c INNER JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname = '@SCHEMA@\'''',
+    'h2': "SELECT TABLE_NAME, ROW_COUNT_ESTIMATE FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = '@SCHEMA@'",
+}
+
+ROW_COUNT_WORKERS = 4
+
+
+def db_type_of_url(url: str) -> str:
+    """
+    @return: str - database type of a jdbc url, e.g. 'oracle' for jdbc:oracle:thin:@...
+    """
+    parts = url.split(':')
+    if (len(parts) > 1) and (parts[0].lower() == 'jdbc'):
+        return parts[1].lower()
+    return ''
+
+
+def quote_table(table: str) -> str:
+    return '"' + table + '"'
+
+
+def count_rows(connection, table_ref: str) -> int:
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT COUNT(*) FROM ' + table_ref)
+        (row_count,) = cursor.fetchone()
+    finally:
+        cursor.close()
+    return int(row_count)
+
+
+def contains_rows(connection, table_ref: str) -> bool:
+    # Reads at most one row, instead of counting all of them
+    statement = connection.jconn.createStatement()
+    try:
+        statement.setMaxRows(1)
+        result_set = statement.executeQuery('SELECT 1 FROM ' + table_ref)
+        found = bool(result_set.next())
+        result_set.close()
+    finally:
+        statement.close()
+    return found
+
+
+def close_connection(jdbc):
+    jdbc.connection.close()
+
+
+class RowCounter:
+    """
+    Row counts of the tables in a schema.
+
+    Estimates come from one catalog query. Exact counts and emptiness checks run in parallel,
+    each worker on its own connection.
+    """
+
+    def __init__(self, jdbc, connect=None, release=close_connection, db_type=None, schema=None,
+                 workers=ROW_COUNT_WORKERS, table_ref=quote_table):
+        """
+        @param jdbc: Jdbc - connection for the catalog query (any object with a DB-API 'connection')
+        @param connect: function, which opens a new connection of the same kind for a worker. Counts run
+            serially on jdbc if not specified
+        @param release: function, which closes (or returns) a connection opened with connect
+        @param db_type: str - database type (key of ROW_ESTIMATE_QUERIES). Derived from jdbc.url if not specified
+        @param schema: str - schema of the tables. Defaults to jdbc.db_schema
+        @param workers: int - maximum number of parallel counts
+        @param table_ref: function, which returns the table reference used in SQL for a table name
+        """
+        self.jdbc = jdbc
+        self.connect = connect
+        self.release = release
+        self.db_type = db_type if db_type is not None else db_type_of_url(getattr(jdbc, 'url', ''))
+        self.schema = schema if schema is not None else getattr(jdbc, 'db_schema', '')
+        self.workers = workers if connect is not None else 1
+        self.table_ref = table_ref
+        self._estimates = None
+
+    def estimates(self) -> dict:
+        """
+        @return: dict - estimated row count by upper case table name. Empty if the database keeps no statistics
+        """
+        if self._estimates is not None:
+            return self._estimates
+
+        self._estimates = dict()
+        sql = ROW_ESTIMATE_QUERIES.get(self.db_type)
+        if (sql is None) or (('@SCHEMA@' in sql) and not self.schema):
+            return self._estimates
+
+        schema = self.schema.upper() if self.db_type == 'oracle' else self.schema
+        cursor = self.jdbc.connection.cursor()
+        try:
+            cursor.execute(sql.replace('@SCHEMA@', schema))
+            for table, row_count in cursor.fetchall():
+                # tables without statistics: NULL (oracle) or -1 (postgresql)
+                if (row_count is not None) and (row_count >= 0):
+                    self._estimates[str(table).upper()] = int(row_count)
+        except Exception as e:
+            print('No row count statistics: ' + str(e))
+        finally:
+            cursor.close()
+        return self._estimates
+
+    def run(self, function, tables: list) -> dict:
+        """
+        Apply function(connection, table_ref) to each table, in parallel if a connect function is given
+        @return: dict - result by table
+        """
+        if (self.connect is None) or (len(tables) < 2):
+            return dict([(t, function(self.jdbc.connection, self.table_ref(t))) for t in tables])
+
+        idle = queue.Queue()
+        opened = []
+        lock = threading.Lock()
+
+        def job(table):
+            try:
+                jdbc = idle.get_nowait()
+            except queue.Empty:
+                jdbc = self.connect()
+                with lock:
+                    opened.append(jdbc)
+            try:
+                return table, function(jdbc.connection, self.table_ref(table))
+            finally:
+                idle.put(jdbc)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                return dict(executor.map(job, tables))
+        finally:
+            for jdbc in opened:
+                self.release(jdbc)
+
+    def exact(self, tables: list) -> dict:
+        """
+        @return: dict - exact row count by table
+        """
+        return self.run(count_rows, tables)
+
+    def has_rows(self, tables: list) -> dict:
+        """
+        @return: dict - True for each table with at least one row
+        """
+        return self.run(contains_rows, tables)
+
+    def counts(self, tables: list) -> dict:
+        """
+        Row counts, which are exact for empty tables. Non-empty tables get the catalog estimate,
+        or an exact count if there is no usable estimate
+        @return: dict - row count by table
+        """
+        estimates = self.estimates()
+        non_empty = self.has_rows(tables)
+        result = dict([(t, 0) for t in tables if not non_empty[t]])
+        missing = []
+        for t in [t for t in tables if non_empty[t]]:
+            estimate = estimates.get(t.upper(), 0)
+            if estimate > 0:
+                result[t] = estimate
+            else:
+                missing.append(t)
+        result.update(self.exact(missing))
+        return result
+
+    @classmethod
+    def from_pool(cls, jdbc, **kwargs):
+        """
+        RowCounter for a database.jdbc.Jdbc connection, with workers on pooled connections
+        """
+        from .pool import JDBC_POOL
+
+        def connect():
+            return JDBC_POOL.checkout(jdbc.url, jdbc.usr, jdbc.pwd, jdbc.db_name, jdbc.db_schema,
+                                      jdbc.driver_jar, jdbc.driver_class, True, True)
+        return cls(jdbc, connect=connect, release=JDBC_POOL.checkin, **kwargs)
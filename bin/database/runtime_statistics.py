@@ -30,6 +30,7 @@ from collections import OrderedDict
 from datetime import datetime, timedelta
 from time import time
 
+from .batch_size import get_batch_size_statistics
 from .utils import is_empty
 
 MARKED_CONNECTIONS = OrderedDict()
@@ -66,6 +67,10 @@ class Statistics:
         self.query_time = 0.0
         self.row_count = 0
         self.exec_count = 0
+        self.prepare_hits = 0
+        self.prepare_misses = 0
+        # name of the driver profile (see profiles.py)
+        self.profile = ''
 
     def add_query_time(self, dt: float):
         """
@@ -94,6 +99,24 @@ class Statistics:
         self.exec_count += n
         return self.exec_count
 
+    def add_prepare_hit(self, n: int = 1):
+        """
+        Add to the counter of statements taken from the prepared statement cache
+        @param n: int counter to add
+        @return the new hit count
+        """
+        self.prepare_hits += n
+        return self.prepare_hits
+
+    def add_prepare_miss(self, n: int = 1):
+        """
+        Add to the counter of statements, which had to be prepared
+        @param n: int counter to add
+        @return the new miss count
+        """
+        self.prepare_misses += n
+        return self.prepare_misses
+
     def get_query_time(self) -> str:
         """
         @return: str the query time as a string in the format HH:MM:SS
@@ -101,7 +124,9 @@ class Statistics:
         return time_to_string(self.query_time)
 
     def get_statistics(self, tag: str = '') -> str:
-        return '+ %-9s   %-11s,  nq = %8d, rc = %8d' % ('db ' + tag + ':', self.get_query_time(), self.exec_count, self.row_count)
+        return '+ %-9s   %-11s,  nq = %8d, rc = %8d, ph = %8d, pm = %8d' % (
+            'db ' + tag + ':', self.get_query_time(), self.exec_count, self.row_count, self.prepare_hits,
+            self.prepare_misses) + (' [' + self.profile + ']' if self.profile else '')
 
 
 GLOBAL_STATISTICS = Statistics()
@@ -146,6 +171,14 @@ class RuntimeStatistics(Statistics):
         GLOBAL_STATISTICS.add_exec_count(n)
         return super(RuntimeStatistics, self).add_exec_count(n)
 
+    def add_prepare_hit(self, n: int = 1):
+        GLOBAL_STATISTICS.add_prepare_hit(n)
+        return super(RuntimeStatistics, self).add_prepare_hit(n)
+
+    def add_prepare_miss(self, n: int = 1):
+        GLOBAL_STATISTICS.add_prepare_miss(n)
+        return super(RuntimeStatistics, self).add_prepare_miss(n)
+
 
 def tag_connection(tag: str, jdbc):
     """
@@ -174,4 +207,7 @@ def get_execution_statistics() -> str:
         GLOBAL_STATISTICS.get_statistics('TOTAL')]
     for tag, jdbc in MARKED_CONNECTIONS.items():
         str_list.append(jdbc.get_statistics(tag))
+    batch_sizes = get_batch_size_statistics()
+    if batch_sizes:
+        str_list.append(batch_sizes)
     return "\n".join(str_list)
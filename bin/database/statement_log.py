@@ -0,0 +1,332 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Binary log of (sql, parameters) statements, as produced by the uploaders.
+
+    Format: the magic bytes, followed by records of one byte kind and a payload. Numbers are big endian.
+    - Q: uint32 length, utf-8 text - a new sql. Sqls are numbered from 0 in the order of their Q records
+    - R: uint32 sql number, parameter row - a statement
+    - M: uint32 sql number, uint32 number of rows, parameter rows - a statement with a batch of parameters
+    A parameter row is uint16 number of values (0xFFFF for no parameters), followed by the typed values:
+    one byte type, and the value (see write_value).
+"""
+import os
+import struct
+import tempfile
+
+from datetime import date, datetime
+from decimal import Decimal
+
+MAGIC = b'PWSQL1\n'
+NO_PARAMETERS = 0xFFFF
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+PIPE_BUFFER_SIZE = 10000
+REPLAY_BATCH_SIZE = 1000
+
+_UINT16 = struct.Struct('>H')
+_UINT32 = struct.Struct('>I')
+_INT64 = struct.Struct('>q')
+_DOUBLE = struct.Struct('>d')
+
+
+def write_text(stream, tag: bytes, text: str):
+    data = text.encode('utf-8')
+    stream.write(tag + _UINT32.pack(len(data)) + data)
+
+
+def write_value(stream, value):
+    """
+    Types: N None, ? bool, i int64, I large int (text), f float, D Decimal (text), s str, b bytes,
+    t datetime and d date (iso text), j java time (epoch millis), B java blob (bytes)
+    """
+    if value is None:
+        stream.write(b'N')
+    elif isinstance(value, bool):
+        stream.write(b'?' + (b'\x01' if value else b'\x00'))
+    elif isinstance(value, int):
+        if INT64_MIN <= value <= INT64_MAX:
+            stream.write(b'i' + _INT64.pack(value))
+        else:
+            write_text(stream, b'I', str(value))
+    elif isinstance(value, float):
+        stream.write(b'f' + _DOUBLE.pack(value))
+    elif isinstance(value, Decimal):
+        write_text(stream, b'D', str(value))
+    elif isinstance(value, str):
+        write_text(stream, b's', value)
+    elif isinstance(value, (bytes, bytearray)):
+        stream.write(b'b' + _UINT32.pack(len(value)) + bytes(value))
+    elif isinstance(value, datetime):
+        write_text(stream, b't', value.isoformat())
+    elif isinstance(value, date):
+        write_text(stream, b'd', value.isoformat())
+    elif hasattr(value, 'getTime'):
+        # java.sql.Date, Time and Timestamp of ParameterUploader._convert()
+        stream.write(b'j' + _INT64.pack(int(value.getTime())))
+    elif hasattr(value, 'getBytes') and hasattr(value, 'length'):
+        data = bytes(value.getBytes(1, int(value.length())))
+        stream.write(b'B' + _UINT32.pack(len(data)) + data)
+    else:
+        write_text(stream, b's', str(value))
+
+
+def write_row(stream, parameters):
+    if parameters is None:
+        stream.write(_UINT16.pack(NO_PARAMETERS))
+        return
+    stream.write(_UINT16.pack(len(parameters)))
+    for value in parameters:
+        write_value(stream, value)
+
+
+def read_exact(stream, n: int) -> bytes:
+    data = stream.read(n)
+    if len(data) != n:
+        raise EOFError('Truncated statement log')
+    return data
+
+
+def read_text(stream) -> str:
+    (n,) = _UINT32.unpack(read_exact(stream, 4))
+    return read_exact(stream, n).decode('utf-8')
+
+
+def read_value(stream):
+    tag = read_exact(stream, 1)
+    if tag == b'N':
+        return None
+    elif tag == b'?':
+        return read_exact(stream, 1) == b'\x01'
+    elif tag == b'i':
+        return _INT64.unpack(read_exact(stream, 8))[0]
+    elif tag == b'f':
+        return _DOUBLE.unpack(read_exact(stream, 8))[0]
+    elif tag == b'I':
+        return int(read_text(stream))
+    elif tag == b'D':
+        return Decimal(read_text(stream))
+    elif tag == b's':
+        return read_text(stream)
+    elif tag in (b'b', b'B'):
+        (n,) = _UINT32.unpack(read_exact(stream, 4))
+        return read_exact(stream, n)
+    elif tag == b't':
+        return datetime.fromisoformat(read_text(stream))
+    elif tag == b'd':
+        return date.fromisoformat(read_text(stream))
+    elif tag == b'j':
+        return datetime.fromtimestamp(_INT64.unpack(read_exact(stream, 8))[0] / 1000.0)
+    raise ValueError('Unknown value type in statement log: ' + repr(tag))
+
+
+def read_row(stream):
+    (n,) = _UINT16.unpack(read_exact(stream, 2))
+    if n == NO_PARAMETERS:
+        return None
+    return [read_value(stream) for _ in range(n)]
+
+
+class StatementLogWriter:
+    """
+    Write statements to a binary statement log
+    """
+
+    def __init__(self, path_or_stream):
+        """
+        @param path_or_stream: str - path of the log file, or a binary stream opened for writing
+        """
+        if isinstance(path_or_stream, str):
+            self.stream = open(path_or_stream, 'wb')
+            self.owns_stream = True
+        else:
+            self.stream = path_or_stream
+            self.owns_stream = False
+        self.sql_ids = dict()
+        self.count = 0
+        self.stream.write(MAGIC)
+
+    def sql_id(self, sql: str) -> int:
+        sql_id = self.sql_ids.get(sql)
+        if sql_id is None:
+            sql_id = self.sql_ids[sql] = len(self.sql_ids)
+            write_text(self.stream, b'Q', sql)
+        return sql_id
+
+    def write(self, sql: str, parameters=None):
+        """
+        @param parameters: None, a list of parameters, or a list of lists of parameters (batch)
+        """
+        sql_id = self.sql_id(sql)
+        if isinstance(parameters, (list, tuple)) and (len(parameters) > 0) and \
+                isinstance(parameters[0], (list, tuple)):
+            self.stream.write(b'M' + _UINT32.pack(sql_id) + _UINT32.pack(len(parameters)))
+            for row in parameters:
+                write_row(self.stream, row)
+        else:
+            self.stream.write(b'R' + _UINT32.pack(sql_id))
+            write_row(self.stream, parameters)
+        self.count += 1
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        if self.owns_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+def read_statement_log(path_or_stream):
+    """
+    @param path_or_stream: str - path of the log file, or a binary stream opened for reading
+    @return: generator of tuples (sql, parameters) in the order they were written
+    """
+    stream = open(path_or_stream, 'rb') if isinstance(path_or_stream, str) else path_or_stream
+    try:
+        if stream.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a statement log')
+        sqls = []
+        while True:
+            kind = stream.read(1)
+            if kind == b'':
+                break
+            elif kind == b'Q':
+                sqls.append(read_text(stream))
+            elif kind == b'R':
+                (sql_id,) = _UINT32.unpack(read_exact(stream, 4))
+                yield sqls[sql_id], read_row(stream)
+            elif kind == b'M':
+                sql_id, n = struct.unpack('>II', read_exact(stream, 8))
+                yield sqls[sql_id], [read_row(stream) for _ in range(n)]
+            else:
+                raise ValueError('Unknown record in statement log: ' + repr(kind))
+    finally:
+        if isinstance(path_or_stream, str):
+            stream.close()
+
+
+class StatementBuffer:
+    """
+    Buffer of (sql, parameters) statements, kept in memory up to max_size entries. Beyond that all entries
+    are moved to a temporary statement log, and read back from there.
+    """
+
+    def __init__(self, max_size: int = PIPE_BUFFER_SIZE, tmp_dir: str = None):
+        self.max_size = max_size
+        self.tmp_dir = tmp_dir
+        self.entries = []
+        self.size = 0
+        self.path = None
+        self.writer = None
+
+    def append(self, entry: tuple):
+        self.size += 1
+        if self.writer is not None:
+            self.writer.write(*entry)
+            return
+        self.entries.append(entry)
+        if len(self.entries) > self.max_size:
+            self.spill()
+
+    def spill(self):
+        fd, self.path = tempfile.mkstemp(prefix='pipe_', suffix='.sqllog', dir=self.tmp_dir)
+        os.close(fd)
+        self.writer = StatementLogWriter(self.path)
+        for entry in self.entries:
+            self.writer.write(*entry)
+        self.entries = []
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # a generator: it holds a reference to the buffer, so a spilled file is not removed while it is read
+        if self.writer is None:
+            yield from list(self.entries)
+        else:
+            self.writer.flush()
+            yield from read_statement_log(self.path)
+
+    def clear(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self.entries = []
+        self.size = 0
+
+    def __del__(self):
+        self.clear()
+
+
+def replay_statement_log(jdbc, path_or_stream, batch_size: int = REPLAY_BATCH_SIZE, commit: bool = True) -> int:
+    """
+    Execute the statements of a log on a connection. Consecutive statements with the same sql and parameters
+    are sent as one batch (executemany) of at most batch_size rows
+
+    @param jdbc: Jdbc - target connection
+    @param path_or_stream: str - path of the log file, or a binary stream
+    @param batch_size: int - maximum rows per batch
+    @param commit: bool - commit after the log has been replayed, rollback on an error
+    @return: int - number of executed statements (batch rows counted separately)
+    """
+    from jpype import JPackage
+    timestamp = JPackage('java').sql.Timestamp
+
+    def to_java(row):
+        return [timestamp(int(v.timestamp() * 1000)) if isinstance(v, datetime) else v for v in row]
+
+    count = 0
+    cursor = None
+    batch_sql = None
+    batch = []
+
+    def flush():
+        nonlocal cursor, batch
+        if len(batch) > 0:
+            cursor = jdbc.execute(batch_sql, batch if len(batch) > 1 else batch[0], cursor)
+            batch = []
+
+    try:
+        for sql, parameters in read_statement_log(path_or_stream):
+            rows = parameters if (isinstance(parameters, list) and (len(parameters) > 0) and
+                                  isinstance(parameters[0], list)) else [parameters]
+            for row in rows:
+                count += 1
+                if not row:
+                    flush()
+                    cursor = jdbc.execute(sql, None, cursor)
+                    continue
+                if (sql != batch_sql) or (len(batch) >= batch_size):
+                    flush()
+                    batch_sql = sql
+                batch.append(to_java(row))
+        flush()
+    except Exception:
+        if commit and (cursor is not None):
+            jdbc.rollback(cursor)
+        raise
+    if commit and (cursor is not None):
+        jdbc.commit(cursor)
+    return count
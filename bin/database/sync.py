@@ -0,0 +1,284 @@
+# Copyright (C) 2022 Morten Eek
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Incremental sync of a table between a source and a target connection.
+
+    Source and target are compared on aggregates of key buckets, and only buckets that differ are refined
+    (Merkle style). Integer keys are bucketed by key range in the databases themselves, so that the rows of
+    differing ranges can be selected with range predicates. Other keys are streamed and bucketed by hash,
+    and missing rows are copied with parameterized queries.
+
+    The sync only adds rows: target rows, which are not in the source, are kept.
+"""
+from decimal import Decimal
+from hashlib import blake2b
+
+# number of sub-buckets each differing bucket is split into
+SYNC_BUCKETS = 64
+# differing key ranges with at most this many source rows are not split any further
+SYNC_LEAF_ROWS = 10000
+# maximum number of range predicates in a source query. Adjacent ranges are merged to stay below it
+SYNC_MAX_RANGES = 200
+# number of hash buckets for keys, which are not integers
+SYNC_HASH_BUCKETS = 1024
+SYNC_FETCH_SIZE = 10000
+SYNC_BATCH_SIZE = 500
+
+
+def quote(column: str) -> str:
+    return '"' + column + '"'
+
+
+def is_integral(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    if isinstance(value, Decimal):
+        return value == value.to_integral_value()
+    if isinstance(value, float):
+        return value.is_integer()
+    return False
+
+
+def fetch_all(jdbc, sql, parameters=None) -> list:
+    cursor = jdbc.connection.cursor()
+    try:
+        if parameters is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, parameters)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def stream_rows(jdbc, sql):
+    cursor = jdbc.connection.cursor()
+    try:
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(SYNC_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
+
+
+def integer_key_range(s_jdbc, s_table: str, key: str):
+    """
+    @return: tuple(int, int) - the lowest key and the highest key + 1 in the source table,
+        or None if the source table is empty or the key is not an integer
+    """
+    lo, hi = fetch_all(s_jdbc, 'SELECT MIN(' + quote(key) + '), MAX(' + quote(key) + ') FROM ' + s_table)[0]
+    if not (is_integral(lo) and is_integral(hi)):
+        return None
+    return int(lo), int(hi) + 1
+
+
+def range_aggregates(jdbc, table: str, key: str, lo: int, hi: int, width: int) -> dict:
+    """
+    Row count, key sum and lowest and highest key of each bucket [lo + b * width, lo + (b + 1) * width)
+    in the range [lo, hi)
+    @return: dict - (count, sum, min, max) for each non-empty bucket number
+    """
+    k = quote(key)
+    bucket = 'FLOOR((' + k + ' - ' + str(lo) + ') / ' + str(width) + ')'
+    sql = 'SELECT ' + bucket + ', COUNT(*), SUM(' + k + ' - ' + str(lo) + '), MIN(' + k + '), MAX(' + k + ') FROM ' + \
+          table + ' WHERE ' + k + ' >= ' + str(lo) + ' AND ' + k + ' < ' + str(hi) + ' GROUP BY ' + bucket
+    return dict([(int(b), (int(n), int(s or 0), int(k_min), int(k_max)))
+                 for b, n, s, k_min, k_max in fetch_all(jdbc, sql)])
+
+
+def diff_key_ranges(s_jdbc, t_jdbc, s_table: str, t_table: str, key: str):
+    """
+    Find the key ranges, in which source and target differ
+
+    @return: list of (lo, hi) - half open key ranges, or None if the key is not an integer
+    """
+    key_range = integer_key_range(s_jdbc, s_table, key)
+    if key_range is None:
+        return None
+
+    ranges = []
+    pending = [key_range]
+    while len(pending) > 0:
+        lo, hi = pending.pop()
+        width = max(-(-(hi - lo) // SYNC_BUCKETS), 1)
+        source = range_aggregates(s_jdbc, s_table, key, lo, hi, width)
+        target = range_aggregates(t_jdbc, t_table, key, lo, hi, width)
+        for b in sorted(set(source.keys()) | set(target.keys())):
+            if source.get(b) == target.get(b):
+                continue
+            b_lo = lo + b * width
+            b_hi = min(b_lo + width, hi)
+            if (width > 1) and (source.get(b, (0,))[0] > SYNC_LEAF_ROWS):
+                pending.append((b_lo, b_hi))
+            else:
+                ranges.append((b_lo, b_hi))
+    return merge_ranges(ranges)
+
+
+def merge_ranges(ranges: list) -> list:
+    """
+    Merge adjacent ranges, and the closest ranges until at most SYNC_MAX_RANGES remain
+    """
+    ranges = sorted(ranges)
+
+    merged = []
+    for lo, hi in ranges:
+        if (len(merged) > 0) and (merged[-1][1] == lo):
+            merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+
+    while len(merged) > SYNC_MAX_RANGES:
+        gap = min(range(len(merged) - 1), key=lambda x: merged[x + 1][0] - merged[x][1])
+        merged[gap:gap + 2] = [(merged[gap][0], merged[gap + 1][1])]
+    return merged
+
+
+def range_predicate(key: str, ranges: list) -> str:
+    k = quote(key)
+    predicates = ['(' + k + ' >= ' + str(lo) + ' AND ' + k + ' < ' + str(hi) + ')' for lo, hi in ranges]
+    return '(' + ' OR '.join(predicates) + ')'
+
+
+def normalize_key(row) -> tuple:
+    """
+    Key values in a form that compares equal between database drivers (e.g. int and Decimal)
+    """
+    return tuple([str(int(v)) if is_integral(v) else str(v) for v in row])
+
+
+def key_hash(key: tuple) -> int:
+    return int.from_bytes(blake2b(repr(key).encode(), digest_size=8).digest(), 'big')
+
+
+def hash_buckets(jdbc, table: str, keys: list) -> dict:
+    """
+    Stream the keys of a table and aggregate them by hash bucket
+    @return: dict - (count, xor of key hashes) for each non-empty bucket number
+    """
+    buckets = dict()
+    sql = 'SELECT ' + ','.join([quote(k) for k in keys]) + ' FROM ' + table
+    for row in stream_rows(jdbc, sql):
+        h = key_hash(normalize_key(row))
+        b = h % SYNC_HASH_BUCKETS
+        n, x = buckets.get(b, (0, 0))
+        buckets[b] = n + 1, x ^ h
+    return buckets
+
+
+def keys_in_buckets(jdbc, table: str, keys: list, buckets: set) -> dict:
+    """
+    @return: dict - original key values by normalized key, for all keys in the given hash buckets
+    """
+    found = dict()
+    sql = 'SELECT ' + ','.join([quote(k) for k in keys]) + ' FROM ' + table
+    for row in stream_rows(jdbc, sql):
+        key = normalize_key(row)
+        if (key_hash(key) % SYNC_HASH_BUCKETS) in buckets:
+            found[key] = tuple(row)
+    return found
+
+
+def missing_keys(s_jdbc, t_jdbc, s_table: str, t_table: str, keys: list) -> list:
+    """
+    Keys in the source table, which are not in the target table. Only the keys of differing hash buckets are kept
+    @return: list of tuples with key values as returned by the source
+    """
+    source = hash_buckets(s_jdbc, s_table, keys)
+    target = hash_buckets(t_jdbc, t_table, keys)
+    differing = set([b for b in source.keys() if source[b] != target.get(b)])
+    if len(differing) == 0:
+        return []
+
+    source_keys = keys_in_buckets(s_jdbc, s_table, keys, differing)
+    target_keys = keys_in_buckets(t_jdbc, t_table, keys, differing)
+    return [v for k, v in source_keys.items() if k not in target_keys]
+
+
+def copy_rows_by_key(s_jdbc, t_jdbc, source_query: str, t_table: str, keys: list, key_values: list) -> int:
+    """
+    Copy the rows with the given keys. Keys are bound as parameters in batches
+    @return: int - number of copied rows
+    """
+    if len(keys) == 1:
+        predicate = quote(keys[0]) + ' IN ({})'
+        term = '?'
+    else:
+        predicate = '{}'
+        term = '(' + ' AND '.join([quote(k) + ' = ?' for k in keys]) + ')'
+    separator = ',' if len(keys) == 1 else ' OR '
+
+    copied = 0
+    s_cursor = s_jdbc.connection.cursor()
+    t_cursor = t_jdbc.connection.cursor()
+    try:
+        for x in range(0, len(key_values), SYNC_BATCH_SIZE):
+            batch = key_values[x:x + SYNC_BATCH_SIZE]
+            sql = source_query + ' WHERE ' + predicate.format(separator.join([term] * len(batch)))
+            s_cursor.execute(sql, [v for key in batch for v in key])
+            rows = s_cursor.fetchall()
+            if len(rows) == 0:
+                continue
+            columns = [quote(d[0]) for d in s_cursor.description]
+            insert = 'INSERT INTO ' + t_table + ' (' + ','.join(columns) + ') VALUES (' + ','.join(['?'] * len(columns)) + ')'
+            t_cursor.executemany(insert, rows)
+            copied += len(rows)
+        if not t_jdbc.auto_commit:
+            t_jdbc.connection.commit()
+    finally:
+        s_cursor.close()
+        t_cursor.close()
+    return copied
+
+
+def sync_table(s_jdbc, t_jdbc, source_query: str, s_table: str, t_table: str, keys: list):
+    """
+    Prepare the incremental copy of a table.
+
+    For a single integer key, the source query is restricted to the differing key ranges. It also selects rows,
+    which are already in the target: copy it in insert,update mode on the key columns. Nothing is deleted, so
+    a failed copy leaves the target as it was. Otherwise the missing rows are copied here, and None is returned.
+
+    @param s_jdbc: Jdbc - source connection
+    @param t_jdbc: Jdbc - target connection
+    @param source_query: str - query of the columns to copy, without WHERE clause
+    @param s_table: str - source table, as used in SQL
+    @param t_table: str - target table, as used in SQL
+    @param keys: list - names of the key columns
+    @return: str - the restricted source query, or None if nothing is left to copy
+    """
+    ranges = None
+    if len(keys) == 1:
+        ranges = diff_key_ranges(s_jdbc, t_jdbc, s_table, t_table, keys[0])
+
+    if ranges is not None:
+        print('Copying %d differing key ranges.' % len(ranges))
+        if len(ranges) == 0:
+            return None
+        return source_query + ' WHERE ' + range_predicate(keys[0], ranges)
+
+    key_values = missing_keys(s_jdbc, t_jdbc, s_table, t_table, keys)
+    print('Copying %d missing rows.' % len(key_values))
+    if len(key_values) > 0:
+        copy_rows_by_key(s_jdbc, t_jdbc, source_query, t_table, keys, key_values)
+    return None
@@ -36,26 +36,29 @@ from jaydebeapi import DatabaseError
 from jpype import JPackage
 
 from .exceptions import SQLExcecuteException, CommitException
-from .jdbc import Jdbc, DummyJdbc, COLUMN_TYPE_DATE, COLUMN_TYPE_FLOAT, COLUMN_TYPE_NUMBER
+from .jdbc import Jdbc, DummyJdbc, COLUMN_TYPE_DATE, COLUMN_TYPE_FLOAT, COLUMN_TYPE_NUMBER, string2java_string
+from .pk_allocator import PkAllocator
+from .statement_log import StatementBuffer, StatementLogWriter, PIPE_BUFFER_SIZE
 from .utils import *
 
 UPLOAD_MODE_DRYRUN = 'dryrun'
 UPLOAD_MODE_PIPE = 'pipe'
 UPLOAD_MODE_COMMIT = 'commit'
 UPLOAD_MODE_ROLLBACK = 'rollback'
+# commit, with the bulk load API of the driver where available (see MultiParameterUploader)
+UPLOAD_MODE_BULK = 'bulk'
 
 # PK_COUNTERS
-# For update of integer primary keys without database IO
+# For update of integer primary keys without database IO per row. Keys are reserved in blocks, shared by all
+# uploaders of the process. Set PK_COUNTERS.lock_dir to share them with uploaders in other processes.
 #
-# Structure:
-# login->table->column_name
-#
-PK_COUNTERS = dict()
+PK_COUNTERS = PkAllocator()
 
 
 def get_pk_counter(jdbc: (Jdbc, DummyJdbc), table_name: str, column_name: str, increment=1) -> int:
     """
-    Internal factory to keep track of PK table counters over multiple Jdbc Instances
+    Internal factory to keep track of PK table counters over multiple Jdbc Instances.
+    Thread safe, and process safe if PK_COUNTERS.lock_dir is set.
 
     @param jdbc: Jdbc - database connection, fines the database scheme
     @param table_name: str - name of the able
@@ -63,18 +66,53 @@ def get_pk_counter(jdbc: (Jdbc, DummyJdbc), table_name: str, column_name: str, i
     @param increment: int - increment on call. Defaults to 1
     @return: int - the next value (increnented by increment)
     """
+    return PK_COUNTERS.next_value(jdbc, table_name, column_name, increment)
+
+
+def get_copy_manager(jdbc: Jdbc):
+    """
+    @return: the CopyManager of a PostgreSQL connection, or None if the driver has no bulk load API
+    """
+    try:
+        base_connection = JPackage('org').postgresql.core.BaseConnection.class_
+        jconn = jdbc.connection.jconn
+        if not jconn.isWrapperFor(base_connection):
+            return None
+        return JPackage('org').postgresql.copy.CopyManager(jconn.unwrap(base_connection))
+    except Exception:
+        return None
 
-    global PK_COUNTERS
-    login = jdbc.login
-    if login not in PK_COUNTERS:
-        PK_COUNTERS[login] = dict()
-    if table_name not in PK_COUNTERS[login]:
-        PK_COUNTERS[login][table_name] = dict()
-    if column_name not in PK_COUNTERS[login][table_name]:
-        PK_COUNTERS[login][table_name][column_name] = jdbc.get_int(
-            "SELECT MAX(%s) FROM %s" % (column_name, table_name))
-    PK_COUNTERS[login][table_name][column_name] += increment
-    return PK_COUNTERS[login][table_name][column_name]
+
+def copy_text_value(value) -> str:
+    """
+    @return: str - the value in the text format of COPY ... FROM STDIN
+    """
+    if value is None:
+        return '\\N'
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, (bytes, bytearray)):
+        # bytea in hex format, with the backslash escaped for the text format
+        return '\\\\x' + bytes(value).hex()
+    elif isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    text = value if isinstance(value, str) else str(value)
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(copy_manager, table: str, columns: list, rows: list) -> int:
+    """
+    Load rows with COPY ... FROM STDIN in text format
+    @param copy_manager: org.postgresql.copy.CopyManager
+    @param table: str - target table, as used in SQL
+    @param columns: list - column names, as used in SQL
+    @param rows: list of lists of values in the order of columns
+    @return: int - number of loaded rows
+    """
+    sql = 'COPY {0} ({1}) FROM STDIN'.format(table, ','.join(columns))
+    text = ''.join(['\t'.join([copy_text_value(v) for v in row]) + '\n' for row in rows])
+    reader = JPackage('java').io.StringReader(string2java_string(text))
+    return int(copy_manager.copyIn(sql, reader))
 
 
 class NativeExpression:
@@ -97,14 +135,27 @@ class Uploader:
         Base uploader class
         @param jdbc: Jdbc - JDBC connection wrapper
         @param table: str - name of the destination table in the database
-
+        @param kwargs: optional
+            - columns: OrderedDict - columns of the table, instead of reading them from the database
+            - pipe_buffer_size: int - statements kept in memory in pipe mode. More are spilled to a temporary file
+            - statement_log: str or binary stream - write the statements to a binary log (see statement_log.py),
+              which can be replayed on a connection with replay_statement_log(). Statements are written when
+              they are committed (in dryrun and pipe mode: on each commit). Failed and rolled back statements
+              are not written. A log opened from a path is closed at the end of the with block
         """
 
         self.jdbc = jdbc
         self.cursor = None
         self.row_count = 0
         self.total_row_count = 0
-        self.pipe_buffer = []
+        self.pipe_buffer_size = kwargs.get('pipe_buffer_size', PIPE_BUFFER_SIZE)
+        self.pipe_buffer = StatementBuffer(self.pipe_buffer_size)
+        self.statement_log = None
+        # statements of the current transaction, written to the statement log on commit
+        self.log_buffer = None
+        if kwargs.get('statement_log') is not None:
+            self.statement_log = StatementLogWriter(kwargs['statement_log'])
+            self.log_buffer = StatementBuffer(self.pipe_buffer_size)
 
         self.table = table
         self.fstream = fstream
@@ -120,7 +171,12 @@ class Uploader:
         error_message = None
         if ('columns' in kwargs) and (isinstance(kwargs['columns'], OrderedDict)):
             self.columns = copy.deepcopy(kwargs['columns'])
-        else:
+        elif isinstance(jdbc, Jdbc) and (jdbc.connection is not None):
+            try:
+                self.columns = jdbc.get_table_columns(table)
+            except Exception as metadata_error:
+                print('WARNING: no metadata for table %s: %s' % (table, str(metadata_error)), file=sys.stderr)
+        if self.columns is None:
             try:
                 c = self.cursor = jdbc.execute('SELECT * FROM %s WHERE 0=1' % table)
                 self.columns = jdbc.get_columns(c)
@@ -136,24 +192,34 @@ class Uploader:
     def __enter__(self):
         if self.row_count > 0:
             print('WARNING: %d commands erased from %s.' % (self.row_count, type(self).__name__), file=sys.stderr)
-            if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK]:
+            if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK, UPLOAD_MODE_BULK]:
                 self.jdbc.rollback()
 
         self.row_count = 0
         self.has_sql_errors = False
-        self.pipe_buffer = []
+        self.pipe_buffer.clear()
+        if self.log_buffer is not None:
+            self.log_buffer.clear()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.commit()
+        try:
+            self.commit()
+        finally:
+            if self.statement_log is not None:
+                self.statement_log.close()
+                self.statement_log = None
+                self.log_buffer.clear()
+                self.log_buffer = None
 
     def _insert_or_update(self, sql, parameters=None):
         """
         Internal function handling either an insert, or an update command
         @param sql: str - generated sql for insert or update
         @param parameters: list or None, associated parameters, if any
+        @return: the error of a failed command, if it did not raise (exit_on_fail is False)
         """
-        if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK]:
+        if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK, UPLOAD_MODE_BULK]:
             exec_error = None
             try:
                 self.cursor = self.jdbc.execute(sql, parameters, self.cursor)
@@ -167,28 +233,33 @@ class Uploader:
                 self.has_sql_errors = True
                 raise SQLExcecuteException('Insert command failed: ' + str(exec_error))
         elif self.commit_mode in [UPLOAD_MODE_DRYRUN, UPLOAD_MODE_PIPE]:
+            exec_error = None
             n = 1
             if isinstance(parameters, list) and (len(parameters) > 0) and isinstance(parameters[0], list):
                 n = len(parameters)
             if self.commit_mode == UPLOAD_MODE_PIPE:
                 self.pipe_buffer.append((sql, parameters))
         else:
-            supported_modes = [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK, UPLOAD_MODE_DRYRUN, UPLOAD_MODE_PIPE]
+            supported_modes = [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK, UPLOAD_MODE_DRYRUN, UPLOAD_MODE_PIPE,
+                               UPLOAD_MODE_BULK]
             raise ValueError('Illegal mode. Supperted: %s. Found %s' % (supported_modes, self.commit_mode))
 
         if n > 0:
             self.row_count += n
             self.total_row_count += n
+        if (self.log_buffer is not None) and (exec_error is None):
+            self.log_buffer.append((sql, parameters))
         if self.fstream is not None:
             if parameters is not None:
                 sql = '%s %s' % (sql, str(parameters))
             print(sql + ";", file=self.fstream)
+        return exec_error
 
     @staticmethod
     def set_commit_mode(commit_mode):
         if isinstance(commit_mode, str) and (
                 commit_mode.strip().lower() in [UPLOAD_MODE_DRYRUN, UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK,
-                                                UPLOAD_MODE_PIPE]):
+                                                UPLOAD_MODE_PIPE, UPLOAD_MODE_BULK]):
             return commit_mode.strip().lower()
         else:
             return UPLOAD_MODE_DRYRUN
@@ -197,6 +268,7 @@ class Uploader:
         """
         Mark columns as counters. Assumes the column type is a number.
         Queries the maximum number of each column and then adds the next value (+1) in the column on each insert.
+        The values are unique over parallel uploaders (see PK_COUNTERS).
 
         @param columns: columns to mark as a counter. May be a (comma-seprated) string, a list, set, or a tuple
         """
@@ -267,30 +339,51 @@ class Uploader:
         return self.escape_column_names([column_name])[0]
 
     def commit(self):
+        """
+        Commit or roll back according to the commit mode
+        @return: in pipe mode the StatementBuffer of the (sql, parameters) statements since the last commit
+        """
         if self.row_count <= 0:
             return
 
         error = None
-        if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK]:
+        committed = self.commit_mode in [UPLOAD_MODE_DRYRUN, UPLOAD_MODE_PIPE]
+        if self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_ROLLBACK, UPLOAD_MODE_BULK]:
             try:
-                if (self.commit_mode == UPLOAD_MODE_COMMIT) and (not self.has_sql_errors):
+                if (self.commit_mode in [UPLOAD_MODE_COMMIT, UPLOAD_MODE_BULK]) and (not self.has_sql_errors):
                     self.jdbc.commit(self.cursor)
+                    committed = True
                 else:
                     self.jdbc.rollback(self.cursor)
-            except (SQLExcecuteException, LookupError, CommitException) as commit_exception:
+            except Exception as commit_exception:
+                # also the exceptions of lwetl connections, as used by db_copy
                 error = commit_exception
         elif (self.commit_mode == UPLOAD_MODE_DRYRUN) and (self.fstream is not None):
             print('DRY-RUN COMMIT %s %d rows.' % (self.table, self.row_count), file=self.fstream)
+        self._write_statement_log(committed)
 
         self.cursor = None
         self.row_count = 0
+        self.has_sql_errors = False
         if error is not None:
             raise CommitException(str(error))
         if self.commit_mode == UPLOAD_MODE_PIPE:
-            buffer = [e for e in self.pipe_buffer]
-            self.pipe_buffer = []
+            buffer = self.pipe_buffer
+            self.pipe_buffer = StatementBuffer(self.pipe_buffer_size)
             return buffer
 
+    def _write_statement_log(self, committed: bool):
+        """
+        Write the statements of the transaction to the statement log if it was committed, and forget them
+        """
+        if self.log_buffer is None:
+            return
+        if committed:
+            for sql, parameters in self.log_buffer:
+                self.statement_log.write(sql, parameters)
+            self.statement_log.flush()
+        self.log_buffer.clear()
+
 
 class NativeUploader(Uploader):
     """
@@ -646,6 +739,7 @@ class ParameterUploader(Uploader):
 class MultiParameterUploader(ParameterUploader):
     """
         Upload data into a table using the jdbc executemany parameterized command.
+        In commit mode 'bulk' the rows are loaded with COPY on PostgreSQL, and with executemany otherwise.
         Supports:
         - insert
     """
@@ -655,14 +749,17 @@ class MultiParameterUploader(ParameterUploader):
         super(MultiParameterUploader, self).__init__(jdbc, table, fstream=fstream, commit_mode=commit_mode,
                                                      exit_on_fail=exit_on_fail, **kwargs)
         self.data_buffer = []
-        self.used_keys = []
+        self.used_keys = set()
         if self.commit_mode == UPLOAD_MODE_PIPE:
             raise ValueError("Commit mode '%s' not allowed for this class." % self.commit_mode)
+        self.copy_manager = None
+        if self.commit_mode == UPLOAD_MODE_BULK:
+            self.copy_manager = get_copy_manager(jdbc)
 
     def __enter__(self):
         super(MultiParameterUploader, self).__enter__()
         self.data_buffer = []
-        self.used_keys = []
+        self.used_keys = set()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -671,29 +768,88 @@ class MultiParameterUploader(ParameterUploader):
     def insert(self, data: dict):
         dd = dict()
         for column_name, value in self._filter_data(data).items():
-            dd[column_name] = self._convert(column_name, value)
+            # converted on commit in bulk mode: COPY takes the python values
+            dd[column_name] = value if self.commit_mode == UPLOAD_MODE_BULK else self._convert(column_name, value)
         for column_name in [k for k in self.counters if k not in dd]:
             dd[column_name] = get_pk_counter(self.jdbc, self.table, column_name)
         if len(dd) > 0:
-            self.used_keys += [k for k in dd.keys() if k not in self.used_keys]
+            self.used_keys.update(dd.keys())
             self.data_buffer.append(dd)
             self.row_count += 1
 
     def commit(self):
+        """
+        Send the buffered rows to the database as a single batch (executemany) and commit.
+        On an SQL error the whole batch is rolled back and discarded, and the next batch starts clean.
+        """
         if len(self.data_buffer) == 0:
             return
 
         keys = [k for k in self.columns.keys() if k in self.used_keys]
-        parameters = []
-        for data in self.data_buffer:
-            values = []
-            for column_name in keys:
-                values.append(data.get(column_name, None))
-            parameters.append(values)
+        if self.copy_manager is not None:
+            return self._copy_commit(keys)
+
+        if self.commit_mode == UPLOAD_MODE_BULK:
+            parameters = [[self._convert(column_name, data[column_name]) if column_name in data else None
+                           for column_name in keys] for data in self.data_buffer]
+        else:
+            parameters = [[data.get(column_name, None) for column_name in keys] for data in self.data_buffer]
 
         sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(self.table, ','.join(self.escape_column_names(keys)),
                                                           ','.join(['?'] * len(keys)))
-        self._insert_or_update(sql, parameters)
-        self.data_buffer = []
-        self.used_keys = []
+        try:
+            error = self._insert_or_update(sql, parameters)
+        except SQLExcecuteException:
+            self._discard_batch()
+            raise
+        finally:
+            self.data_buffer = []
+            self.used_keys = set()
+        if error is not None:
+            self._discard_batch()
+            return
         super(ParameterUploader, self).commit()
+
+    def _discard_batch(self):
+        """
+        Roll back a failed batch. Rows of the batch that the driver may have applied are not committed
+        with the next batch
+        """
+        try:
+            if not self.jdbc.auto_commit:
+                self.jdbc.connection.rollback()
+        finally:
+            self.cursor = None
+            self.row_count = 0
+            self.has_sql_errors = False
+            self._write_statement_log(False)
+
+    def _copy_commit(self, keys: list):
+        """
+        Load the buffered rows with COPY and commit. On an error the whole batch is rolled back
+        """
+        rows = [[data.get(column_name, None) for column_name in keys] for data in self.data_buffer]
+        self.data_buffer = []
+        self.used_keys = set()
+        error = None
+        with self.jdbc.statistics as stt:
+            try:
+                n = copy_rows(self.copy_manager, self.table, self.escape_column_names(keys), rows)
+                stt.add_exec_count()
+                stt.add_row_count(n)
+                if not self.jdbc.auto_commit:
+                    self.jdbc.connection.commit()
+            except Exception as copy_error:
+                error = copy_error
+                if not self.jdbc.auto_commit:
+                    self.jdbc.connection.rollback()
+        self.row_count = 0
+        if self.statement_log is not None:
+            # logged as the equivalent INSERT batch, which can be replayed on any database
+            if error is None:
+                sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                    self.table, ','.join(self.escape_column_names(keys)), ','.join(['?'] * len(keys)))
+                self.log_buffer.append((sql, rows))
+            self._write_statement_log(error is None)
+        if error is not None:
+            raise SQLExcecuteException('Bulk load failed: ' + str(error))
@@ -39,6 +39,7 @@ def main():
 
     config = XMLSettings(config_path)
     merge = bool(strtobool(config.get('options/merge')))
+    workers = int(config.get('options/workers', '1'))
 
     tree = ET.parse(config_path)
     folders = list(tree.find('folders'))
@@ -51,7 +52,7 @@ def main():
     results = {}
     for folder in folders:
         base_target_dir = os.path.join(project_dir, folder.tag)
-        msg, file_count, errors, originals = convert_folder(folder.text, base_target_dir, tmp_dir, merge=merge)
+        msg, file_count, errors, originals = convert_folder(folder.text, base_target_dir, tmp_dir, merge=merge, workers=workers)
         results[folder.text] = msg
 
     # print('\n')
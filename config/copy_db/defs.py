@@ -16,14 +16,19 @@
 import os
 import sys
 from subprocess import check_output, STDOUT
+from time import time
 import tarfile
 import jpype as jp
 import jpype.imports
 from pathlib import Path
 import xml.etree.ElementTree as ET
 from database.jdbc import Jdbc
+from database.pool import JDBC_POOL, close_unpooled
+from database.row_count import RowCounter
+from database.batch_size import BatchSizer, get_batch_size_statistics
+from database.sync import sync_table
 from common.jvm import init_jvm, wb_batch
-from common.xml import indent
+from common.schema_model import load_schema_model
 from dataclasses import dataclass
 
 
@@ -173,21 +178,21 @@ def export_db_schema(source, target, bin_dir, class_path, java_path, MAX_JAVA_HE
 
 
 def get_db_meta(jdbc):
-    db_tables = {}
     table_columns = {}
     conn = jdbc.connection
     cursor = conn.cursor()
     tables = get_tables(conn, jdbc.db_schema)
 
-    # Get row count per table:
-    for table in tables:
-        cursor.execute('SELECT COUNT(*) from "' + table + '";')
-        (row_count,) = cursor.fetchone()
-        db_tables[table] = row_count
+    # Get row count per table (exact, since written to metadata.xml):
+    db_tables = RowCounter.from_pool(jdbc).exact(tables)
 
-        # Get column names of table:
-        cursor.execute('SELECT * from "' + table + '"')
-        table_columns[table] = [str(desc[0]) for desc in cursor.description]
+    for table in tables:
+        # Get column names of table (from the metadata, shared with later calls on the same schema):
+        columns = jdbc.get_table_columns(table, upper_case=False)
+        if columns is None:
+            cursor.execute('SELECT * from "' + table + '" WHERE 0=1')
+            columns = [str(desc[0]) for desc in cursor.description]
+        table_columns[table] = list(columns)
 
     cursor.close()
     conn.close()
@@ -195,11 +200,9 @@ def get_db_meta(jdbc):
 
 
 def add_row_count_to_schema_file(subsystem_dir, db_tables):
-    schema_file = subsystem_dir + '/header/metadata.xml'
-    tree = ET.parse(schema_file)
+    model = load_schema_model(subsystem_dir + '/header/metadata.xml')
 
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
+    for table_def in model.table_defs:
         table_name = table_def.find("table-name")
 
         disposed = ET.Element("disposed")
@@ -218,9 +221,7 @@ def add_row_count_to_schema_file(subsystem_dir, db_tables):
         table_def.insert(6, disposed)
         table_def.insert(7, disposal_comment)
 
-    root = tree.getroot()
-    indent(root)
-    tree.write(schema_file, encoding='utf-8')
+    model.save()
 
 
 def table_check(incl_tables, skip_tables, overwrite_tables, db_tables):
@@ -260,74 +261,45 @@ def get_target_tables(jdbc):
         target_tables[table] = row_count
 
     cursor.close()
-    conn.close()
+    close_unpooled(jdbc)
     return target_tables
 
 
 def get_blob_columns(subsystem_dir, export_tables):
     blob_columns = {}
-    schema_file = subsystem_dir + '/header/metadata.xml'
-    tree = ET.parse(schema_file)
-
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
-        table_name = table_def.find("table-name")
-        if table_name.text not in export_tables:
-            continue
+    model = load_schema_model(subsystem_dir + '/header/metadata.xml')
 
+    for table in export_tables:
         columns = []
-        column_defs = table_def.findall("column-def")
-        for column_def in column_defs:
-            column_name = column_def.find('column-name')
+        for column_name, column_def in model.column_defs(table).items():
             java_sql_type = column_def.find('java-sql-type')
             if int(java_sql_type.text) in (-4, -3, -2, 2004, 2005, 2011):
-                columns.append(column_name.text)
+                columns.append(column_name)
 
         if columns:
-            blob_columns[table_name.text] = columns
+            blob_columns[table] = columns
 
     return blob_columns
 
 
 def get_primary_keys(subsystem_dir, export_tables):
     pk_dict = {}
-    schema_file = subsystem_dir + '/header/metadata.xml'
-    tree = ET.parse(schema_file)
-
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
-        table_name = table_def.find("table-name")
-        if table_name.text not in export_tables:
-            continue
-
-        pk_list = []
-        column_defs = table_def.findall("column-def")
-        for column_def in column_defs:
-            column_name = column_def.find('column-name')
-            primary_key = column_def.find('primary-key')
-
-            if primary_key.text == 'true':
-                pk_list.append(column_name.text)
+    model = load_schema_model(subsystem_dir + '/header/metadata.xml')
 
+    for table in export_tables:
+        pk_list = model.primary_key(table)
         if pk_list:
-            pk_dict[table_name.text] = pk_list
+            pk_dict[table] = list(pk_list)
 
     return pk_dict
 
 
 def get_unique_indexes(subsystem_dir, export_tables):
     unique_dict = {}
-    schema_file = subsystem_dir + '/header/metadata.xml'
-    tree = ET.parse(schema_file)
+    model = load_schema_model(subsystem_dir + '/header/metadata.xml')
 
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
-        table_name = table_def.find("table-name")
-        if table_name.text not in export_tables:
-            continue
-
-        index_defs = table_def.findall("index-def")
-        for index_def in index_defs:
+    for table in export_tables:
+        for index_def in model.index_defs(table):
             unique = index_def.find('unique')
             primary_key = index_def.find('primary-key')
 
@@ -337,7 +309,7 @@ def get_unique_indexes(subsystem_dir, export_tables):
                 for index_column_name in index_column_names:
                     unique_constraint_name = index_column_name.attrib['name']
                     unique_col_list.append(unique_constraint_name)
-                unique_dict[table_name.text] = unique_col_list
+                unique_dict[table] = unique_col_list
                 break  # Only need one unique column
 
     return unique_dict
@@ -351,7 +323,8 @@ def run_ddl(jdbc, sql):
         cursor.execute(sql)
         cursor.close()
         conn.commit()
-        conn.close()
+        jdbc.clear_column_cache()
+        close_unpooled(jdbc)
     except Exception as e:
         result = e
 
@@ -365,30 +338,20 @@ def run_select(jdbc, sql):
     cursor.execute(sql)
     result = cursor.fetchall()
     cursor.close()
-    conn.close()
+    close_unpooled(jdbc)
     return result
 
 
-def gen_sync_table(table, columns, target_url, driver_jar, driver_class, source_query, target_schema):
-    print("Syncing table '" + table + "'...")
-    source_query = source_query + ' WHERE ('
-    target_query = 'SELECT '
-
-    for col in columns:
-        source_query = source_query + '"' + col + '", '
-        target_query = target_query + '"' + col + '", '
+def sync_params(keys):
+    # Rader i ulike nøkkelområder som allerede finnes i target oppdateres i stedet for å slettes først
+    return '-mode=insert,update -keyColumns=' + ','.join(keys)
 
-    source_query = source_query[:-2]
-    target_query = target_query[:-2] + ' FROM "' + table + '";'
 
-    t_jdbc = Jdbc(target_url, '', '', '', target_schema, driver_jar, driver_class, True, True)
-    target_values = run_select(t_jdbc, target_query)
-    if len(columns) > 1:  # Compound key
-        source_query = source_query + ') NOT IN (' + ', '.join(map(str, target_values)) + ')'
-    else:
-        source_query = source_query + ") NOT IN ('" + "','".join(map(str, ([x[0] for x in target_values]))) + "')"
-
-    return source_query
+def gen_sync_table(table, columns, s_jdbc, t_jdbc, source_query, source_table, target_table):
+    # Only rows in key ranges (or hash buckets) that differ between source and target are copied
+    print("Syncing table '" + table + "'...")
+    with JDBC_POOL.connection(s_jdbc.url, s_jdbc.usr, s_jdbc.pwd, s_jdbc.db_name, s_jdbc.db_schema, s_jdbc.driver_jar, s_jdbc.driver_class, True, True) as s_conn:
+        return sync_table(s_conn, t_jdbc, source_query, source_table, target_table, columns)
 
 
 def create_index(table, pk_dict, unique_dict, ddl):
@@ -415,7 +378,14 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, java_path, max_java_heap,
         target_url = target_url + ';autocommit=off'
 
     target_url, driver_jar, driver_class = get_db_details(target_url, bin_dir)
-    t_jdbc = Jdbc(target_url, '', '', '', schema, driver_jar, driver_class, True, True)
+    t_jdbc = JDBC_POOL.checkout(target_url, '', '', '', schema, driver_jar, driver_class, True, True)
+    try:
+        copy_tables(subsystem_dir, s_jdbc, t_jdbc, batch, export_tables, table_columns, overwrite_tables, DDL_GEN, target_url, schema)
+    finally:
+        JDBC_POOL.checkin(t_jdbc)
+
+
+def copy_tables(subsystem_dir, s_jdbc, t_jdbc, batch, export_tables, table_columns, overwrite_tables, DDL_GEN, target_url, schema):
     target_tables = get_target_tables(t_jdbc)
     pk_dict = get_primary_keys(subsystem_dir, export_tables)
     unique_dict = get_unique_indexes(subsystem_dir, export_tables)
@@ -425,10 +395,15 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, java_path, max_java_heap,
         ddl_columns = get_ddl_columns(subsystem_dir)
 
     mode = '-mode=INSERT'
-    std_params = ' -ignoreIdentityColumns=false -removeDefaults=true -commitEvery=1000 '
+    # WbCopy kopierer hele tabellen i én kjøring: hver tabell får sin egen sizer, som starter på
+    # størrelsen forrige tabell endte på
+    sizer = None
     previous_export = []
     for table, row_count in export_tables.items():
         insert = True
+        sizer = BatchSizer(table, initial=sizer.size if sizer else 1000)
+        commit_every = sizer.size
+        std_params = ' -ignoreIdentityColumns=false -removeDefaults=true -commitEvery=' + str(commit_every) + ' '
         params = mode + std_params
 
         col_query = ''
@@ -436,7 +411,9 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, java_path, max_java_heap,
             for column in blob_columns[table]:
                 col_query = ',LENGTH("' + column + '") AS ' + column.upper() + '_BLOB_LENGTH_PWCODE'
 
-        source_query = 'SELECT "' + '","'.join(table_columns[table]) + '"' + col_query + ' FROM "' + s_jdbc.db_schema + '"."' + table + '"'
+        source_table = '"' + s_jdbc.db_schema + '"."' + table + '"'
+        target_table = '"' + schema + '"."' + table + '"'
+        source_query = 'SELECT "' + '","'.join(table_columns[table]) + '"' + col_query + ' FROM ' + source_table
 
         if table in target_tables and table not in overwrite_tables:
             t_row_count = target_tables[table]
@@ -446,18 +423,22 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, java_path, max_java_heap,
             elif t_row_count > row_count:
                 print_and_exit("Error. More data in target than in source. Table '" + table + "'. Exiting.")
             elif table in pk_dict:
-                source_query = gen_sync_table(table, pk_dict[table], target_url, driver_jar, driver_class, source_query, schema)
+                source_query = gen_sync_table(table, pk_dict[table], s_jdbc, t_jdbc, source_query, source_table, target_table)
+                params = sync_params(pk_dict[table]) + std_params
                 insert = False
             elif table in unique_dict:
-                source_query = gen_sync_table(table, unique_dict[table], target_url, driver_jar, driver_class, source_query, schema)
+                source_query = gen_sync_table(table, unique_dict[table], s_jdbc, t_jdbc, source_query, source_table, target_table)
+                params = sync_params(unique_dict[table]) + std_params
                 insert = False
 
+            if source_query is None:
+                continue
+
         if insert:
             print("Copying table '" + table + "':")
             if DDL_GEN == 'SQL Workbench':
                 params = mode + std_params + ' -createTarget=true -dropTarget=true'
             elif DDL_GEN == 'Native':
-                t_jdbc = Jdbc(target_url, '', '', '', schema, driver_jar, driver_class, True, True)
                 ddl = '\nCREATE TABLE "' + schema + '"."' + table + '"\n(\n' + ddl_columns[table][:-1] + '\n);'
                 # ddl = '\nCREATE TABLE "' + table + '"\n(\n' + ddl_columns[table][:-1] + '\n);'
                 ddl = create_index(table, pk_dict, unique_dict, ddl)
@@ -467,20 +448,24 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, java_path, max_java_heap,
 
             if table in blob_columns:
                 for column in blob_columns[table]:
-                    t_jdbc = Jdbc(target_url, '', '', '', schema, driver_jar, driver_class, True, True)
                     sql = 'ALTER TABLE "' + schema + '"."' + table + '" ADD COLUMN ' + column.upper() + '_BLOB_LENGTH_PWCODE VARCHAR(255);'
                     run_ddl(t_jdbc, sql)
 
         batch.runScript("WbConnect -url='" + s_jdbc.url + "' -password=" + s_jdbc.pwd + ";")
         target_conn = '"username=,password=,url=' + target_url + '" ' + params
-        target_table = '"' + schema + '"."' + table + '"'
         copy_data_str = "WbCopy -targetConnection=" + target_conn + " -targetSchema=" + schema + " -targetTable=" + target_table + " -sourceQuery=" + source_query + ";"
+        t0 = time()
         result = batch.runScript(copy_data_str)
+        seconds = time() - t0
         batch.runScript("WbDisconnect;")
         jp.java.lang.System.gc()
         if str(result) == 'Error':
             print_and_exit("Error on copying table '" + table + "'\nScroll up for details.")
 
+        # Rader som faktisk ble kopiert (ved sync bare de som manglet):
+        copied = int(run_select(t_jdbc, 'SELECT COUNT(*) FROM ' + target_table)[0][0]) - (0 if insert else t_row_count)
+        sizer.update_run(copied, seconds, commit_every)
+
     if len(previous_export) == len(export_tables.keys()):
         print('All tables already exported.')
     elif not previous_export:
@@ -488,6 +473,10 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, java_path, max_java_heap,
     else:
         print('Database export complete. ' + str(len(previous_export)) + ' of ' + str(len(export_tables.keys())) + ' tables were already exported.')
 
+    batch_sizes = get_batch_size_statistics()
+    if batch_sizes:
+        print(batch_sizes)
+
 
 # WAIT: Mangler disse for å ha alle i JDBC 4.0: ROWID=-8 og SQLXML=2009
 # jdbc-id  iso-name               jdbc-name
@@ -526,11 +515,9 @@ jdbc_to_iso_data_type = {
 
 def get_ddl_columns(subsystem_dir):
     ddl_columns = {}
-    schema_file = subsystem_dir + '/header/metadata.xml'
-    tree = ET.parse(schema_file)
+    model = load_schema_model(subsystem_dir + '/header/metadata.xml')
 
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
+    for table_def in model.table_defs:
         table_name = table_def.find("table-name")
         disposed = table_def.find("disposed")
 
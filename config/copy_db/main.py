@@ -2,6 +2,7 @@ import shutil
 import os
 import sys
 from common.xml_settings import XMLSettings
+from database.profiles import load_profile_overrides
 
 if os.name != "posix":
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -42,6 +43,7 @@ def main():
         shutil.copyfile(tmp_config_path, config_path)
 
     config = XMLSettings(config_path)
+    load_profile_overrides(config_path)
     memory = '-Xmx' + config.get('options/memory').split(' ')[0] + 'g'
     ddl = config.get('options/ddl')
 
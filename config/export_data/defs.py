@@ -16,6 +16,7 @@
 from multiprocessing.sharedctypes import Value
 import os
 from subprocess import check_output, STDOUT
+from time import time
 import tarfile
 import sys
 import jpype as jp
@@ -24,8 +25,12 @@ from pathlib import Path
 import xml.etree.ElementTree as ET
 from database.jdbc import Jdbc
 from common.jvm import init_jvm, wb_batch
-from common.xml import indent
+from common.schema_model import load_schema_model
 from common.database import run_select
+from database.pool import JDBC_POOL
+from database.row_count import RowCounter
+from database.batch_size import BatchSizer, get_batch_size_statistics
+from database.sync import sync_table
 import re
 import shutil
 
@@ -216,7 +221,7 @@ def test_db_connect(JDBC_URL, bin_dir, class_path,  java_path, MAX_JAVA_HEAP, DB
             # TODO: Legg inn sjekk på at jdbc url er riktig, ikke bare på om db_name og skjema returnerer tabeller
             if jdbc:
                 # Get database metadata:
-                db_tables, table_columns = get_db_meta(jdbc)  # WAIT: Endre så ikke henter columns og her
+                db_tables, table_columns = get_db_meta(jdbc)
 
                 if not db_tables:
                     return "Database '" + DB_NAME + "', schema '" + DB_SCHEMA + "' returns no tables."
@@ -270,33 +275,26 @@ def export_db_schema(JDBC_URL, bin_dir, class_path, java_path, MAX_JAVA_HEAP, DB
 
 def get_db_meta(jdbc):
     # TODO: Henter samme data flere ganger (her og fra metadata.xml) -> fiks
-    db_tables = {}
     table_columns = {}
     conn = jdbc.connection
     cursor = conn.cursor()
     tables = get_tables(conn, jdbc.db_name, jdbc.db_schema)
+    if jdbc.driver_class != 'interbase.interclient.Driver':
+        if len(jdbc.db_schema) != 0:
+            tables = ['"' + jdbc.db_schema + '"."' + table + '"' for table in tables]
+        else:
+            tables = ['"' + table + '"' for table in tables]
 
-    # Get row count per table:
-    for table in tables:
-        if jdbc.driver_class != 'interbase.interclient.Driver':
-            if len(jdbc.db_schema) != 0:
-                table = '"' + jdbc.db_schema + '"."' + table + '"'
-            else:
-                table = '"' + table + '"'
-
-        get_count = 'SELECT COUNT(*) from ' + table
-        # print(get_count)
-        cursor.execute(get_count)
-        (row_count,) = cursor.fetchone()
-        # print (table + ': ' + str(row_count))
-        db_tables[table] = row_count
+    # Get row count per table (exact, since written to metadata.xml):
+    db_tables = RowCounter.from_pool(jdbc, table_ref=str).exact(tables)
 
-        # Get column names of table:
-        # TODO: Finnes db-uavhengig måte å begrense til kun en linje hentet ut?
-        get_columns = 'SELECT * from ' + table
-        # print(get_columns)
-        cursor.execute(get_columns)
-        table_columns[table] = [str(desc[0]) for desc in cursor.description]
+    for table in tables:
+        # Get column names of table (from the metadata, shared with later calls on the same schema):
+        columns = jdbc.get_table_columns(table, upper_case=False)
+        if columns is None:
+            cursor.execute('SELECT * from ' + table + ' WHERE 0=1')
+            columns = [str(desc[0]) for desc in cursor.description]
+        table_columns[table] = list(columns)
 
     cursor.close()
     conn.close()
@@ -305,11 +303,9 @@ def get_db_meta(jdbc):
 
 def add_row_count_to_schema_file(subsystem_dir, db_tables, schema):
     # TODO: Sjekk om denne skriver riktig til xml-fil!! --> sjekk om feil bare med interbase siden ikke har schema der
-    schema_file = os.path.join(subsystem_dir, 'header', 'metadata.xml')
-    tree = ET.parse(schema_file)
+    model = load_schema_model(os.path.join(subsystem_dir, 'header', 'metadata.xml'))
 
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
+    for table_def in model.table_defs:
         table_schema = table_def.find('table-schema')
         if table_schema.text == schema:
             table_name = table_def.find("table-name")
@@ -330,9 +326,7 @@ def add_row_count_to_schema_file(subsystem_dir, db_tables, schema):
             table_def.insert(6, disposed)
             table_def.insert(7, disposal_comment)
 
-    root = tree.getroot()
-    indent(root)
-    tree.write(schema_file, encoding='utf-8')
+    model.save()
 
 
 def table_check(incl_tables, skip_tables, overwrite_tables, db_tables, jdbc):
@@ -400,43 +394,30 @@ def get_target_tables(jdbc):
 
 def get_primary_keys(subsystem_dir, export_tables):
     pk_dict = {}
-    schema_file = subsystem_dir + '/header/metadata.xml'
-    tree = ET.parse(schema_file)
+    model = load_schema_model(subsystem_dir + '/header/metadata.xml')
 
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
-        table_name = table_def.find("table-name")
-        if table_name.text not in export_tables:
+    for key in model.tables.keys():
+        table_name = key[1]
+        if table_name not in export_tables:
             continue
 
-        pk_list = []
-        column_defs = table_def.findall("column-def")
-        for column_def in column_defs:
-            column_name = column_def.find('column-name')
-            primary_key = column_def.find('primary-key')
-
-            if primary_key.text == 'true':
-                pk_list.append(column_name.text)
-
+        pk_list = model.primary_keys[key]
         if pk_list:
-            pk_dict[table_name.text] = pk_list
+            pk_dict[table_name] = list(pk_list)
 
     return pk_dict
 
 
 def get_unique_indexes(subsystem_dir, export_tables):
     unique_dict = {}
-    schema_file = subsystem_dir + '/header/metadata.xml'
-    tree = ET.parse(schema_file)
+    model = load_schema_model(subsystem_dir + '/header/metadata.xml')
 
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
-        table_name = table_def.find("table-name")
-        if table_name.text not in export_tables:
+    for key in model.tables.keys():
+        table_name = key[1]
+        if table_name not in export_tables:
             continue
 
-        index_defs = table_def.findall("index-def")
-        for index_def in index_defs:
+        for index_def in model.indexes[key]:
             unique = index_def.find('unique')
             primary_key = index_def.find('primary-key')
 
@@ -446,7 +427,7 @@ def get_unique_indexes(subsystem_dir, export_tables):
                 for index_column_name in index_column_names:
                     unique_constraint_name = index_column_name.attrib['name']
                     unique_col_list.append(unique_constraint_name)
-                unique_dict[table_name.text] = unique_col_list
+                unique_dict[table_name] = unique_col_list
                 break  # Only need one unique column
 
     return unique_dict
@@ -460,6 +441,7 @@ def run_ddl(jdbc, sql):
         cursor.execute(sql)
         cursor.close()
         conn.commit()
+        jdbc.clear_column_cache()
         conn.close()
     except Exception as e:
         result = e
@@ -468,26 +450,23 @@ def run_ddl(jdbc, sql):
         print_and_exit(result)
 
 
-def gen_sync_table(table, columns, target_url, driver_jar, driver_class, source_query, schema):
-    print("Syncing table '" + table + "'...")
-    source_query = source_query + ' WHERE ('
-    target_query = 'SELECT '
+def sync_params(keys):
+    # Rader i ulike nøkkelområder som allerede finnes i target oppdateres i stedet for å slettes først
+    return '-mode=insert,update -keyColumns=' + ','.join(keys)
 
-    for col in columns:
-        source_query = source_query + '"' + col + '", '
-        target_query = target_query + '"' + col + '", '
 
-    source_query = source_query[:-2]
-    target_query = target_query[:-2] + ' FROM "' + table + '";'
+def count_target_rows(t_jdbc, table):
+    with JDBC_POOL.connection(t_jdbc.url, '', '', '', t_jdbc.db_schema, t_jdbc.driver_jar, t_jdbc.driver_class, True, True) as t_conn:
+        return int(run_select(t_conn, 'SELECT COUNT(*) FROM "' + t_jdbc.db_schema + '"."' + table + '"')[0][0])
 
-    t_jdbc = Jdbc(target_url, '', '', '', schema, driver_jar, driver_class, True, True)
-    target_values = run_select(t_jdbc, target_query)
-    if len(columns) > 1:  # Compound key
-        source_query = source_query + ') NOT IN (' + ', '.join(map(str, target_values)) + ')'
-    else:
-        source_query = source_query + ") NOT IN ('" + "','".join(map(str, ([x[0] for x in target_values]))) + "')"
 
-    return source_query
+def gen_sync_table(table, columns, s_jdbc, t_jdbc, source_query, source_table, target_table):
+    # Only rows in key ranges (or hash buckets) that differ between source and target are copied
+    print("Syncing table '" + table + "'...")
+    # get_db_meta and get_target_tables close their connections, so pooled connections are used here
+    with JDBC_POOL.connection(s_jdbc.url, s_jdbc.usr, s_jdbc.pwd, s_jdbc.db_name, s_jdbc.db_schema, s_jdbc.driver_jar, s_jdbc.driver_class, True, True) as s_conn, \
+            JDBC_POOL.connection(t_jdbc.url, '', '', '', t_jdbc.db_schema, t_jdbc.driver_jar, t_jdbc.driver_class, True, True) as t_conn:
+        return sync_table(s_conn, t_conn, source_query, source_table, target_table, columns)
 
 
 def create_index(table, pk_dict, unique_dict, ddl, t_count, schema):
@@ -538,13 +517,18 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, max_java_heap, export_tabl
         ddl_columns = get_ddl_columns(subsystem_dir, s_jdbc, pk_dict, unique_dict)
 
     mode = '-mode=INSERT'
-    std_params = ' -ignoreIdentityColumns=false -removeDefaults=true -commitEvery=1000 '
+    # WbCopy kopierer hele tabellen i én kjøring: hver tabell får sin egen sizer, som starter på
+    # størrelsen forrige tabell endte på
+    sizer = None
     previous_export = []
     t_count = 0
     for table, row_count in export_tables.items():
         print('|' + table + '|')
         t_count += 1
         insert = True
+        sizer = BatchSizer(table, initial=sizer.size if sizer else 1000)
+        commit_every = sizer.size
+        std_params = ' -ignoreIdentityColumns=false -removeDefaults=true -commitEvery=' + str(commit_every) + ' '
         params = mode + std_params
 
         col_query = ''
@@ -576,12 +560,17 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, max_java_heap, export_tabl
             elif t_row_count > row_count:
                 print_and_exit("Error. More data in target than in source. Table '" + table + "'. Exiting.")
             elif table in pk_dict:
-                source_query = gen_sync_table(table, pk_dict[table], target_url, driver_jar, driver_class, source_query, target_schema)
+                source_query = gen_sync_table(table, pk_dict[table], s_jdbc, t_jdbc, source_query, source_table, '"' + table + '"')
+                params = sync_params(pk_dict[table]) + std_params
                 insert = False
             elif table in unique_dict:
-                source_query = gen_sync_table(table, unique_dict[table], target_url, driver_jar, driver_class, source_query, target_schema)
+                source_query = gen_sync_table(table, unique_dict[table], s_jdbc, t_jdbc, source_query, source_table, '"' + table + '"')
+                params = sync_params(unique_dict[table]) + std_params
                 insert = False
 
+            if source_query is None:
+                continue
+
         # target_table = target_schema + '"."' + table
         if insert:
             print('Copying table ' + table + ':')
@@ -616,12 +605,18 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, max_java_heap, export_tabl
         target_conn = '"username=,password=,url=' + target_url + '" ' + params
         copy_data_str = "WbCopy -targetConnection=" + target_conn + " -targetTable=" + table + " -sourceQuery=" + source_query + ";"
         print(copy_data_str)
+        t0 = time()
         result = batch.runScript(copy_data_str)
+        seconds = time() - t0
         batch.runScript("WbDisconnect;")
         jp.java.lang.System.gc()
         if str(result) == 'Error':
             print_and_exit("Error on copying table '" + table + "'\nScroll up for details.")
 
+        # Rader som faktisk ble kopiert (ved sync bare de som manglet):
+        copied = count_target_rows(t_jdbc, table) - (0 if insert else t_row_count)
+        sizer.update_run(copied, seconds, commit_every)
+
     # TODO: Sørg for at prosess som kopierer db helt sikkert avsluttet før pakker som tar
     # --> se TODO i common.jvm.py
     if len(previous_export) == len(export_tables.keys()):
@@ -631,6 +626,10 @@ def copy_db_schema(subsystem_dir, s_jdbc, class_path, max_java_heap, export_tabl
     else:
         print('Database export complete. ' + str(len(previous_export)) + ' of ' + str(len(export_tables.keys())) + ' tables were already exported.')
 
+    batch_sizes = get_batch_size_statistics()
+    if batch_sizes:
+        print(batch_sizes)
+
 
 # WAIT: Mangler denne for å ha alle i JDBC 4.0: SQLXML=2009
 # -> må ha reelle data å teste det på først. Takler sqlwb det eller må det egen kode til?
@@ -681,11 +680,9 @@ jdbc_to_iso_data_type = {
 def get_ddl_columns(subsystem_dir, jdbc, pk_dict, unique_dict):
     ddl_columns = {}
     schema = jdbc.db_schema
-    schema_file = os.path.join(subsystem_dir, 'header', 'metadata.xml')
-    tree = ET.parse(schema_file)
+    model = load_schema_model(os.path.join(subsystem_dir, 'header', 'metadata.xml'))
 
-    table_defs = tree.findall("table-def")
-    for table_def in table_defs:
+    for table_def in model.table_defs:
         table_schema = table_def.find('table-schema')
         if table_schema is not None:
             if table_schema.text is not None and len(schema) > 0:
@@ -3,6 +3,7 @@ import os
 import sys
 from pathlib import Path
 from common.xml_settings import XMLSettings
+from database.profiles import load_profile_overrides
 import xml.etree.ElementTree as ET
 from common.file import get_checksum
 
@@ -46,6 +47,7 @@ def main():
         shutil.copyfile(tmp_config_path, config_path)
 
     config = XMLSettings(config_path)
+    load_profile_overrides(config_path)
     memory = '-Xmx' + config.get('options/memory').split(' ')[0] + 'g'
     ddl = config.get('options/ddl')
     package = config.get('options/create_package')
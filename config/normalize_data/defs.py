@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import json
 import os
 import subprocess
 from pathlib import Path
@@ -20,14 +22,20 @@ import glob
 import fnmatch
 import tarfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from common.jvm import wb_batch
 import jpype as jp
 import xml.etree.ElementTree as ET
 from common.metadata import run_tika
 from common.database import run_select
-from database.jdbc import Jdbc
+from database.lob_export import export_lobs
+from database.pool import JDBC_POOL
 from common.convert import convert_folder, file_convert
 from common.xml import merge_xml_element
+from common.schema_model import load_schema_model
+
+LOB_LENGTH_DIR = 'lob_lengths'
+LOB_PROBE_WORKERS = 4
 
 
 def mount_wim(filepath, mount_dir):
@@ -52,33 +60,15 @@ def get_java_path_sep():
     return ';'
 
 
-def export_lob_columns(data_dir, batch, jdbc_url, table, table_columns, schema):
-    txt_file = os.path.join(data_dir, table + '_lobs.txt')
-    for column in table_columns[table + '_lobs']:
-        file_name = "'" + table.lower() + "_" + column.lower() + "_" + "'" + " || rownum() || '.data'"
-        # condition = f'''WHERE NULLIF("{column}", '') IS NOT NULL'''
-        source_query = 'SELECT "' + column + '",' + file_name + ' as fname FROM "' + schema + '"."' + table + '"'  # + condition
-        # TODO: Må legge inn oppdatering av felt i tsv-fil slik at referanse til filnavn ikke finnes for de feltene som ikke har fil på disk
-        # --> gjøre det ifm oppdatering av felt etter normalisering av filer?
-
-        export_data_list = ["WbExport ",
-                            "-type=text ",
-                            "-file = " + txt_file + " ",
-                            "-continueOnError=false ",
-                            "-encoding=UTF8 ",
-                            "-clobAsFile=true ",
-                            "-blobtype=file ",
-                            "-showProgress=10000 ",
-                            "-filenameColumn=fname ",
-                            ";" + source_query + ";"
-                            ]
-
-        batch.runScript("WbConnect -url='" + jdbc_url + "';")
-        result = batch.runScript(''.join(export_data_list))
-        batch.runScript("WbDisconnect;")
-        jp.java.lang.System.gc()
+def export_lob_columns(data_dir, jdbc, table, table_columns, schema):
+    # All lob columns of the table are streamed to files in one scan:
+    try:
+        export_lobs(jdbc, table, table_columns[table + '_lobs'], data_dir, schema=schema)
+    except Exception as e:
+        print(e)
+        return 'Error'
 
-    return str(result)
+    return 'Success'
 
 
 def export_text_columns(data_dir, batch, jdbc_url, table, table_columns, schema):
@@ -116,23 +106,115 @@ def export_text_columns(data_dir, batch, jdbc_url, table, table_columns, schema)
     return str(result)
 
 
-def get_tables(sub_systems_dir, sub_system, jdbc_url, driver_jar, schema):
+def probe_lob_lengths(jdbc_url, driver_jar, schema, table, columns):
+    # One scan of the table for all lob columns. The row count is stored with the lengths in the cache:
+    length_query = 'SELECT COUNT(*),' + ','.join(['MAX(LENGTH("' + column + '"))' for column in columns]) + ' FROM "' + schema + '"."' + table + '"'
+    with JDBC_POOL.connection(jdbc_url, '', '', '', schema, driver_jar, 'org.h2.Driver', True, True) as jdbc:
+        result = run_select(jdbc, length_query)
+    return int(result[0][0]), dict(zip(columns, [None if v is None else int(v) for v in result[0][1:]]))
+
+
+def lob_length_cache_path(tmp_dir, db_file):
+    # Max lengths from earlier runs are kept in the config tmp dir, not in the deliverable. One file per database
+    name = hashlib.sha1(os.path.abspath(db_file).encode('utf-8')).hexdigest()
+    return os.path.join(tmp_dir, LOB_LENGTH_DIR, name + '.json')
+
+
+def load_lob_length_cache(cache_path):
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_lob_length_cache(cache_path, cache):
+    try:
+        Path(os.path.dirname(cache_path)).mkdir(parents=True, exist_ok=True)
+        with open(cache_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError as e:
+        print('WARNING: could not write ' + cache_path + ': ' + str(e))
+
+
+def get_cached_lob_lengths(entry, row_count, columns):
+    # Max lengths from an earlier run. Only valid if the row count of the table is unchanged
+    if entry is None or entry.get('rows') != row_count:
+        return None
+
+    lengths = entry.get('lengths', {})
+    if not all(column in lengths for column in columns):
+        return None
+    return lengths
+
+
+def get_lob_lengths(table_defs, jdbc_url, driver_jar, schema, cache_path):
+    lob_lengths = {}
+    lob_columns = {}
+    for table_def in table_defs:
+        table_name = table_def.find('table-name').text
+        for column_def in table_def.findall('column-def'):
+            java_sql_type = int(column_def.find('java-sql-type').text)
+            dbms_data_size = int(column_def.find('dbms-data-size').text)
+
+            # -> Disse regnes som blob: 2004, -4, -3, -2
+            # Clob'er: -16, -1, 2005, 2011
+            if java_sql_type in (-4, -3, -2, 2004, 2005, 2011, -16, -1):
+                if (dbms_data_size > 4000 or java_sql_type in (2004, -4, -3, -2)):
+                    lob_columns.setdefault(table_name, []).append(column_def.find('column-name').text.upper())
+
+    if not lob_columns:
+        return lob_lengths
+
+    # Row counts of the tables as they are now (no table scan in H2):
+    row_counts = {}
+    with JDBC_POOL.connection(jdbc_url, '', '', '', schema, driver_jar, 'org.h2.Driver', True, True) as jdbc:
+        for table_name in lob_columns:
+            row_counts[table_name] = int(run_select(jdbc, 'SELECT COUNT(*) FROM "' + schema + '"."' + table_name + '"')[0][0])
+
+    cache = load_lob_length_cache(cache_path)
+    probe_tables = {}
+    for table_name, columns in lob_columns.items():
+        lengths = get_cached_lob_lengths(cache.get(schema + '.' + table_name), row_counts[table_name], columns)
+        if lengths is None:
+            probe_tables[table_name] = columns
+        else:
+            for column_name in columns:
+                lob_lengths[(table_name, column_name)] = lengths[column_name]
+
+    if not probe_tables:
+        return lob_lengths
+
+    with ThreadPoolExecutor(max_workers=LOB_PROBE_WORKERS) as executor:
+        futures = {}
+        for table_name, columns in probe_tables.items():
+            futures[executor.submit(probe_lob_lengths, jdbc_url, driver_jar, schema, table_name, columns)] = table_name
+
+        for future in as_completed(futures):
+            table_name = futures[future]
+            row_count, max_lengths = future.result()
+            for column_name in probe_tables[table_name]:
+                lob_lengths[(table_name, column_name)] = max_lengths[column_name]
+            cache[schema + '.' + table_name] = {'rows': row_count, 'lengths': max_lengths}
+
+    save_lob_length_cache(cache_path, cache)
+    return lob_lengths
+
+
+def get_tables(sub_systems_dir, sub_system, jdbc_url, driver_jar, schema, cache_path):
     tables = []
     table_columns = {}
-    schema_file = os.path.join(sub_systems_dir, sub_system, 'header', 'metadata.xml')
-    tree = ET.parse(schema_file)
+    model = load_schema_model(os.path.join(sub_systems_dir, sub_system, 'header', 'metadata.xml'))
 
-    jdbc = Jdbc(jdbc_url, '', '', '', schema, driver_jar, 'org.h2.Driver', True, True)
+    jdbc = JDBC_POOL.checkout(jdbc_url, '', '', '', schema, driver_jar, 'org.h2.Driver', True, True)
     table_query = f"""SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = '{schema}'"""
     tables_h2 = run_select(jdbc, table_query)
     tables_h2 = [x[0] for x in tables_h2]
+    JDBC_POOL.checkin(jdbc)
 
-    table_defs = tree.findall('table-def')
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        if table_schema.text != schema:
-            continue
-
+    export_table_defs = []
+    for table_def in model.table_defs_of(schema):
         disposed = table_def.find('disposed')
         if disposed is not None:
             if disposed.text == 'true':
@@ -142,6 +224,13 @@ def get_tables(sub_systems_dir, sub_system, jdbc_url, driver_jar, schema):
         if table_name.text not in tables_h2:
             continue
 
+        export_table_defs.append(table_def)
+
+    # Max length of lob columns. Probed in parallel (one query per table) and cached in the config tmp dir:
+    lob_lengths = get_lob_lengths(export_table_defs, jdbc_url, driver_jar, schema, cache_path)
+
+    for table_def in export_table_defs:
+        table_name = table_def.find('table-name')
         tables.append(table_name.text)
 
         text_columns = []
@@ -151,28 +240,19 @@ def get_tables(sub_systems_dir, sub_system, jdbc_url, driver_jar, schema):
 
         for column_def in column_defs:
             column_name = column_def.find('column-name')
-            java_sql_type = int(column_def.find('java-sql-type').text)
-            dbms_data_size = int(column_def.find('dbms-data-size').text)
             column_name_fixed = column_name.text.upper()
 
-            # -> Disse regnes som blob: 2004, -4, -3, -2
-            # Clob'er: -16, -1, 2005, 2011
+            if (table_name.text, column_name_fixed) in lob_lengths:
+                max_length = lob_lengths[(table_name.text, column_name_fixed)]
 
-            if java_sql_type in (-4, -3, -2, 2004, 2005, 2011, -16, -1):
-                if (dbms_data_size > 4000 or java_sql_type in (2004, -4, -3, -2)):
-                    length_query = f'''SELECT MAX(LENGTH("{column_name_fixed}")) FROM "{schema}"."{table_name.text}"'''
-                    jdbc = Jdbc(jdbc_url, '', '', '', schema, driver_jar, 'org.h2.Driver', True, True)
-                    result = run_select(jdbc, length_query)
-                    max_length = [x[0] for x in result][0]
-
-                    # TODO: Endre senere her slik at tomme felt ikke skrives til text_columns så fjernes i tsv
-                    # -> Må legge inn 'disposed' på kolonne da og ha sjekk mot det i annen kode så det blir riktg ved opplasting
-                    if max_length is not None:
-                        if max_length > 4000:
-                            file_columns.append(column_name_fixed)
-                            # TODO: Mulig å endre til normalisert filnavn direkte her?
-                            file_name_stem = "'" + str(table_name.text).lower() + "_" + str(column_name_fixed).lower() + "_" + "'"
-                            column_name_fixed = file_name_stem + ' || ROWNUM() AS "' + column_name_fixed + '"'
+                # TODO: Endre senere her slik at tomme felt ikke skrives til text_columns så fjernes i tsv
+                # -> Må legge inn 'disposed' på kolonne da og ha sjekk mot det i annen kode så det blir riktg ved opplasting
+                if max_length is not None:
+                    if max_length > 4000:
+                        file_columns.append(column_name_fixed)
+                        # TODO: Mulig å endre til normalisert filnavn direkte her?
+                        file_name_stem = "'" + str(table_name.text).lower() + "_" + str(column_name_fixed).lower() + "_" + "'"
+                        column_name_fixed = file_name_stem + ' || ROWNUM() AS "' + column_name_fixed + '"'
 
             text_columns.append(column_name_fixed)
 
@@ -186,15 +266,8 @@ def get_tables(sub_systems_dir, sub_system, jdbc_url, driver_jar, schema):
 
 
 def get_schemas(sub_systems_dir, sub_system):
-    schemas = []
-    schema_file = os.path.join(sub_systems_dir, sub_system, 'header', 'metadata.xml')
-    tree = ET.parse(schema_file)
-
-    table_defs = tree.findall('table-def')
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        if table_schema.text is not None and table_schema.text not in schemas:
-            schemas.append(table_schema.text)
+    model = load_schema_model(os.path.join(sub_systems_dir, sub_system, 'header', 'metadata.xml'))
+    schemas = [schema for schema in model.schemas if schema]
 
     if not schemas:
         schemas.append('PUBLIC')
@@ -202,25 +275,27 @@ def get_schemas(sub_systems_dir, sub_system):
     return schemas
 
 
-def export_db_schema(data_dir, sub_system, class_path, bin_dir, memory, sub_systems_dir, schema, db_file):
+def export_db_schema(data_dir, sub_system, class_path, bin_dir, memory, sub_systems_dir, schema, db_file, tmp_dir):
     jdbc_url = 'jdbc:h2:' + db_file[:-6] + ';LAZY_QUERY_EXECUTION=1;TRACE_LEVEL_FILE=0'
     driver_jar = os.path.join(bin_dir, 'vendor', 'jars', 'h2.jar')
     class_paths = class_path + get_java_path_sep() + driver_jar
     batch = wb_batch(class_paths, memory)
-    tables, table_columns = get_tables(sub_systems_dir, sub_system, jdbc_url, driver_jar, schema)
+    cache_path = lob_length_cache_path(tmp_dir, db_file)
+    tables, table_columns = get_tables(sub_systems_dir, sub_system, jdbc_url, driver_jar, schema, cache_path)
 
     Path(data_dir).mkdir(parents=True, exist_ok=True)
 
-    for table in tables:
-        if table in table_columns:
-            result = export_text_columns(data_dir, batch, jdbc_url, table, table_columns, schema)
-            if result == 'Error':
-                return result
+    with JDBC_POOL.connection(jdbc_url, '', '', '', schema, driver_jar, 'org.h2.Driver', True, True) as jdbc:
+        for table in tables:
+            if table in table_columns:
+                result = export_text_columns(data_dir, batch, jdbc_url, table, table_columns, schema)
+                if result == 'Error':
+                    return result
 
-        if table + '_lobs' in table_columns:
-            result = export_lob_columns(data_dir, batch, jdbc_url, table, table_columns, schema)
-            if result == 'Error':
-                return result
+            if table + '_lobs' in table_columns:
+                result = export_lob_columns(data_dir, jdbc, table, table_columns, schema)
+                if result == 'Error':
+                    return result
 
     return tables
 
@@ -304,7 +379,7 @@ def normalize_data(project_dir, bin_dir, class_path, memory, tmp_dir, convert):
                 Path(data_docs_dir).mkdir(parents=True, exist_ok=True)
                 print("Exporting schema: '" + schema + "' to disk...")
 
-                tables = export_db_schema(data_dir, sub_system, class_path, bin_dir, memory, sub_systems_dir, schema, db_file)
+                tables = export_db_schema(data_dir, sub_system, class_path, bin_dir, memory, sub_systems_dir, schema, db_file, tmp_dir)
                 if tables == 'Error':
                     print(tables)
                     return False
@@ -315,9 +390,6 @@ def normalize_data(project_dir, bin_dir, class_path, memory, tmp_dir, convert):
                     else:
                         shutil.move(data_file, data_docs_dir)
 
-                for text_file in glob.iglob(data_dir + os.path.sep + '*_lobs.txt'):
-                    os.remove(text_file)
-
                 if os.path.isdir(data_docs_dir):
                     if len(os.listdir(data_docs_dir)) == 0:
                         os.rmdir(data_docs_dir)
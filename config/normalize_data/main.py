@@ -4,6 +4,7 @@ from common.file import get_checksum
 from common.process_metadata_pre import normalize_metadata
 from common.process_metadata_check import load_data
 from common.xml_settings import XMLSettings
+from database.profiles import load_profile_overrides
 import xml.etree.ElementTree as ET
 import tarfile
 from defs import (  # .defs.py
@@ -23,6 +24,7 @@ def main():
 
     config_path = os.path.join(project_dir, 'pwcode.xml')
     config = XMLSettings(config_path)
+    load_profile_overrides(config_path)
     project_name = config.get('name')
     package = config.get('options/create_package')
     convert = config.get('options/convert_files')
@@ -17,7 +17,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Python Library Imports
-import xml.etree.ElementTree as ET
 import sys
 from loguru import logger
 # from argparse import ArgumentParser, SUPPRESS
@@ -36,6 +35,7 @@ paths = [PWCODE_DIR, LIB_DIR, TMP_DIR]
 pw_ddl = import_file(str(Path(LIB_DIR, 'ddl.py')))
 pw_log = import_file(str(Path(LIB_DIR, 'log.py')))
 pw_file = import_file(str(Path(LIB_DIR, 'file.py')))
+pw_model = import_file(str(Path(LIB_DIR, 'schema_model.py')))
 
 # Initialize:
 console = Console()
@@ -132,13 +132,8 @@ def main(argv):
             s = file.read()
             include_tables = [line.strip() for line in s.splitlines()]
 
-    tree = ET.parse(metadata_file)
-    table_defs = tree.findall("table-def")
-    schemas = set()
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        schema = table_schema.text
-        schemas.add(schema)
+    model = pw_model.load_schema_model(metadata_file)
+    schemas = model.schemas
 
     msg = ''
     log_file = pw_file.uniquify(Path(TMP_DIR, Path(__file__).stem + '.log'))
@@ -146,6 +141,7 @@ def main(argv):
 
 
     for schema in schemas:
+        table_defs = model.table_defs_of(schema or None)
         if not schema:
             file_name = 'constraints.sql'
         else:
@@ -23,7 +23,6 @@ from distutils.util import strtobool
 from loguru import logger
 import sys
 from pathlib import Path
-import xml.etree.ElementTree as ET
 from specific_import import import_file
 # from argparse import ArgumentParser, SUPPRESS
 import typer
@@ -39,6 +38,7 @@ paths = [PWCODE_DIR, LIB_DIR, TMP_DIR]
 pw_ddl = import_file(str(Path(LIB_DIR, 'ddl.py')))
 pw_log = import_file(str(Path(LIB_DIR, 'log.py')))
 pw_file = import_file(str(Path(LIB_DIR, 'file.py')))
+pw_model = import_file(str(Path(LIB_DIR, 'schema_model.py')))
 
 # Initialize:
 console = Console()
@@ -169,19 +169,15 @@ def main(argv):
         with open(args.table_list) as file:
             include_tables = file.read().splitlines()
 
-    tree = ET.parse(metadata_file)
-    table_defs = tree.findall("table-def")
-    schemas = set()
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        schema = table_schema.text
-        schemas.add(schema)
+    model = pw_model.load_schema_model(metadata_file)
+    schemas = model.schemas
 
     msg = ''
     log_file = pw_file.uniquify(Path(TMP_DIR, Path(__file__).stem + '.log'))
     pw_log.configure_logging(log_file)
 
     for schema in schemas:
+        table_defs = model.table_defs_of(schema or None)
         if not schema:
             file_name = 'ddl.sql'
         else:
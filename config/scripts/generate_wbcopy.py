@@ -22,7 +22,6 @@ import sys
 # from argparse import ArgumentParser, SUPPRESS
 import typer
 from pathlib import Path
-import xml.etree.ElementTree as ET
 from loguru import logger
 from specific_import import import_file
 from rich.console import Console
@@ -36,6 +35,7 @@ paths = [PWCODE_DIR, LIB_DIR, TMP_DIR]
 # Local Library Imports
 pw_log = import_file(str(Path(LIB_DIR, 'log.py')))
 pw_file = import_file(str(Path(LIB_DIR, 'file.py')))
+pw_model = import_file(str(Path(LIB_DIR, 'schema_model.py')))
 pw_ddl = import_file(str(Path(LIB_DIR, 'ddl.py')))
 
 # Initialize:
@@ -111,19 +111,15 @@ def main(argv):
         with open(args.table_list) as file:
             include_tables = file.read().splitlines()
 
-    tree = ET.parse(metadata_file)
-    table_defs = tree.findall("table-def")
-    schemas = set()
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        schema = table_schema.text
-        schemas.add(schema)
+    model = pw_model.load_schema_model(metadata_file)
+    schemas = model.schemas
 
     msg = ''
     log_file = pw_file.uniquify(Path(TMP_DIR, Path(__file__).stem + '.log'))
     pw_log.configure_logging(log_file)
 
     for schema in schemas:
+        table_defs = model.table_defs_of(schema or None)
         if not schema:
             file_name = 'wbcopy.sql'
         else:
@@ -21,6 +21,7 @@ import sys
 # from argparse import ArgumentParser, SUPPRESS
 import typer
 from pathlib import Path
+from types import SimpleNamespace
 from loguru import logger
 from rich.console import Console
 from specific_import import import_file
@@ -36,12 +37,13 @@ paths = [PWCODE_DIR, LIB_DIR, JARS_DIR, TMP_DIR]
 # Local Library Imports:
 pw_log = import_file(str(Path(LIB_DIR, 'log.py')))
 pw_file = import_file(str(Path(LIB_DIR, 'file.py')))
+pw_rows = import_file(str(Path(PWCODE_DIR, 'bin', 'database', 'row_count.py')))
 
 # Initialize:
 console = Console()
 
 
-def get_tables(conn, schema, driver_class):
+def get_tables(conn, schema, driver_class, jdbc_url='', connect=None):
     results = conn.jconn.getMetaData().getTables(None, schema, "%", None)
     table_reader_cursor = conn.cursor()
     table_reader_cursor._rs = results
@@ -49,15 +51,16 @@ def get_tables(conn, schema, driver_class):
     read_results = table_reader_cursor.fetchall()
     tables = [row[2] for row in read_results if row[3] == 'TABLE']
 
-    for index, table in enumerate(tables):
-        table_name = table
-        if driver_class != 'interbase.interclient.Driver':
-            table_name = '"' + table + '"'
+    # Catalog estimates where available, exact counts (in parallel with connect) otherwise:
+    table_ref = pw_rows.quote_table
+    if driver_class == 'interbase.interclient.Driver':
+        table_ref = str
+    counter = pw_rows.RowCounter(SimpleNamespace(connection=conn), connect=connect,
+                                 db_type=pw_rows.db_type_of_url(jdbc_url), schema=schema, table_ref=table_ref)
+    row_counts = counter.counts(tables)
 
-        get_count = 'SELECT COUNT(*) from ' + table_name
-        table_reader_cursor.execute(get_count)
-        (row_count,) = table_reader_cursor.fetchone()
-        tables[index] = table + ':' + str(row_count)
+    for index, table in enumerate(tables):
+        tables[index] = table + ':' + str(row_counts[table])
 
     return tables
 
@@ -109,8 +112,12 @@ def main(argv):
         file.write(header)
 
     tables = ''
+    def connect():
+        return SimpleNamespace(connection=jaydebeapi.connect(driver_class, args.jdbc_url, [args.user, args.password],
+                                                             driver_jar,))
+
     with jaydebeapi.connect(driver_class, args.jdbc_url, [args.user, args.password], driver_jar,) as conn:
-        tables = get_tables(conn, args.schema, driver_class)
+        tables = get_tables(conn, args.schema, driver_class, args.jdbc_url, connect)
 
     for table in tables:
         with open(table_file, "a") as file:
@@ -24,7 +24,6 @@ from pathlib import Path
 from sqlite_utils import Database
 from importlib.metadata import version
 from platform import python_version
-import xml.etree.ElementTree as ET
 from specific_import import import_file
 from rich.console import Console
 
@@ -37,6 +36,7 @@ paths = [PWCODE_DIR, LIB_DIR, TMP_DIR]
 # Local Library Imports
 pw_log = import_file(str(Path(LIB_DIR, 'log.py')))
 pw_file = import_file(str(Path(LIB_DIR, 'file.py')))
+pw_model = import_file(str(Path(LIB_DIR, 'schema_model.py')))
 
 # Initialize:
 console = Console()
@@ -237,16 +237,11 @@ def main(argv):
             s = file.read()
             include_tables = [line.strip() for line in s.splitlines()]
 
-    tree = ET.parse(metadata_file)
-    table_defs = tree.findall("table-def")
+    model = pw_model.load_schema_model(metadata_file)
+    schema = args.schema
+    table_defs = model.table_defs_of(schema or None)
 
-    schemas = set()
-    for table_def in table_defs:
-        table_schema = table_def.find('table-schema')
-        schema = table_schema.text
-        schemas.add(xstr(schema))
-
-    if args.schema not in schemas:
+    if args.schema not in model.schemas:
         return "Schema '" + args.schema + "' does not exist in metadata file. Exiting..."
 
     db = Database(db_file)
@@ -28,6 +28,7 @@ from .cmdline import \
     DRIVER_SINGLE, DRIVER_MULTI, UPLOADERS, \
     COPY_EMPTY, COPY_AND_UPDATE, COPY_AND_SYNC, parser
 
+from database.programs.db_copy.planner import copy_order, print_broken_cycles
 from lwetl.version import __version__
 from lwetl.queries import content_queries
 from lwetl.runtime_statistics import timedelta_to_string, tag_connection, get_execution_statistics
@@ -43,31 +44,6 @@ CNT_COPIED_TABLES = 'copied tables'
 CNT_FAIL = 'fails'
 
 
-def referring_tables(table_list: list, table_dict: dict, excluded=None):
-    """
-    Scan for tables, which are both in the input list and referenced by
-    other tables in the table_list (FK reference)
-    Exclude tables in the exluded list
-
-    @param table_list: list of tables to scan
-    @param table_dict: dict with FK reference info of all tables
-    @param excluded: list of excluded tables
-    @return: list of tables, which are referenced
-    """
-    if excluded is None:
-        excluded = []
-    assert isinstance(table_list, list)
-    assert isinstance(excluded, list)
-    assert isinstance(table_dict, dict)
-
-    fk_tables = []
-    for table in table_list:
-        for column_info in table_dict[table].values():
-            if (column_info[0] not in fk_tables) and (table != column_info[0]) and (column_info[0] not in excluded):
-                fk_tables.append(column_info[0])
-    return sorted(fk_tables)
-
-
 def print_list(label, table_list, tc=None):
     """
     Nice printout to stdout of the input table list
@@ -224,19 +200,9 @@ def main():
     nosource_tables = sorted([k for k in table_info[TRG].keys() if k not in table_info[SRC]])
     print_list('Missing source:', nosource_tables)
 
-    common_tables = table_admin[COMMON]
-    if len(common_tables) < 2:
-        copy_list = common_tables
-    else:
-        # re-order the list of tables, to avoid FK violations
-        copy_list = []
-        while len(copy_list) < len(common_tables):
-            not_added = [t for t in common_tables if t not in copy_list]
-            refered_tables = referring_tables(not_added, table_info[TRG], copy_list)
-            while len(refered_tables) > 0:
-                not_added = [t for t in refered_tables]
-                refered_tables = referring_tables(not_added, table_info[TRG], copy_list)
-            copy_list += not_added
+    # re-order the list of tables, to avoid FK violations
+    copy_list, broken_cycles = copy_order(table_admin[COMMON], table_info[TRG])
+    print_broken_cycles(broken_cycles)
 
     if n_excluded > 0:
         print_list('Skipped tables', copy_list[:n_excluded], table_count)
@@ -1,6 +1,7 @@
 import os, sys
 from pathlib import Path
 from database.jdbc import Jdbc
+from database.lob_export import export_lobs
 
 bin_dir = os.environ["pwcode_bin_dir"]
 data_dir = os.environ["pwcode_data_dir"] + '/test_lob_extract'
@@ -21,24 +22,15 @@ user = ''
 pwd = ''
 
 
-jdbc = Jdbc(url, user, pwd, driver_jar, driver_class, True, True)
+jdbc = Jdbc(url, user, pwd, '', '', driver_jar, driver_class, True, True)
 
 if jdbc:
-    column_position = 3
     table_name = 'EDOKFILES'
-    sql_str = 'SELECT EDKID, EFILE FROM ' + table_name
-    cnt1 = 0
-    cnt2 = 0
-    for edkid, efile in jdbc.query(sql_str):
-        cnt1 += 1
-        fname = table_name + '_' + str(column_position) + '_' + str(cnt1)
-        print('%6d. Parsing %s' % (cnt1, fname))
-        with open(data_dir + '/' + fname, 'wb') as f:
-            f.write(efile)
-        cnt2 += 1
-        #sys.exit()
-
-    print('Done: extracted %d files (%d skipped).' % (cnt1, (cnt1 - cnt2)))
+    file_count = export_lobs(jdbc, table_name, ['EFILE'], data_dir, manifest_path=data_dir + '/' + table_name + '_lobs.txt')
+    cnt1 = jdbc.statistics.row_count
+    cnt2 = file_count['EFILE']
+
+    print('Done: extracted %d files (%d skipped).' % (cnt2, (cnt1 - cnt2)))
 
 
 
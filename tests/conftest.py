@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the packages of bin/ (database, common) are imported as in the programs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
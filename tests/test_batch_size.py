@@ -0,0 +1,62 @@
+from database.batch_size import BatchSizer, estimate_row_bytes, get_batch_size_statistics
+from common.tsv2sqlite import next_chunk_size
+
+
+class Statistics:
+    query_time = 0.0
+
+
+def test_grows_towards_target_time():
+    sizer = BatchSizer('grow', initial=100, target_seconds=2.0)
+    # 100 rows in 0.1 s: 2000 rows would take 2 s, but one step is at most a factor 2
+    assert sizer.update(100, 0.1) == 200
+    assert sizer.update(200, 0.2) == 400
+
+
+def test_shrinks_towards_target_time():
+    sizer = BatchSizer('shrink', initial=1000, target_seconds=2.0)
+    assert sizer.update(1000, 3.0) == 666
+    assert sizer.update(666, 100.0) == 333
+
+
+def test_short_batch_does_not_grow():
+    sizer = BatchSizer('short', initial=1000, target_seconds=2.0)
+    assert sizer.update(10, 0.001) == 1000
+
+
+def test_fixed_size():
+    sizer = BatchSizer('fixed', initial=1000, target_seconds=0)
+    assert sizer.update(1000, 100.0) == 1000
+
+
+def test_memory_ceiling():
+    sizer = BatchSizer('memory', initial=50000, max_bytes=1000 * 1000)
+    sizer.set_row_bytes(1000)
+    assert sizer.size == 1000
+    assert sizer.update(1000, 0.001) == 1000
+    assert estimate_row_bytes({'a': 'x' * 100, 'b': 1}) == 108
+
+
+def test_timed_on_statistics():
+    statistics = Statistics()
+    sizer = BatchSizer('statistics', initial=100, target_seconds=2.0)
+    sizer.start(statistics)
+    statistics.query_time += 4.0
+    assert sizer.stop(100, statistics) == 50
+
+
+def test_run_of_batches():
+    sizer = BatchSizer('run', initial=1000, target_seconds=2.0)
+    # 10 batches of 1000 rows in 40 s: 4 s per batch
+    assert sizer.update_run(10000, 40.0, 1000) == 500
+    assert sizer.batches == 10 and sizer.rows == 10000
+    # fewer rows than one batch: no change
+    assert sizer.update_run(10, 1.0, 500) == 500
+    assert 'run:' in get_batch_size_statistics()
+
+
+def test_tsv2sqlite_chunk_size():
+    assert next_chunk_size(10000, 10000, 5.0, 0, 100000) == 10000
+    assert next_chunk_size(10000, 10000, 0.5, 2.0, 100000) == 20000
+    assert next_chunk_size(10000, 10000, 8.0, 2.0, 100000) == 5000
+    assert next_chunk_size(10000, 10000, 0.1, 2.0, 15000) == 15000
@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+
+from database.pk_allocator import PkAllocator
+
+
+class FixedMaxJdbc:
+    """
+    Connection, on which the maximum key does not move: the rows with the keys are not committed yet
+    """
+    login = 'test'
+
+    def __init__(self, maximum=0):
+        self.maximum = maximum
+        self.queries = 0
+
+    def get_int(self, sql):
+        self.queries += 1
+        return self.maximum
+
+
+def test_blocks_continue_after_uncommitted_keys():
+    allocator = PkAllocator(block_size=3)
+    jdbc = FixedMaxJdbc(0)
+    keys = [allocator.next_value(jdbc, 'T', 'ID') for _ in range(7)]
+    assert keys == [1, 2, 3, 4, 5, 6, 7]
+    assert jdbc.queries == 3
+
+
+def test_blocks_start_above_database_maximum():
+    allocator = PkAllocator(block_size=3)
+    jdbc = FixedMaxJdbc(41)
+    assert [allocator.next_value(jdbc, 'T', 'ID') for _ in range(2)] == [42, 43]
+    jdbc.maximum = 100
+    assert [allocator.next_value(jdbc, 'T', 'ID') for _ in range(3)] == [44, 101, 102]
+
+
+def test_increment():
+    allocator = PkAllocator(block_size=10)
+    jdbc = FixedMaxJdbc(5)
+    assert allocator.next_value(jdbc, 'T', 'ID', 0) == 5
+    assert allocator.next_value(jdbc, 'T', 'ID') == 6
+    assert allocator.next_value(jdbc, 'T', 'ID', 3) == 9
+    assert allocator.next_value(jdbc, 'T', 'ID', 0) == 9
+    # larger than the rest of the block: a new block of consecutive keys
+    assert allocator.next_value(jdbc, 'T', 'ID', 20) == 35
+
+
+def test_unique_over_threads():
+    allocator = PkAllocator(block_size=7)
+    jdbc = FixedMaxJdbc(0)
+    keys = []
+    lock = threading.Lock()
+
+    def take():
+        taken = [allocator.next_value(jdbc, 'T', 'ID') for _ in range(500)]
+        with lock:
+            keys.extend(taken)
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(keys) == 4000
+    assert len(set(keys)) == 4000
+
+
+def take_in_process(lock_dir, n, queue):
+    allocator = PkAllocator(block_size=5, lock_dir=lock_dir)
+    jdbc = FixedMaxJdbc(0)
+    queue.put([allocator.next_value(jdbc, 'T', 'ID') for _ in range(n)])
+
+
+def test_unique_over_processes(tmp_path):
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=take_in_process, args=(str(tmp_path), 200, queue))
+                 for _ in range(4)]
+    for p in processes:
+        p.start()
+    keys = [k for _ in processes for k in queue.get(timeout=60)]
+    for p in processes:
+        p.join()
+    assert len(keys) == 800
+    assert len(set(keys)) == 800
+
+
+def test_tables_are_counted_separately():
+    allocator = PkAllocator(block_size=3)
+    jdbc = FixedMaxJdbc(0)
+    assert allocator.next_value(jdbc, 'A', 'ID') == 1
+    assert allocator.next_value(jdbc, 'B', 'ID') == 1
+    assert allocator.next_value(jdbc, 'A', 'ID') == 2
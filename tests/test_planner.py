@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip('toposort')
+
+from database.programs.db_copy.planner import copy_order, table_dependencies
+
+
+def fk(*tables):
+    # FK reference info as in the schema of db_copy: {column: (fk_table, constraint)}
+    return dict([('C%d' % x, (table, 'FK%d' % x)) for x, table in enumerate(tables)])
+
+
+def test_dependencies_within_list():
+    table_dict = {'A': fk('B', 'X', 'A'), 'B': fk()}
+    assert table_dependencies(['A', 'B'], table_dict) == {'A': {'B'}, 'B': set()}
+
+
+def test_referenced_tables_first():
+    table_dict = {'ORDERS': fk('CUSTOMER', 'PRODUCT'), 'ORDER_LINE': fk('ORDERS', 'PRODUCT'),
+                  'CUSTOMER': fk(), 'PRODUCT': fk()}
+    ordered, broken = copy_order(['ORDER_LINE', 'ORDERS', 'PRODUCT', 'CUSTOMER'], table_dict)
+    assert ordered == ['CUSTOMER', 'PRODUCT', 'ORDERS', 'ORDER_LINE']
+    assert broken == []
+
+
+def test_cycle_is_broken_once():
+    table_dict = {'A': fk('B'), 'B': fk('C'), 'C': fk('A'), 'D': fk('A'), 'E': fk()}
+    ordered, broken = copy_order(['A', 'B', 'C', 'D', 'E'], table_dict)
+    assert sorted(ordered) == ['A', 'B', 'C', 'D', 'E']
+    assert len(broken) == 1
+    table, referenced, cycle = broken[0]
+    assert sorted(cycle) == ['A', 'B', 'C']
+    # all other references are respected
+    position = dict([(t, x) for x, t in enumerate(ordered)])
+    for t, deps in table_dependencies(ordered, table_dict).items():
+        for d in deps:
+            if (t, d) != (table, referenced):
+                assert position[d] < position[t]
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from database.prefetch import chunked, prefetch_rows, prefetched
+
+
+def test_order_is_kept():
+    assert list(prefetched(range(1000), 2)) == list(range(1000))
+    assert list(prefetch_rows(iter(range(2500)), 2, 100)) == list(range(2500))
+
+
+def test_without_thread():
+    thread = []
+
+    def rows():
+        thread.append(threading.current_thread())
+        yield from range(10)
+
+    assert list(prefetch_rows(rows(), 0)) == list(range(10))
+    assert thread == [threading.current_thread()]
+
+
+def test_chunks():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+
+
+def test_error_is_raised_in_consumer():
+    def rows():
+        yield 1
+        yield 2
+        raise ValueError('fetch failed')
+
+    received = []
+    with pytest.raises(ValueError, match='fetch failed'):
+        for row in prefetched(rows(), 2):
+            received.append(row)
+    assert received == [1, 2]
+
+
+def test_early_stop_closes_source():
+    closed = threading.Event()
+
+    def rows():
+        try:
+            n = 0
+            while True:
+                n += 1
+                yield n
+        finally:
+            closed.set()
+
+    items = prefetched(rows(), 2)
+    assert [next(items) for _ in range(3)] == [1, 2, 3]
+    items.close()
+    assert closed.wait(5)
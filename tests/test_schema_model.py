@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from common import schema_model
+from common.schema_model import load_schema_model, sidecar_path
+
+METADATA = '''<?xml version="1.0" encoding="UTF-8"?>
+<schema>
+  <table-def>
+    <table-name>ORDERS</table-name>
+    <table-schema>SALES</table-schema>
+    <column-def><column-name>ID</column-name><primary-key>true</primary-key></column-def>
+    <column-def><column-name>CUSTOMER_ID</column-name><primary-key>false</primary-key></column-def>
+    <foreign-keys><foreign-key><constraint-name>FK1</constraint-name></foreign-key></foreign-keys>
+  </table-def>
+  <table-def>
+    <table-name>CUSTOMER</table-name>
+    <table-schema>SALES</table-schema>
+    <column-def><column-name>ID</column-name><primary-key>true</primary-key></column-def>
+  </table-def>
+</schema>
+'''
+
+
+@pytest.fixture
+def metadata(tmp_path, monkeypatch):
+    monkeypatch.setattr(schema_model, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(schema_model, 'MODELS', dict())
+    header = tmp_path / 'package' / 'header'
+    header.mkdir(parents=True)
+    path = header / 'metadata.xml'
+    path.write_text(METADATA, encoding='utf-8')
+    return str(path)
+
+
+def test_indexes(metadata):
+    model = load_schema_model(metadata)
+    assert model.schemas == ['SALES']
+    assert [t.findtext('table-name') for t in model.table_defs_of('SALES')] == ['ORDERS', 'CUSTOMER']
+    assert list(model.column_defs('ORDERS').keys()) == ['ID', 'CUSTOMER_ID']
+    assert model.primary_key('ORDERS', 'SALES') == ['ID']
+    assert len(model.foreign_key_defs('ORDERS')) == 1
+    assert model.table_def('MISSING') is None
+    assert model.column_defs('MISSING') == {}
+
+
+def test_cache_outside_package(metadata, tmp_path):
+    load_schema_model(metadata)
+    sidecar = sidecar_path(metadata)
+    assert os.path.isfile(sidecar)
+    assert os.path.dirname(sidecar) == str(tmp_path / 'cache')
+    assert os.listdir(os.path.dirname(metadata)) == ['metadata.xml']
+
+
+def test_package_sidecar_is_removed_and_not_loaded(metadata):
+    with open(metadata + schema_model.SIDECAR_SUFFIX, 'wb') as f:
+        f.write(b'not a pickle')
+    model = load_schema_model(metadata)
+    assert model.primary_key('CUSTOMER') == ['ID']
+    assert not os.path.exists(metadata + schema_model.SIDECAR_SUFFIX)
+
+
+def test_reload_from_cache_and_after_change(metadata):
+    first = load_schema_model(metadata)
+    assert load_schema_model(metadata) is first
+
+    schema_model.MODELS.clear()
+    cached = load_schema_model(metadata)
+    assert cached is not first
+    assert list(cached.column_defs('ORDERS').keys()) == ['ID', 'CUSTOMER_ID']
+
+    time.sleep(0.01)
+    with open(metadata, 'w', encoding='utf-8') as f:
+        f.write(METADATA.replace('CUSTOMER_ID', 'CLIENT_ID'))
+    changed = load_schema_model(metadata)
+    assert list(changed.column_defs('ORDERS').keys()) == ['ID', 'CLIENT_ID']
+
+
+def test_save(metadata):
+    model = load_schema_model(metadata)
+    model.table_def('CUSTOMER').find('table-name').text = 'CLIENT'
+    model.save()
+    schema_model.MODELS.clear()
+    assert load_schema_model(metadata).table_def('CLIENT', 'SALES') is not None
@@ -0,0 +1,41 @@
+from collections import Counter
+
+from database.programs.table_cardinality.sketches import ColumnSummary, HyperLogLog, MisraGries
+
+
+def test_distinct_estimate_small():
+    hll = HyperLogLog()
+    for n in range(1000):
+        hll.add(n % 100)
+    assert hll.estimate() == 100
+
+
+def test_distinct_estimate_large():
+    hll = HyperLogLog()
+    for n in range(200000):
+        hll.add('value %d' % n)
+    # standard error 0.8 %
+    assert abs(hll.estimate() - 200000) < 200000 * 0.04
+
+
+def test_heavy_hitters_are_kept():
+    values = [n % 500 for n in range(5000)] + ['a'] * 2000 + ['b'] * 1000
+    mg = MisraGries(k=10)
+    for value in values:
+        mg.add(value)
+    top = mg.top()
+    # values occurring more than n/k times are always found, with lower bound counts
+    assert [value for value, cnt in top[:2]] == ['a', 'b']
+    counts = Counter(values)
+    for value, cnt in top:
+        assert counts[value] - len(values) / 10 <= cnt <= counts[value]
+    assert len(mg.top(1)) == 1
+
+
+def test_column_summary_skips_null():
+    summary = ColumnSummary(k=10)
+    for value in [None, 1, 1, 2, None, 3]:
+        summary.add(value)
+    assert summary.total == 4
+    assert summary.distinct.estimate() == 3
+    assert summary.heavy_hitters.top(1) == [(1, 2)]
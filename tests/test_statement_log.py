@@ -0,0 +1,68 @@
+import gc
+import io
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from database.statement_log import StatementBuffer, StatementLogWriter, read_statement_log
+
+
+def round_trip(statements):
+    stream = io.BytesIO()
+    writer = StatementLogWriter(stream)
+    for sql, parameters in statements:
+        writer.write(sql, parameters)
+    writer.flush()
+    stream.seek(0)
+    return list(read_statement_log(stream))
+
+
+def test_values_round_trip():
+    row = [None, True, 42, 2 ** 70, 1.5, Decimal('12345678901234567890.000000000123'), 'æøå', b'\x00\x01',
+           datetime(2020, 1, 2, 3, 4, 5, 6000), date(2020, 1, 2)]
+    assert round_trip([('INSERT INTO T VALUES (?)', row)]) == [('INSERT INTO T VALUES (?)', row)]
+
+
+def test_batches_and_statements_without_parameters():
+    statements = [('DELETE FROM T', None),
+                  ('INSERT INTO T (A) VALUES (?)', [[1], [2], [3]]),
+                  ('DELETE FROM T', None)]
+    assert round_trip(statements) == statements
+
+
+def test_buffer_in_memory():
+    buffer = StatementBuffer(max_size=10)
+    for n in range(5):
+        buffer.append(('SQL %d' % n, [n]))
+    assert buffer.path is None
+    assert len(buffer) == 5
+    assert list(buffer) == [('SQL %d' % n, [n]) for n in range(5)]
+
+
+def test_buffer_spills_to_file(tmp_path):
+    buffer = StatementBuffer(max_size=2, tmp_dir=str(tmp_path))
+    for n in range(5):
+        buffer.append(('SQL %d' % n, [n]))
+    assert buffer.path is not None and os.path.isfile(buffer.path)
+    assert len(buffer) == 5
+    assert list(buffer) == [('SQL %d' % n, [n]) for n in range(5)]
+    path = buffer.path
+    buffer.clear()
+    assert not os.path.exists(path)
+    assert len(buffer) == 0
+
+
+def spilled_sqls(tmp_dir):
+    # as NativeUploader.commit() in pipe mode: the buffer itself is not returned
+    buffer = StatementBuffer(max_size=2, tmp_dir=tmp_dir)
+    for n in range(5):
+        buffer.append(('SQL %d' % n, None))
+    return (el[0] for el in buffer)
+
+
+def test_iteration_keeps_spilled_buffer(tmp_path):
+    sqls = spilled_sqls(str(tmp_path))
+    gc.collect()
+    assert list(sqls) == ['SQL %d' % n for n in range(5)]
+    gc.collect()
+    assert os.listdir(str(tmp_path)) == []
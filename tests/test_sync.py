@@ -0,0 +1,63 @@
+import sqlite3
+
+from database import sync
+from database.sync import merge_ranges
+
+
+class SqliteJdbc:
+    auto_commit = False
+
+    def __init__(self, rows, key_columns='id'):
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.execute('CREATE TABLE "a" (%s, v TEXT, PRIMARY KEY (%s))'
+                                % (','.join([k + ' INTEGER' for k in key_columns.split(',')]), key_columns))
+        if len(rows) > 0:
+            self.connection.executemany('INSERT INTO "a" VALUES (%s)' % ','.join(['?'] * len(rows[0])), rows)
+
+    def rows(self):
+        return sorted(self.connection.execute('SELECT * FROM "a"').fetchall())
+
+
+def test_merge_adjacent_ranges():
+    assert merge_ranges([(10, 20), (0, 5), (5, 10), (30, 40)]) == [(0, 20), (30, 40)]
+    assert merge_ranges([]) == []
+
+
+def test_merge_closest_ranges(monkeypatch):
+    monkeypatch.setattr(sync, 'SYNC_MAX_RANGES', 2)
+    assert merge_ranges([(0, 1), (10, 11), (12, 13), (50, 51)]) == [(0, 13), (50, 51)]
+
+
+def test_integer_key_ranges():
+    source = SqliteJdbc([(i, 'x') for i in range(1, 50001)])
+    target = SqliteJdbc([(i, 'x') for i in range(1, 30001) if i != 777] + [(-5, 'target only'), (40001, 'old')])
+    query = sync.sync_table(source, target, 'SELECT "id","v" FROM "a"', '"a"', '"a"', ['id'])
+    rows = source.connection.execute(query).fetchall()
+    assert (777, 'x') in rows
+    assert len(rows) < 25000
+    # as WbCopy -mode=insert,update
+    target.connection.executemany('INSERT OR REPLACE INTO "a" VALUES (?,?)', rows)
+    assert target.rows() == sorted([(-5, 'target only')] + source.rows())
+
+
+def test_equal_count_and_sum_in_a_bucket():
+    # bucket [1, 17): count 2 and sum 3 in both tables, but other keys
+    source = SqliteJdbc([(1, 'x'), (4, 'x'), (1000, 'x')])
+    target = SqliteJdbc([(2, 'x'), (3, 'x'), (1000, 'x')])
+    ranges = sync.diff_key_ranges(source, target, '"a"', '"a"', 'id')
+    assert len(ranges) == 1
+    lo, hi = ranges[0]
+    assert lo <= 1 and hi > 4 and hi <= 1000
+
+
+def test_equal_tables():
+    rows = [(i, 'x') for i in range(1, 1000)]
+    assert sync.sync_table(SqliteJdbc(rows), SqliteJdbc(rows), 'SELECT * FROM "a"', '"a"', '"a"', ['id']) is None
+
+
+def test_composite_key_copies_missing_rows():
+    source = SqliteJdbc([(i, j, 'x') for i in range(30) for j in range(30)], 'id,id2')
+    target = SqliteJdbc([(i, j, 'x') for i in range(30) for j in range(30) if (i + j) % 7 != 0] + [(99, 99, 'y')],
+                        'id,id2')
+    assert sync.sync_table(source, target, 'SELECT "id","id2","v" FROM "a"', '"a"', '"a"', ['id', 'id2']) is None
+    assert target.rows() == sorted(source.rows() + [(99, 99, 'y')])